@@ -1,161 +1,273 @@
-import hashlib
 import time
 import random
-from appium import webdriver
-from appium.webdriver.common.appiumby import AppiumBy
-from selenium.webdriver import ActionChains
-from selenium.webdriver.common.actions import interaction
-from selenium.webdriver.common.actions.action_builder import ActionBuilder
-from selenium.webdriver.common.actions.pointer_input import PointerInput
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.common.by import By
-from logger import Logger
-import os
-from config import Config
-from datetime import datetime  # 确保正确导入
-from concurrent.futures import ThreadPoolExecutor  # 导入 ThreadPoolExecutor
+from logger import Logger, configure as configure_logging
+from config import configs
+from session_pool import SessionPool, build_capabilities, server_url
+from ui_wait import UIWaiter
+from screen_profile import ScreenProfileCache, DEFAULT_PROFILE
+from locator import LocatorService, HOME_TAB, SEARCH_INPUT
+from screenshots import ScreenshotPipeline
+import gestures
+from steps import run_steps, CancelToken, Cancelled
+from orchestrator import Orchestrator, FlowJob
+from servers import ServerRegistry, LocalAppiumLauncher
+from metrics import Metrics, MetricsServer, SnapshotWriter, instrument_driver
+from devices import DeviceInfo, DeviceWatcher, adb_devices
+from resilience import BreakerRegistry, RetryPolicy, SESSION
+from flow_engine import FlowLibrary, assign_flow, flows_in_use
+import asyncio
 import signal
+import os
 import sys
-import subprocess
+import threading
 
 logger = Logger("Automator")
+session_pool = SessionPool()  # 跨流程复用的会话池
+screen_profiles = ScreenProfileCache()  # 按 udid 缓存的屏幕信息
+screenshots = ScreenshotPipeline()  # 后台截图管线
+metrics = Metrics()  # 按设备、按步骤的耗时直方图
+shutdown_token = CancelToken()  # 收到退出信号时取消，所有流程循环和等待都会检查
+traces = None  # 录制(replay.Recorder)或回放(replay.Replayer)模式，由入口根据配置 record/replay 设置
+placement = None  # 设备到 Appium 服务的分配(servers.ServerRegistry)，由入口设置；设备在步骤边界和重建会话时跟随分配迁移
+
+
+def record_resilience_event(udid, event, value):
+    """熔断器事件计入指标：各类错误的次数和从失败到恢复的耗时"""
+    if event == "error":
+        metrics.error(udid, "error:" + value)
+    else:
+        metrics.observe(udid, "recovery", value)
+
+
+breakers = BreakerRegistry(listener=record_resilience_event)  # 按设备的熔断器，跨流程保留失败计数和暂停状态
+
+# 流程定义(flows/*.json)中可用的动作 -> Automator 上的方法
+FLOW_ACTIONS = {
+    "prepare": "iter_prepare",
+    "navigate": "iter_popups_and_navigate",
+    "search": "iter_search_keyword",
+    "swipe_down_quickly": "swipe_down_quickly",
+    "swipe_down_slowly": "swipe_down_slowly",
+    "swipe_up": "swipe_up",
+    "screenshot": "screenshot",
+}
+flow_library = FlowLibrary(FLOW_ACTIONS)  # 流程定义编译一次，所有设备共用
 
 def signal_handler(sig, frame):
-    """处理信号，确保日志写入磁盘"""
-    logger.error("signal_handler execute")
-    logger.stop()  # 停止日志记录
-    sys.exit(0)
-
-# 注册信号处理器
-signal.signal(signal.SIGINT, signal_handler)  # 捕获 Ctrl+C
-signal.signal(signal.SIGTERM, signal_handler)  # 捕获终止信号
+    """收到 SIGINT/SIGTERM 时通知所有流程停止，由主流程在期限内关闭会话；再次收到时写完日志后立即退出"""
+    if shutdown_token.cancelled:
+        logger.error("Received signal %s again, exiting immediately", sig)
+        logger.stop(from_signal=True)  # 不在信号处理函数中获取日志的锁，最多等待 5 秒
+        os._exit(1)
+    logger.warning("Received signal %s, stopping all flows", sig)
+    shutdown_token.cancel("signal {}".format(sig))
+
+
+def close_sessions(timeout):
+    """在 timeout 秒内并行关闭会话池中的所有会话，并输出关闭和放弃的会话"""
+    summary = session_pool.close_all(timeout=timeout)
+    log = logger.warning if summary["abandoned"] else logger.debug
+    log("Shutdown summary: %d sessions closed, %d abandoned %s",
+        len(summary["closed"]), len(summary["abandoned"]), summary["abandoned"])
+    return summary
 
 class Automator:
-    def __init__(self, config, device_config=None):
+    """单台设备上的自动化操作
+
+    流程方法以 iter_ 开头，是 yield 停顿秒数的生成器，可由 run_steps 同步执行，
+    也可由编排器异步驱动；不带 iter_ 前缀的同名方法是对应的同步版本。
+    """
+
+    def __init__(self, config, device_config=None, pool=None, prepare=True, token=None):
         self.config = config
+        self.token = token if token is not None else shutdown_token
         self.device_config = device_config
-        server = self.config.get("server", "localhost")  # 默认服务器地址
-        port = self.config.get("port", 4723)  # 默认端口
-
-        logger.debug("Initializing Automator with config: {}".format(self.config.config_data))
-        logger.debug("Initializing Automator with device config: {}".format(self.device_config))
-        
-        desired_capabilities = {
-            "platformName": self.config.get("platformName", "Android"),  # 默认平台名称
-            "appium:automationName": self.config.get("appium:automationName", "UiAutomator2"),  # 默认自动化名称
-            "appium:appPackage": self.config.get("appium:appPackage", "com.xunmeng.pinduoduo"),  # 默认应用包名
-            "appium:appActivity": self.config.get("appium:appActivity", ".ui.activity.MainFrameActivity"),  # 默认应用活动
-            "appium:forceAppLaunch": self.config.get("appium:forceAppLaunch", True),  # 默认强制启动应用
-            "appium:noReset": self.config.get("appium:noReset", True),  # 默认不重置应用
-            "appium:printPageSourceOnFindFailure": self.config.get("appium:printPageSourceOnFindFailure", True),  # 默认打印页面源代码
-            "appium:skipDeviceInitialization": self.config.get("appium:skipDeviceInitialization", True),  # 默认跳过设备初始化
-            "appium:unicodeKeyBoard": self.config.get("appium:unicodeKeyBoard", True),  # 默认使用 Unicode 键盘
-        }
-
-        if device_config:
-            desired_capabilities["appium:deviceName"] = device_config.get("device_name")
-            desired_capabilities["appium:udid"] = device_config.get("udid")
-
-        self.driver = webdriver.Remote(
-            command_executor=f'http://{server}:{port}',
-            desired_capabilities=desired_capabilities
+        self.pool = pool
+        self.device = (device_config or {}).get("udid") or "default"  # 指标中的设备标签
+        self.log = logger.bind(udid=(device_config or {}).get("udid"))  # 日志带上 udid，可按设备分文件
+
+        self.log.debug("Initializing Automator with config: %s", self.config.config_data)
+        self.log.debug("Initializing Automator with device config: %s", self.device_config)
+
+        if traces is not None:
+            # 录制时记录每次随机数抽取和时钟读数，回放时按录制的顺序返回
+            self.rng = traces.rng(self.device)
+            self.clock = traces.clock(self.device)
+        else:
+            self.rng = random.Random()
+            self.clock = time.monotonic
+        self.breaker = breakers.get(self.device, RetryPolicy.from_config(config))
+        self.breaker.check()  # 暂停中的设备不再建立会话
+        self.driver = self._connect()
+        self.log.debug("WebDriver initialized successfully.")
+        self.waiter = UIWaiter(
+            self.driver,
+            record_savings=self.config.get("wait_record_savings", False),
+            listener=lambda site, waited: metrics.observe(self.device, "wait:" + site, waited),
+            token=self.token,
+            rng=self.rng,
+            clock=self.clock,
         )
-        logger.debug("WebDriver initialized successfully.")
-        try:
-            wait = WebDriverWait(self.driver, 15)
-            wait.until(lambda x:x.find_element(By.XPATH, "//android.widget.RelativeLayout[@content-desc=\"首页\"]"))
-        except Exception as e:
-            logger.error("Failed to open 首页: {}".format(str(e)))
+        self.locator = LocatorService(self.driver)
+        self.profile = DEFAULT_PROFILE
+        self.variables = {}  # 当前流程的变量，配置重新加载后原地更新
+        self.options = {}  # 当前流程的选项，优先于配置中的 flow_params
+        self._apply_settings()
+        if prepare:
+            run_steps(self.iter_prepare(), token=self.token)
+
+    def _apply_settings(self):
+        """把配置中可在运行时修改的项应用到等待器、元素定位、停顿、重试策略和流程变量上"""
+        config = self.config
+        self.waiter.poll_interval = config.get("wait_poll_interval", 0.25)
+        self.waiter.jitter = tuple(config.get("wait_jitter", (0.1, 0.5)))
+        self.locator.use_fast = config.get("fast_locators", True)
+        self.delay_scale = config.get("delay_scale", 1.0)  # 拟人停顿的缩放比例
+        self.breaker.policy = RetryPolicy.from_config(config)
+        self.variables.clear()
+        self.variables.update(config.get("flow_params") or {})
+        self.variables.update(self.device_config or {})
+        self.variables.update(self.options)
+
+    def sync_config(self):
+        """在步骤边界应用重新加载的配置；服务分配变化(故障转移或重新平衡)时把会话迁到新的服务，capabilities 的变化在下一个任务生效"""
+        latest = self.config.refresh()
+        if latest is not self.config:
+            self.config = latest
+            self._apply_settings()
+            self.log.warning("Applied config %s version %d", latest.file_path, latest.version)
+        if self._follow_placement():
+            self._replace_session(discard=False)  # 旧服务上的会话归还会话池，按新地址重建
+
+    def _follow_placement(self):
+        """按服务分配更新设备使用的服务地址，地址变化时返回 True"""
+        if placement is None or not self.device_config:
+            return False
+        url = placement.place(self.device)
+        current = self.device_config.get("server_url")
+        if url == current:
+            return False
+        if current:
+            self.log.warning("Moving %s from %s to %s", self.device, current, url)
+        self.device_config = dict(self.device_config, server_url=url)
+        return True
+
+    def _connect(self):
+        self._follow_placement()
+        with metrics.timer(self.device, "session_start"):
+            if self.pool is not None:
+                driver = self.pool.acquire(self.config, self.device_config)  # 优先复用会话池中的健康会话
+            elif traces is not None:
+                driver = traces.create_driver(server_url(self.config, self.device_config),
+                                              build_capabilities(self.config, self.device_config))
+            else:
+                from appium import webdriver  # appium 和 selenium 在第一次建立会话时才导入
+                driver = webdriver.Remote(
+                    command_executor=server_url(self.config, self.device_config),
+                    desired_capabilities=build_capabilities(self.config, self.device_config)
+                )
+        instrument_driver(driver, metrics, self.device)  # 记录每条 WebDriver 命令的耗时
+        return driver
+
+    def recover_session(self):
+        """丢弃失效的会话并重建，等待器和元素缓存改用新会话；当前服务故障(熔断或健康检查失败)时换到其他健康的服务"""
+        if placement is not None:
+            placement.failover(self.device)
+        self._replace_session(discard=True)
+
+    def _replace_session(self, discard):
+        if self.pool is not None:
+            self.pool.release(self.driver, discard=discard)
+        else:
+            try:
+                self.driver.quit()
+            except Exception as e:
+                self.log.warning("Failed to quit stale session: %s", e)
+        self.driver = self._connect()
+        self.waiter.driver = self.driver
+        self.locator = LocatorService(self.driver, use_fast=self.config.get("fast_locators", True))
+
+    def iter_prepare(self):
+        """等待首页就绪，并加载设备的屏幕信息"""
+        if not (yield from self.waiter.iter_until(lambda x: self.locator.find(HOME_TAB), 15)):
+            self.log.error("Failed to open 首页: timed out after 15s")
             self.screenshot("WebDriverWait")
+        udid = self.device_config.get("udid") if self.device_config else None
+        profiles = traces.profiles if traces is not None else screen_profiles  # 录制和回放时不读写本地缓存，两边的命令一致
+        self.profile = profiles.get(self.driver, udid)  # 首页就绪后探测，手势坐标按设备屏幕换算
+
+    def human_delay(self, min_delay=0.5, max_delay=2.5):
+        """生成一次拟人的操作间隔"""
+        self.token.raise_if_cancelled()
+        delay = self.rng.uniform(min_delay, max_delay) * self.delay_scale
+        metrics.observe(self.device, "sleep", delay)
+        yield delay
+
+    def iter_timed(self, step, steps):
+        """执行一段步骤并记录耗时(包含其中的停顿)，失败时计一次错误"""
+        start = time.perf_counter()
+        try:
+            return (yield from steps)
+        except Exception:
+            metrics.error(self.device, step)
+            raise
+        finally:
+            metrics.observe(self.device, step, time.perf_counter() - start)
+
+    def observe_step(self, step, seconds, ok=True):
+        """记录流程步骤的耗时，失败时计一次错误"""
+        metrics.observe(self.device, step, seconds)
+        if not ok:
+            metrics.error(self.device, step)
+
+    def step_failed(self, step):
+        """返回重试时每次失败的回调：记录日志，每轮连续失败只截图一次(会话失效时截图没有意义)"""
+        def on_failure(kind, e, attempt):
+            self.log.error("Error occurred in %s (%s, attempt %d): %s", step, kind, attempt, e)
+            if attempt == 1 and kind != SESSION:
+                self.screenshot(step)
+        return on_failure
 
     def simulate_human_delay(self, min_delay=0.5, max_delay=2.5):
         """模拟人类操作间隔"""
-        time.sleep(random.uniform(min_delay, max_delay))
+        self.token.sleep(self.rng.uniform(min_delay, max_delay))
 
-    def simulate_human_click_and_return(self, element):
+    def iter_click_and_return(self, element):
         """模拟人类行为点击进入页面并返回页面"""
         element.click()  # 点击进入页面
-        self.simulate_human_delay()  # 停顿
+        self.locator.invalidate()
+        yield from self.human_delay()  # 停顿
         self.driver.back()  # 返回页面
-        self.simulate_human_delay()  # 停顿
+        self.locator.invalidate()
+        yield from self.human_delay()  # 停顿
+
+    def simulate_human_click_and_return(self, element):
+        """模拟人类行为点击进入页面并返回页面"""
+        run_steps(self.iter_click_and_return(element), token=self.token)
 
     def swipe_down_quickly(self):
-        """模拟缓慢下滑"""
-        actions = ActionChains(self.driver)
-        actions.w3c_actions = ActionBuilder(self.driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
-        offset_x = random.randint(-100, 100)
-        offset_y = random.randint(-20, 20)
-        actions.w3c_actions.pointer_action.move_to_location(531 + offset_x, 2110 + offset_y)
-        actions.w3c_actions.pointer_action.pointer_down()
-        actions.w3c_actions.pointer_action.move_to_location(544 + offset_x, 754 + offset_y)
-        actions.w3c_actions.pointer_action.release()
-        actions.perform()
+        """模拟快速下滑"""
+        with metrics.timer(self.device, "swipe_down_quickly"):
+            gestures.perform(self.driver, gestures.SWIPE_DOWN_QUICKLY, profile=self.profile, rng=self.rng)
 
     def swipe_down_slowly(self):
         """模拟缓慢下滑"""
-        actions = ActionChains(self.driver)
-        actions.w3c_actions = ActionBuilder(self.driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
-        offset_x = random.randint(-100, 100)
-        offset_y = random.randint(-20, 20)
-        actions.w3c_actions.pointer_action.move_to_location(539 + offset_x, 1866 + offset_y)
-        actions.w3c_actions.pointer_action.pointer_down()
-        actions.w3c_actions.pointer_action.move_to_location(539 + offset_x, 1133 + offset_y)
-        actions.w3c_actions.pointer_action.release()
-        actions.perform()
+        with metrics.timer(self.device, "swipe_down_slowly"):
+            gestures.perform(self.driver, gestures.SWIPE_DOWN_SLOWLY, profile=self.profile, rng=self.rng)
 
     def swipe_up(self):
         """模拟缓慢上滑"""
-        actions = ActionChains(self.driver)
-        actions.w3c_actions = ActionBuilder(self.driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
-        offset_x = random.randint(-100, 100)
-        offset_y = random.randint(-20, 20)
-        actions.w3c_actions.pointer_action.move_to_location(544 + offset_x, 905 + offset_y)
-        actions.w3c_actions.pointer_action.pointer_down()
-        actions.w3c_actions.pointer_action.move_to_location(537 + offset_x, 1413 + offset_y)
-        actions.w3c_actions.pointer_action.release()
-        actions.perform()
+        with metrics.timer(self.device, "swipe_up"):
+            gestures.perform(self.driver, gestures.SWIPE_UP, profile=self.profile, rng=self.rng)
 
     def screenshot(self, identifier="default"):
-        """截取当前屏幕并保存为文件，文件名格式为：年月日+传入的字符串+hash"""
-        try:
-            # 获取当前日期
-            date_str = datetime.now().strftime('%Y-%m-%d')
-            # 生成哈希值
-            hash_object = hashlib.md5(identifier.encode())
-            hash_str = hash_object.hexdigest()[:8]  # 取前8位作为文件名的一部分
-            filename = f"{date_str}_{identifier}_{hash_str}.png"
-            screenshot_path = os.path.join(os.getcwd(), filename)
-            self.driver.save_screenshot(screenshot_path)
-            logger.debug("Screenshot saved to: {}".format(screenshot_path))
-        except Exception as e:
-            logger.error("Failed to take screenshot: {}".format(str(e)))
-
-    def handle_product_detail(self, quick=False):
-        """处理商品详情页操作"""
-        logger.debug("Handling product detail with quick mode: {}".format(quick))
-        self.simulate_human_delay(3, 4)
-        if quick:
-            min_delay = 0.5
-            max_delay = 1.5
-        else:
-            min_delay = 2
-            max_delay = 4
-        while True:
-            try:
-                self.swipe_down_quickly()
-                self.simulate_human_delay(min_delay, max_delay)
-                if random.random() > 0.6:
-                    self.swipe_up()
-                else:
-                    self.swipe_down_slowly()
-                self.simulate_human_delay()
-            except Exception as e:
-                logger.error("Error occurred while handling product detail: {}".format(str(e)))
-                self.screenshot('handle_product_detail')  # 截图并保存
+        """请求一次截图，由后台截图管线获取、去重并保存到 screenshots/<udid>/<run_id>/"""
+        udid = self.device_config.get("udid") if self.device_config else None
+        screenshots.capture(self.driver, udid, identifier)
 
-    def handle_popups_and_navigate(self):
+    def iter_popups_and_navigate(self):
         """处理弹窗并导航到首页"""
-        logger.debug("Handling popups and navigating to home.")
+        self.log.debug("Handling popups and navigating to home.")
         # 1. 扫描当前页面是否有弹窗
         # try:
         #     popup_close_button = self.driver.find_element(By.XPATH, '//*[contains(@resource-id,"popup_close_button_id")]')  # 替换为实际的关闭按钮资源ID
@@ -167,78 +279,51 @@ class Automator:
 
         # 2. 判断首页图标是否为选中状态
         try:
-            home = self.driver.find_element(By.XPATH, "//android.widget.RelativeLayout[@content-desc=\"首页\"]")
-            home.click()  # 点击首页图标
-            logger.debug("Navigated to home successfully.")
-            self.simulate_human_delay(3, 4)
+            with metrics.timer(self.device, "tap_home"):
+                self.locator.click(HOME_TAB)  # 点击首页图标
+            self.log.debug("Navigated to home successfully.")
+            yield from self.waiter.iter_wait("navigate_home", 3, 4, until=self.waiter.page_idle())
         except Exception as e:
-            logger.error("Failed to find home icon: {}".format(str(e)))
+            self.log.error("Failed to find home icon: %s", e)
             self.screenshot('handle_popups_and_navigate')
 
         try:
-            # 3. 上下滑动页面
-            actions = ActionChains(self.driver)
-            actions.w3c_actions = ActionBuilder(self.driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
-            offset_x = random.randint(-100, 100)
-            offset_y = random.randint(-20, 20)
-            actions.w3c_actions.pointer_action.move_to_location(500 + offset_x, 1690 + offset_y)
-            actions.w3c_actions.pointer_action.pointer_down()
-            actions.w3c_actions.pointer_action.move_to_location(500 + offset_x, 829 + offset_y)
-            actions.w3c_actions.pointer_action.release()
-            actions.perform()
-
-            actions = ActionChains(self.driver)
-            actions.w3c_actions = ActionBuilder(self.driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
-            offset_x = random.randint(-100, 100)
-            offset_y = random.randint(-20, 20)
-            actions.w3c_actions.pointer_action.move_to_location(594 + offset_x, 695 + offset_y)
-            actions.w3c_actions.pointer_action.pointer_down()
-            actions.w3c_actions.pointer_action.move_to_location(482 + offset_x, 1446 + offset_y)
-            actions.w3c_actions.pointer_action.release()
-            actions.perform()
-
-            actions = ActionChains(self.driver)
-            actions.w3c_actions = ActionBuilder(self.driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
-            offset_x = random.randint(-100, 100)
-            offset_y = random.randint(-20, 20)
-            actions.w3c_actions.pointer_action.move_to_location(609 + offset_x, 975 + offset_y)
-            actions.w3c_actions.pointer_action.pointer_down()
-            actions.w3c_actions.pointer_action.move_to_location(485 + offset_x, 1822 + offset_y)
-            actions.w3c_actions.pointer_action.release()
-            actions.perform()
-            self.simulate_human_delay(5, 6)
+            # 3. 上下滑动页面，三次滑动合并为一次请求
+            with metrics.timer(self.device, "home_scroll"):
+                gestures.perform(self.driver, *gestures.HOME_SCROLL_BURST, profile=self.profile, rng=self.rng)
+            yield from self.waiter.iter_wait("home_swipes", 5, 6, until=self.waiter.page_idle())
         except Exception as e:
-            logger.error("Error occurred while handling popups and navigate: {}".format(str(e)))
+            self.log.error("Error occurred while handling popups and navigate: %s", e)
             self.screenshot('handle_popups_and_navigate')
 
-    def search_keyword(self, keyword):
+    def handle_popups_and_navigate(self):
+        """处理弹窗并导航到首页"""
+        run_steps(self.iter_popups_and_navigate(), token=self.token)
+
+    def iter_search_keyword(self, keyword):
+        """搜索关键词"""
         try:
-            logger.debug("Searching for keyword: {}".format(keyword))
-            actions = ActionChains(self.driver)
-            actions.w3c_actions = ActionBuilder(self.driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
-            actions.w3c_actions.pointer_action.move_to_location(508, 150)
-            actions.w3c_actions.pointer_action.pointer_down()
-            actions.w3c_actions.pointer_action.pause(0.1)
-            actions.w3c_actions.pointer_action.release()
-            actions.perform()
-            self.simulate_human_delay(4, 5)
-
-            el1 = self.driver.find_element(by=AppiumBy.XPATH, value="//android.widget.EditText[@content-desc=\"搜索\"]")
-            el1.send_keys(keyword)
-            self.simulate_human_delay()
-
-            actions = ActionChains(self.driver)
-            actions.w3c_actions = ActionBuilder(self.driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
-            actions.w3c_actions.pointer_action.move_to_location(1003, 156)
-            actions.w3c_actions.pointer_action.pointer_down()
-            actions.w3c_actions.pointer_action.pause(0.1)
-            actions.w3c_actions.pointer_action.release()
-            actions.perform()
-            self.simulate_human_delay()
+            self.log.debug("Searching for keyword: %s", keyword)
+            gestures.perform(self.driver, gestures.TAP_SEARCH_BAR, profile=self.profile, rng=self.rng)
+            self.locator.invalidate()
+            yield from self.waiter.iter_wait("open_search", 4, 5, until=self.waiter.element_present(*SEARCH_INPUT.fast))
+
+            with metrics.timer(self.device, "send_keys"):
+                el1 = self.locator.find(SEARCH_INPUT)
+                el1.send_keys(keyword)
+            yield from self.human_delay()
+
+            gestures.perform(self.driver, gestures.TAP_SEARCH_BUTTON, profile=self.profile, rng=self.rng)
+            self.locator.invalidate()
+            yield from self.human_delay()
         except Exception as e:
-            logger.error("Error occurred while searching keyword: {}".format(str(e)))
+            self.log.error("Error occurred while searching keyword: %s", e)
             self.screenshot('search_keyword')
 
+    def search_keyword(self, keyword):
+        """搜索关键词"""
+        run_steps(self.iter_search_keyword(keyword), token=self.token)
+
     def handle_popups_and_captcha(self):
         """处理弹窗和滑动验证码"""
         # try:
@@ -269,91 +354,207 @@ class Automator:
 
     def close(self):
         """关闭驱动"""
-        logger.debug("Closing the WebDriver.")
-        logger.stop()
-        self.driver.quit()
+        self.log.debug("Closing the WebDriver.")
+        if self.waiter.record_savings:
+            self.waiter.report()
+        if self.pool is not None:
+            self.pool.release(self.driver)  # 归还会话，供下一个流程复用
+        else:
+            self.driver.quit()
 
 
-    def process_whole_flow(self):
-        """处理全流程的自动化流程"""        
+    def iter_run_flow(self, flow, **options):
+        """执行 flows/<flow>.json 中定义的流程，返回完成的浏览次数
+
+        流程变量依次由配置的 flow_params、设备配置和 options(值为 None 的除外)叠加而成。
+        """
+        self.options = {key: value for key, value in options.items() if value is not None}
+        self._apply_settings()
         try:
-            self.handle_popups_and_navigate() 
-            keyword = self.device_config.get("keyword")
-            if keyword is None:
-                raise ValueError("Keyword is required but not provided in device_config.")
-            self.search_keyword(keyword)
-            self.handle_product_detail(True)
+            return (yield from flow_library.get(flow).iter_run(self, self.variables))
         except Exception as e:
-            logger.error("Error occurred while process_whole_flow: {}".format(str(e)))
-            self.screenshot('process_whole_flow')
+            self.log.error("Error occurred while running flow %s: %s", flow, e)
+            self.screenshot('process_{}_flow'.format(flow))
+            raise
+
+    def iter_whole_flow(self, max_iterations=None, duration=None):
+        """全流程：回到首页、搜索关键词并浏览商品详情"""
+        return (yield from self.iter_run_flow("whole", max_iterations=max_iterations, duration=duration))
+
+    def iter_swip_flow(self, max_iterations=None, duration=None):
+        """单流程：只浏览商品详情"""
+        return (yield from self.iter_run_flow("swip", max_iterations=max_iterations, duration=duration))
+
+    def process_whole_flow(self):
+        """处理全流程的自动化流程"""
+        try:
+            run_steps(self.iter_whole_flow(), token=self.token)
+        except Exception:
+            pass
         finally:
             self.close()
 
     def process_swip_flow(self):
-        """处理单流程的自动化流程"""        
+        """处理单流程的自动化流程"""
         try:
-            self.handle_product_detail(True)
-        except Exception as e:
-            logger.error("Error occurred while process_whole_flow: {}".format(str(e)))
-            self.screenshot('process_whole_flow')
+            run_steps(self.iter_swip_flow(), token=self.token)
+        except Exception:
+            pass
         finally:
             self.close()
 
 
+def iter_flow(flow, device_config, config=None, **options):
+    """一个完整的流程任务：建立会话、执行流程并归还会话，供编排器异步驱动；config 默认读取流程定义中的配置文件"""
+    if config is None:
+        # 解析好的配置按文件缓存，叠加设备的覆盖项
+        config = configs.load(flow_library.get(flow).config_path or "config.json").for_device(device_config.get("udid"))
+    automator = Automator(config, device_config, pool=session_pool, prepare=False)  # 将 Config 对象传入 Automator
+    try:
+        yield from automator.iter_timed("prepare", automator.iter_prepare())
+        return (yield from automator.iter_run_flow(flow, **options))
+    finally:
+        automator.close()
+
+
 def process_whole_flow(device_config):
     """处理单个设备的自动化流程"""
     logger.debug("execute beigin")
-    config = Config("config.json")  # 创建 Config 对象
-    automator = Automator(config, device_config)  # 将 Config 对象传入 Automator
-    
     try:
-        automator.process_whole_flow()
+        run_steps(iter_flow("whole", device_config), token=shutdown_token)
+    except Cancelled:
+        logger.warning("Flow whole cancelled on device %s", device_config.get("device_name"))
     except Exception as e:
-        logger.error("Error occurred while processing device {}: {}".format(device_config.get("device_name"), str(e)))
+        logger.error("Error occurred while processing device %s: %s", device_config.get("device_name"), e)
     finally:
         logger.debug("execute over")
 
 def process_swip_flow(device_config):
     """处理单个设备的自动化流程"""
     logger.debug("execute beigin")
-    config = Config("simple_config.json")  # 创建 Config 对象
-    automator = Automator(config, device_config)  # 将 Config 对象传入 Automator
-
     try:
-        automator.process_swip_flow()
+        run_steps(iter_flow("swip", device_config), token=shutdown_token)
+    except Cancelled:
+        logger.warning("Flow swip cancelled on device %s", device_config.get("device_name"))
     except Exception as e:
-        logger.error("Error occurred while processing device {}: {}".format(device_config.get("device_name"), str(e)))
+        logger.error("Error occurred while processing device %s: %s", device_config.get("device_name"), e)
     finally:
         logger.debug("execute over")
 
 def get_connected_devices():
-    """通过 adb 获取所有连接的设备 ID"""
+    """通过 adb 获取所有就绪(状态为 device)的设备 ID，跳过 offline/unauthorized 的设备"""
     try:
-        # 执行 adb devices 命令
-        result = subprocess.run(['adb', 'devices'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        output = result.stdout.strip().split('\n')[1:]  # 跳过第一行
-        devices = []
-        for line in output:
-            if line.strip():  # 确保行不为空
-                device_id = line.split()[0]  # 获取设备 ID
-                devices.append(device_id)
-        return devices
+        return [serial for serial, state in adb_devices() if state == "device"]
     except Exception as e:
-        logger.error(f"Failed to get connected devices: {str(e)}")
+        logger.error("Failed to get connected devices: %s", e)
         return []
 
 if __name__ == "__main__":
-    # 获取所有连接的设备 ID
-    connected_devices = get_connected_devices()
-
-    # 生成设备配置示例
-    device_configs = []
-    for i, udid in enumerate(connected_devices):
-        device_configs.append({
-            "device_name": f"device{i + 1}",  # 设备名称为 device1, device2, ...
-            "udid": udid
-        })
-
-    # 使用线程池并行执行
-    with ThreadPoolExecutor(max_workers=len(device_configs)) as executor:
-        executor.map(process_swip_flow, device_configs)
\ No newline at end of file
+    # 注册信号处理器：通知流程停止，在期限内并行关闭会话
+    signal.signal(signal.SIGINT, signal_handler)  # 捕获 Ctrl+C
+    signal.signal(signal.SIGTERM, signal_handler)  # 捕获终止信号
+
+    settings = configs.load("simple_config.json")
+    if settings.get("logging"):
+        configure_logging(**settings.get("logging"))
+    for flow in flows_in_use(settings):
+        flow_library.get(flow)  # 启动前校验并编译用到的流程定义，不合法时直接退出
+    if settings.get("processes") and not (settings.get("record") or settings.get("replay")):
+        # 进程隔离模式：设备的流程在工作进程中执行，单个设备的崩溃或内存泄漏不影响其他设备；录制和回放只在单进程模式下进行
+        from supervisor import run_supervisor
+        code = run_supervisor(settings, shutdown_token)
+        logger.stop()
+        sys.exit(code)
+    screenshots = ScreenshotPipeline.from_config(settings)
+    replaying = bool(settings.get("replay"))
+    if replaying:
+        # 回放 replay.directory 中录制的轨迹，不连接设备和 Appium 服务
+        from replay import Replayer
+        traces = Replayer(**settings.get("replay"))
+    elif settings.get("record"):
+        from replay import Recorder
+        traces = Recorder(pool=session_pool, **settings.get("record"))
+    if traces is not None:
+        session_pool.driver_factory = traces.create_driver
+    shutdown_timeout = settings.get("shutdown_timeout", 20)  # 收到退出信号后关闭会话的总期限(秒)
+    launcher = None
+    local_endpoints = []
+    if settings.get("local_appium"):
+        # 在本机不同端口上启动多个 Appium 服务分摊设备
+        launcher = LocalAppiumLauncher(**settings.get("local_appium"))
+        local_endpoints = launcher.start()
+    registry = ServerRegistry.from_config(settings, extra_endpoints=local_endpoints)
+    session_pool.command_listener = registry.record  # 命令耗时用于负载感知的分配
+    placement = None if replaying else registry
+    exporters = []
+    if settings.get("metrics_port") is not None:
+        # Prometheus 从 http://<host>:<metrics_port>/metrics 拉取指标
+        exporters.append(MetricsServer(metrics, port=settings.get("metrics_port")).start())
+    if settings.get("metrics_snapshot"):
+        exporters.append(SnapshotWriter(metrics, **settings.get("metrics_snapshot")).start())
+    orchestrator = Orchestrator(
+        threads=settings.get("orchestrator_threads", 8),
+        per_endpoint_limit=settings.get("per_server_concurrency", 8),
+        placement=placement,
+        rebalance_interval=settings.get("rebalance_interval", 30),
+        pause_scale=traces.speed if replaying else 1.0,  # 回放时拟人停顿随 speed 缩放，0 表示尽快回放
+        token=shutdown_token,
+        shutdown_timeout=shutdown_timeout / 2,  # 一半期限留给流程归还会话，其余用于并行关闭会话
+        keep_running=not replaying,  # 设备随时接入和断开，直到收到退出信号；回放完所有轨迹后退出
+    )
+    device_names = {}  # udid -> device1, device2, ...，按接入顺序命名
+
+    def on_device_added(info):
+        """设备接入后立即开始执行流程"""
+        name = device_names.setdefault(info.serial, "device{}".format(len(device_names) + 1))
+        breakers.reset(info.serial)  # 重新接入的设备不再暂停
+        device_config, flow = assign_flow(settings.refresh(), info.serial, name)  # 按最新加载的配置分配流程
+        orchestrator.submit(device_config, FlowJob(flow, iter_flow))
+
+    def on_device_removed(udid):
+        """设备断开后停止其流程，释放服务分配并丢弃会话"""
+        logger.warning("Device %s disconnected, stopping its flows", udid)
+        orchestrator.cancel_device(udid)
+        registry.release(udid)
+        threading.Thread(target=session_pool.evict, args=(udid,), daemon=True).start()  # 关闭会话可能较慢，不阻塞设备发现
+
+    def on_config_reloaded(old, new):
+        """配置文件修改后更新服务列表；停顿、等待、重试和流程参数由各设备在下一个步骤边界应用"""
+        if new.file_path == settings.file_path:
+            registry.update(ServerRegistry.endpoints_from_config(new, extra_endpoints=local_endpoints))
+
+    configs.add_listener(on_config_reloaded)
+    configs.watch(settings.get("config_watch_interval", 2.0))
+    if replaying:
+        watcher = None
+        for udid in traces.devices():
+            on_device_added(DeviceInfo(udid))
+    else:
+        watcher = DeviceWatcher.from_config(settings, on_added=on_device_added, on_removed=on_device_removed).start()
+    abandoned = []
+    # 少量线程异步驱动所有设备，停顿期间不占用线程
+    try:
+        asyncio.run(orchestrator.run())  # 每个任务的结果在结束时由编排器记录
+        logger.debug("Flow results: %s", orchestrator.stats)
+    finally:
+        if watcher is not None:
+            watcher.stop()
+        configs.stop()
+        if shutdown_token.cancelled:
+            remaining = shutdown_token.cancelled_at + shutdown_timeout - time.monotonic()
+        else:
+            remaining = shutdown_timeout
+        abandoned = close_sessions(max(1.0, remaining))["abandoned"]
+        logger.debug("Resilience stats: %s", breakers.stats())
+        logger.debug("Flow step stats: %s", flow_library.stats())
+        screenshots.close()
+        if traces is not None:
+            traces.close()
+        if launcher is not None:
+            launcher.stop()
+        for exporter in exporters:
+            exporter.stop()
+
+    logger.stop()
+    if shutdown_token.cancelled and abandoned:
+        os._exit(1)  # 不等待卡在请求中的线程，保证退出有期限
@@ -0,0 +1,145 @@
+"""离线流程基准：N 台模拟设备在模拟 Appium 服务上执行流程，输出吞吐、步骤耗时分位数、CPU 和内存
+
+模拟服务运行在单独的进程中，CPU 和 RSS 只统计编排器和流程本身。例如：
+    PYTHONPATH=. python benchmarks/bench_flows.py --devices 20 --flow whole --iterations 10 --latency 0.005
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+import automator
+from config import Config
+from orchestrator import Orchestrator, FlowJob
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(args):
+    """在子进程中启动模拟服务，返回 (进程, 地址)"""
+    command = [
+        sys.executable, os.path.join(ROOT, "fake_appium.py"), "--port", "0",
+        "--latency", str(args.latency), "--latency-jitter", str(args.latency_jitter),
+        "--failure-rate", str(args.failure_rate), "--seed", str(args.seed),
+    ]
+    if args.failure_pattern:
+        command += ["--failure-pattern", args.failure_pattern]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, env=dict(os.environ, PYTHONPATH=ROOT))
+    line = process.stdout.readline()
+    if not line:
+        process.kill()
+        raise RuntimeError("Fake Appium server failed to start")
+    return process, line.strip().rsplit(" ", 1)[-1]
+
+
+def timed_steps(steps, samples):
+    """透传步骤生成器，记录每一步(两次停顿之间)的阻塞耗时"""
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                pause = next(steps)
+            except StopIteration as e:
+                samples.append(time.perf_counter() - start)
+                return e.value
+            samples.append(time.perf_counter() - start)
+            yield pause
+    finally:
+        steps.close()
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run(args, url):
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"server_url": url, "wait_poll_interval": args.poll_interval}, f)
+        config_path = f.name
+    config = Config(config_path)
+    samples = []
+
+    def factory(flow, device_config, **options):
+        return timed_steps(automator.iter_flow(flow, device_config, config=config, **options), samples)
+
+    orchestrator = Orchestrator(threads=args.threads, per_endpoint_limit=args.devices, pause_scale=args.pause_scale)
+    for i in range(args.devices):
+        device_config = {"device_name": "device{}".format(i + 1), "udid": "sim-{:03d}".format(i + 1), "keyword": "bench", "server_url": url}
+        orchestrator.submit(device_config, FlowJob(args.flow, factory, max_iterations=args.iterations), endpoint=url)
+
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(orchestrator.run())
+    finally:
+        automator.session_pool.close_all()
+        os.unlink(config_path)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+
+    iterations = sum(result.value or 0 for result in results if result.ok)
+    cpu = (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+    return {
+        "devices": args.devices,
+        "flow": args.flow,
+        "ok": sum(1 for result in results if result.ok),
+        "failed": sum(1 for result in results if not result.ok),
+        "iterations": iterations,
+        "wall_s": round(wall, 3),
+        "iterations_per_s": round(iterations / wall, 2) if wall else 0.0,
+        "steps": len(samples),
+        "step_p50_ms": round(percentile(samples, 0.5) * 1000, 3),
+        "step_p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "cpu_s": round(cpu, 3),
+        "cpu_percent": round(cpu / wall * 100, 1) if wall else 0.0,
+        "max_rss_mb": round(after.ru_maxrss / 1024, 1),  # Linux 上 ru_maxrss 的单位是 KB
+        "flow_steps": automator.flow_library.stats().get(args.flow, {}),  # 流程引擎统计的各步骤吞吐
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--flow", choices=automator.flow_library.names(), default="swip")
+    parser.add_argument("--iterations", type=int, default=10, help="product detail iterations per device")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--pause-scale", type=float, default=0.0, help="1.0 keeps the real human-like pauses")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-pattern", default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as one JSON line")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    automator.flow_library.get(args.flow)  # 先校验流程定义，不合法时直接退出
+    process, url = start_server(args)
+    try:
+        report = run(args, url)
+    finally:
+        process.terminate()
+        process.wait()
+        automator.screenshots.close()
+        automator.logger.stop()
+    if args.json:
+        print(json.dumps(report))
+    else:
+        steps = report.pop("flow_steps")
+        for key, value in report.items():
+            print("{:<18} {}".format(key, value))
+        for step, stats in steps.items():
+            print("  {:<40} runs={runs} errors={errors} avg={avg_seconds}s per_s={per_second}".format(step, **stats))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""统计每个手势产生的 HTTP 命令数和耗时：旧的 ActionChains 写法 vs 编译后的批量手势"""
+import time
+import warnings
+from appium import webdriver
+from selenium.webdriver import ActionChains
+from selenium.webdriver.common.actions import interaction
+from selenium.webdriver.common.actions.action_builder import ActionBuilder
+from selenium.webdriver.common.actions.pointer_input import PointerInput
+from fake_appium import FakeAppiumServer
+import gestures
+
+ROUNDS = 50
+LATENCY = 0.02  # 模拟每个请求 20ms 的服务端耗时
+
+HOME_SWIPES = [((500, 1690), (500, 829)), ((594, 695), (482, 1446)), ((609, 975), (485, 1822))]
+
+
+def legacy_burst(driver):
+    """原 handle_popups_and_navigate 中的写法：每次滑动单独 perform()"""
+    for start, end in HOME_SWIPES:
+        actions = ActionChains(driver)
+        actions.w3c_actions = ActionBuilder(driver, mouse=PointerInput(interaction.POINTER_TOUCH, "touch"))
+        actions.w3c_actions.pointer_action.move_to_location(*start)
+        actions.w3c_actions.pointer_action.pointer_down()
+        actions.w3c_actions.pointer_action.move_to_location(*end)
+        actions.w3c_actions.pointer_action.release()
+        actions.perform()
+
+
+def compiled_burst(driver):
+    gestures.perform(driver, *gestures.HOME_SCROLL_BURST)
+
+
+def run(name, driver, server, func):
+    before = server.count()
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        func(driver)
+    elapsed = time.perf_counter() - start
+    commands = server.count() - before
+    print("{:<10} commands/burst={:.1f} commands/gesture={:.2f} ms/burst={:.1f}".format(
+        name, commands / ROUNDS, commands / ROUNDS / len(HOME_SWIPES), elapsed / ROUNDS * 1000))
+
+
+def main():
+    warnings.simplefilter("ignore")
+    server = FakeAppiumServer(latency=LATENCY).start()
+    driver = webdriver.Remote(command_executor=server.url, desired_capabilities={"platformName": "Android"})
+    try:
+        run("legacy", driver, server, legacy_burst)
+        run("compiled", driver, server, compiled_burst)
+    finally:
+        driver.quit()
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""对比定位策略：服务端 XPath、UiSelector/accessibility id、以及一次 page_source 的本地索引
+
+模拟服务与 UiAutomator2 一样，XPath 查询每次导出并解析整棵控件树，其余定位方式查询已有的控件树，
+两者的差距来自真实的解析开销，随页面源大小增长；--scales 把首页页面源放大若干倍观察这一点。
+"""
+import argparse
+import os
+import time
+import warnings
+import xml.etree.ElementTree as ET
+from appium import webdriver
+from appium.webdriver.common.appiumby import AppiumBy
+from fake_appium import FakeAppiumServer
+from locator import Locator, LocatorService, PageIndex
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ROUNDS = 50
+SERVER_ROUNDS = 20
+
+HOME_LOCATORS = [
+    Locator(AppiumBy.XPATH, "//android.widget.RelativeLayout[@content-desc=\"首页\"]"),
+    Locator(AppiumBy.XPATH, "//android.widget.RelativeLayout[@content-desc=\"个人中心\"]"),
+    Locator(AppiumBy.XPATH, "//*[contains(@content-desc,\"搜索\")]"),
+    Locator(AppiumBy.XPATH, "//*[@resource-id=\"com.xunmeng.pinduoduo:id/rv_feed\"]"),
+]
+SEARCH_LOCATORS = [
+    Locator(AppiumBy.XPATH, "//android.widget.EditText[@content-desc=\"搜索\"]"),
+    Locator(AppiumBy.XPATH, "//*[@content-desc=\"搜索按钮\"]"),
+]
+
+
+def load(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+def scaled(source, factor):
+    """把页面源根节点下的内容重复 factor 次，模拟控件更多的页面；定位条件仍匹配第一份"""
+    if factor == 1:
+        return source
+    start = source.index(">", source.index("<hierarchy")) + 1
+    end = source.rindex("</hierarchy>")
+    return source[:start] + source[start:end] * factor + source[end:]
+
+
+def etree_path(locator):
+    """把简单 XPath 转成 ElementTree 支持的写法"""
+    selector = locator.selector
+    tag = selector.cls or "*"
+    if selector.op == "eq":
+        return ".//{}[@{}='{}']".format(tag, selector.attr, selector.value)
+    return None
+
+
+def bench_local(name, source, locators):
+    """本地解析开销：每次查找都重新解析整页(服务端 XPath 的做法) vs 解析一次后查索引"""
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for locator in locators:
+            root = ET.fromstring(source.encode("utf-8"))
+            path = etree_path(locator)
+            if path is not None:
+                root.find(path)
+            else:
+                next((e for e in root.iter() if locator.selector.matches(dict(e.attrib))), None)
+    per_dump = (time.perf_counter() - start) / ROUNDS * 1000
+
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        PageIndex(source).lookup(*locators)
+    per_index = (time.perf_counter() - start) / ROUNDS * 1000
+    print("{:<15} {} lookups: reparse-per-lookup={:.2f}ms index={:.2f}ms".format(name, len(locators), per_dump, per_index))
+
+
+def bench_server(name, source, locators):
+    """每批查找的 HTTP 请求数和耗时"""
+    server = FakeAppiumServer(page_source=source).start()
+    driver = webdriver.Remote(command_executor=server.url, desired_capabilities={"platformName": "Android"})
+    try:
+        for label, use_fast in (("xpath", False), ("fast", True)):
+            service = LocatorService(driver, use_fast=use_fast)
+            before = server.count()
+            start = time.perf_counter()
+            for _ in range(SERVER_ROUNDS):
+                for locator in locators:
+                    service.find_all(locator)
+            elapsed = (time.perf_counter() - start) / SERVER_ROUNDS * 1000
+            print("{:<15} {:<7} requests/batch={:.1f} ms/batch={:.1f}".format(name, label, (server.count() - before) / SERVER_ROUNDS, elapsed))
+        service = LocatorService(driver)
+        before = server.count()
+        start = time.perf_counter()
+        for _ in range(SERVER_ROUNDS):
+            service.invalidate()
+            service.lookup(*locators)
+        elapsed = (time.perf_counter() - start) / SERVER_ROUNDS * 1000
+        print("{:<15} {:<7} requests/batch={:.1f} ms/batch={:.1f}".format(name, "index", (server.count() - before) / SERVER_ROUNDS, elapsed))
+    finally:
+        driver.quit()
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 4, 16], help="home page size multipliers")
+    args = parser.parse_args()
+    warnings.simplefilter("ignore")
+    pages = [("home_page_x{}".format(factor), scaled(load("home_page.xml"), factor), HOME_LOCATORS) for factor in args.scales]
+    pages.append(("search_page", load("search_page.xml"), SEARCH_LOCATORS))
+    for name, source, locators in pages:
+        print("{} ({} KB)".format(name, len(source.encode("utf-8")) // 1024))
+        bench_local(name, source, locators)
+        bench_server(name, source, locators)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""日志开销：100 台设备并发写日志时调用方线程上每条日志的耗时，对比原来在调用方格式化的 QueueHandler 写法
+
+默认的 queue_size 按 BURST 设计，突发和均匀写入的场景不应丢弃日志，开销按实际入队的日志计算；
+overload 场景的写入量远超队列，单独报告丢弃比例和日志中的丢弃告警，不计入预算。
+超过 BUDGET_US 或非 overload 场景出现丢弃时以非零状态退出，便于在本地回归时发现日志开销变大。
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+import logger as log_module
+from logger import Logger
+
+DEVICES = 100
+BURST = 200  # 每台设备不停顿地连续写入的条数，与默认 queue_size 对应
+OVERLOAD_MESSAGES = 2000  # overload 场景每台设备的条数，远超队列容量，用来观察丢弃和告警
+PACED_MESSAGES = 400
+BUDGET_US = 15  # 调用方线程上每条日志平均占用 CPU 时间的上限(微秒)
+CONFIG_DATA = {"platformName": "Android", "appPackage": "com.xunmeng.pinduoduo", "appActivity": ".ui.activity.MainFrameActivity",
+               "noReset": True, "automationName": "UiAutomator2", "newCommandTimeout": 300, "server": "127.0.0.1", "port": 4723}
+
+
+def drive(log_call, messages, paced=False):
+    """DEVICES 个线程同时各写 messages 条日志(paced 时每条之间停顿 5ms，即每台设备每秒约 200 条)，返回调用方线程上每条日志平均占用的 CPU 时间(微秒)
+
+    用线程 CPU 时间而不是墙钟时间，避免把等待 GIL 的时间算进日志开销。
+    """
+    elapsed = []
+    barrier = threading.Barrier(DEVICES)
+
+    def device(index):
+        log = log_call(index)
+        barrier.wait()
+        used = 0.0
+        start = time.thread_time()
+        for i in range(messages):
+            if i % 100 == 0:
+                log("Initializing Automator with config: %s", CONFIG_DATA)
+            else:
+                log("Swipe %s finished on %s in %.3fs", i, index, 0.123)
+            if paced:
+                now = time.thread_time()
+                used += now - start
+                time.sleep(0.005)  # 停顿本身的 CPU 时间不计入
+                start = time.thread_time()
+        elapsed.append(used + time.thread_time() - start)
+
+    threads = [threading.Thread(target=device, args=(i,)) for i in range(DEVICES)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(elapsed) / (DEVICES * messages) * 1e6
+
+
+def bench_legacy(directory):
+    """原来的写法：QueueHandler 在调用方线程格式化，无界队列，单个 FileHandler"""
+    log_queue = queue.Queue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    file_handler = logging.FileHandler(os.path.join(directory, "legacy.log"))
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s'))
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    legacy = logging.getLogger("BenchLegacy")
+    legacy.setLevel(logging.DEBUG)
+    legacy.propagate = False
+    legacy.addHandler(handler)
+    start = time.perf_counter()
+    per_call = drive(lambda index: lambda message, *args: legacy.debug(message % args), BURST)
+    caller_done = time.perf_counter() - start
+    listener.stop()
+    file_handler.close()
+    return per_call, caller_done, time.perf_counter() - start
+
+
+def drop_warnings(directory):
+    """日志文件中写入的丢弃告警条数"""
+    count = 0
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            count += sum(1 for line in f if "Dropped" in line and "under pressure" in line)
+    return count
+
+
+def bench_current(directory, messages=BURST, paced=False, **options):
+    log_module.configure(directory=directory, console=False, **options)
+    dropped_before = sum(log_module.stats()["dropped"].values())
+    base = Logger("Bench")
+    start = time.perf_counter()
+    per_call = drive(lambda index: base.bind(udid="sim-{:03d}".format(index)).debug, messages, paced)
+    caller_done = time.perf_counter() - start
+    dropped = sum(log_module.stats()["dropped"].values()) - dropped_before
+    log_module._backend.stop(timeout=60)
+    return per_call, caller_done, time.perf_counter() - start, dropped, drop_warnings(directory)
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        per_call, caller_done, drained = bench_legacy(directory)
+        print("{:<22} cpu_us/call={:.2f} callers={:.2f}s drained={:.2f}s records={}".format(
+            "legacy", per_call, caller_done, drained, DEVICES * BURST))
+        worst = 0.0
+        unexpected_drops = 0
+        for label, options in (
+            ("shared-file", {}),
+            ("per-device", {"per_device": True}),
+            ("per-device-json", {"per_device": True, "json": True}),
+            ("per-device-paced", {"per_device": True, "messages": PACED_MESSAGES, "paced": True}),
+            ("overload", {"messages": OVERLOAD_MESSAGES}),
+        ):
+            records = DEVICES * options.get("messages", BURST)
+            per_call, caller_done, drained, dropped, warnings = bench_current(os.path.join(directory, label), **options)
+            if label != "overload":
+                worst = max(worst, per_call)
+                unexpected_drops += dropped
+            print("{:<22} cpu_us/call={:.2f} callers={:.2f}s drained={:.2f}s records={} dropped={} ({:.1f}%) drop_warnings={}".format(
+                label, per_call, caller_done, drained, records, dropped, dropped / records * 100, warnings))
+    print("budget={}us worst={:.2f}us dropped_within_budget={}".format(BUDGET_US, worst, unexpected_drops))
+    if worst > BUDGET_US or unexpected_drops:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
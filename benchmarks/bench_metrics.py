@@ -0,0 +1,64 @@
+"""指标采集的开销：直方图记录、计时上下文，以及包装后的 driver.execute 相对原始调用多出的耗时"""
+import time
+import warnings
+from appium import webdriver
+from fake_appium import FakeAppiumServer
+from metrics import Metrics, instrument_driver
+
+ROUNDS = 200000
+SERVER_ROUNDS = 500
+
+
+class NullDriver:
+    """execute 不做任何事，只用来量出包装本身的开销"""
+
+    def execute(self, driver_command, params=None):
+        return None
+
+
+def per_call(func, rounds=ROUNDS):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def bench_local():
+    metrics = Metrics()
+    baseline = per_call(lambda: None)
+    observe = per_call(lambda: metrics.observe("device1", "sleep", 0.42)) - baseline
+
+    def timed():
+        with metrics.timer("device1", "swipe_up"):
+            pass
+    timer = per_call(timed) - baseline
+
+    raw = NullDriver()
+    wrapped = instrument_driver(NullDriver(), metrics, "device1")
+    execute = per_call(lambda: wrapped.execute("findElement", {})) - per_call(lambda: raw.execute("findElement", {}))
+    print("observe={:.2f}us timer={:.2f}us execute-wrapper={:.2f}us".format(observe, timer, execute))
+
+
+def bench_server():
+    """真实 HTTP 往返下的相对开销"""
+    server = FakeAppiumServer().start()
+    try:
+        for label, instrument in (("raw", False), ("instrumented", True)):
+            driver = webdriver.Remote(command_executor=server.url, desired_capabilities={"platformName": "Android"})
+            if instrument:
+                instrument_driver(driver, Metrics(), "device1")
+            elapsed = per_call(lambda: driver.current_activity, SERVER_ROUNDS)
+            print("{:<13} us/command={:.1f}".format(label, elapsed))
+            driver.quit()
+    finally:
+        server.stop()
+
+
+def main():
+    warnings.simplefilter("ignore")
+    bench_local()
+    bench_server()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""录制回放基准：先在模拟 Appium 服务上录制 N 台设备的流程，再离线回放录制的轨迹，测量 Automator 在 Python 侧的开销
+
+回放不连接服务、默认不停顿，耗时和 CPU 只来自流程引擎、等待、手势、指标和会话管理本身；
+用同一份轨迹(--traces)回放可以比较不同版本。例如：
+    PYTHONPATH=. python benchmarks/bench_replay.py --devices 10 --flow whole --iterations 20 --traces traces/bench
+    PYTHONPATH=. python benchmarks/bench_replay.py --traces traces/bench --replay-only --repeat 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+import warnings
+import automator
+from bench_flows import start_server, percentile
+from config import Config
+from orchestrator import Orchestrator, FlowJob
+from replay import Recorder, Replayer
+from screenshots import ScreenshotPipeline
+
+META = "bench.json"  # 录制时的流程、设备和配置，回放时原样使用
+
+
+def run_flows(meta, threads, directory):
+    """按 meta 在所有设备上执行一次流程，返回 (结果, 耗时, CPU 秒)"""
+    config = Config(META, data=meta["config"])
+    # 截图按时间限流，每次运行使用新的截图管线，录制和各次回放发出的截图命令一致
+    automator.screenshots = ScreenshotPipeline(root=os.path.join(directory, "screenshots"))
+
+    def factory(flow, device_config, **options):
+        return automator.iter_flow(flow, device_config, config=config, **options)
+
+    orchestrator = Orchestrator(threads=threads, per_endpoint_limit=len(meta["devices"]), pause_scale=0.0)
+    for device_config in meta["devices"]:
+        orchestrator.submit(device_config, FlowJob(meta["flow"], factory, max_iterations=meta["iterations"]))
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    try:
+        results = asyncio.run(orchestrator.run())
+    finally:
+        automator.session_pool.close_all()
+        automator.screenshots.close()  # 等后台写完截图
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    return results, wall, (after.ru_utime - usage.ru_utime) + (after.ru_stime - usage.ru_stime)
+
+
+def use(traces):
+    automator.traces = traces
+    automator.session_pool.driver_factory = traces.create_driver
+
+
+def record(args, directory):
+    process, url = start_server(args)
+    meta = {
+        "flow": args.flow,
+        "iterations": args.iterations,
+        "config": {"wait_poll_interval": args.poll_interval},
+        "devices": [{"device_name": "device{}".format(i + 1), "udid": "sim-{:03d}".format(i + 1), "keyword": "bench",
+                     "server_url": url}
+                    for i in range(args.devices)],
+    }
+    recorder = Recorder(directory, pool=automator.session_pool)
+    use(recorder)
+    try:
+        results, wall, cpu = run_flows(meta, args.threads, directory)
+    finally:
+        recorder.close()
+        process.terminate()
+        process.wait()
+    with open(os.path.join(directory, META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return meta, {
+        "ok": sum(1 for result in results if result.ok),
+        "wall_s": round(wall, 3),
+        "cpu_s": round(cpu, 3),
+        "trace_bytes": sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory) if name.endswith(".trace")),
+    }
+
+
+def replay(args, directory, meta):
+    """回放 repeat 次，每次使用新的 Replayer；返回每次的耗时、CPU 和与录制的差异"""
+    runs = []
+    for _ in range(args.repeat):
+        replayer = Replayer(directory, speed=args.speed)
+        use(replayer)
+        results, wall, cpu = run_flows(meta, args.threads, directory)
+        stats = replayer.stats()
+        commands = sum(item["replayed"] for item in stats.values())
+        runs.append({
+            "ok": sum(1 for result in results if result.ok),
+            "failed": [str(result.error) for result in results if not result.ok],
+            "iterations": sum(result.value or 0 for result in results if result.ok),
+            "commands": commands,
+            "wall_s": wall,
+            "cpu_s": cpu,
+            "remaining": sum(item["remaining"] for item in stats.values()),
+            "mismatches": sum(item["mismatches"] for item in stats.values()),
+            "remaining_commands": {udid: item["remaining_commands"] for udid, item in stats.items() if item["remaining_commands"]},
+        })
+    walls = [run["wall_s"] for run in runs]
+    cpus = [run["cpu_s"] for run in runs]
+    last = runs[-1]
+    return {
+        "devices": len(meta["devices"]),
+        "flow": meta["flow"],
+        "ok": last["ok"],
+        "failed": last["failed"],
+        "iterations": last["iterations"],
+        "commands": last["commands"],
+        "remaining": last["remaining"],  # 回放后仍未用到的录制命令，0 表示与录制走了相同的路径
+        "mismatches": last["mismatches"],
+        "remaining_commands": last["remaining_commands"],
+        "wall_s_min": round(min(walls), 4),
+        "wall_s_p50": round(percentile(walls, 0.5), 4),
+        "cpu_s_p50": round(percentile(cpus, 0.5), 4),
+        "cpu_us_per_command": round(percentile(cpus, 0.5) / last["commands"] * 1e6, 1) if last["commands"] else 0.0,
+        "iterations_per_s": round(last["iterations"] / min(walls), 1) if min(walls) else 0.0,
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--traces", default=None, help="trace directory, a temporary one when omitted")
+    parser.add_argument("--replay-only", action="store_true", help="replay existing traces without recording")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--flow", choices=automator.flow_library.names(), default="swip")
+    parser.add_argument("--iterations", type=int, default=10, help="product detail iterations per device")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--speed", type=float, default=0.0, help="1.0 replays commands with their recorded latency")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-pattern", default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as one JSON line")
+    args = parser.parse_args()
+
+    warnings.simplefilter("ignore")
+    if args.replay_only and not args.traces:
+        parser.error("--replay-only needs --traces")
+    directory = args.traces or tempfile.mkdtemp(prefix="traces-")
+    try:
+        if args.replay_only:
+            with open(os.path.join(directory, META), encoding="utf-8") as f:
+                meta = json.load(f)
+            recorded = None
+        else:
+            if os.path.isdir(directory) and any(name.endswith(".trace") for name in os.listdir(directory)):
+                parser.error("{} already has traces, use --replay-only or another directory".format(directory))
+            os.makedirs(directory, exist_ok=True)
+            meta, recorded = record(args, directory)
+        report = replay(args, directory, meta)
+        if recorded is not None:
+            report["recorded"] = recorded
+    finally:
+        if args.traces is None:
+            shutil.rmtree(directory, ignore_errors=True)
+        automator.screenshots.close()
+        automator.logger.stop()
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for key, value in report.items():
+            print("{:<20} {}".format(key, value))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""进程隔离基准：比较单进程(线程)模式和每台设备/每组设备一个工作进程的冷启动耗时、CPU 和内存
+
+每种模式在新的 Python 进程中运行，冷启动从启动解释器算起，到所有设备执行完一轮流程为止；
+内存为主进程峰值 RSS 加上各工作进程的峰值 RSS(共享的代码页在每个进程中都计入，略高于实际占用)。例如：
+    PYTHONPATH=. python benchmarks/bench_supervisor.py --devices 8 --group-size 1 --group-size 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from bench_flows import start_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def devices(args, url):
+    return [{"device_name": "device{}".format(i + 1), "udid": "sim-{:03d}".format(i + 1), "keyword": "bench", "server_url": url}
+            for i in range(args.devices)]
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux 上 ru_maxrss 的单位是 KB
+
+
+def cpu_seconds(who=resource.RUSAGE_SELF):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_threaded(args, url, settings_path):
+    import automator
+    from config import Config
+    from orchestrator import Orchestrator, FlowJob
+
+    config = Config(settings_path)
+
+    def factory(flow, device_config, **options):
+        return automator.iter_flow(flow, device_config, config=config, **options)
+
+    orchestrator = Orchestrator(threads=args.threads, per_endpoint_limit=args.devices, pause_scale=0.0)
+    for device_config in devices(args, url):
+        orchestrator.submit(device_config, FlowJob(args.flow, factory, max_iterations=args.iterations), endpoint=url)
+    try:
+        results = asyncio.run(orchestrator.run())
+    finally:
+        automator.session_pool.close_all()
+        automator.screenshots.close()
+        automator.logger.stop()
+    return {
+        "ok": sum(1 for result in results if result.ok),
+        "workers": 0,
+        "rss_mb": round(max_rss_mb(), 1),
+        "cpu_s": round(cpu_seconds(), 3),
+    }
+
+
+def run_processes(args, url, settings_path, group_size):
+    from supervisor import Supervisor, logger
+
+    supervisor = Supervisor(settings_path, group_size=group_size, start_method=args.start_method, keep_running=False,
+                            pause_scale=0.0, flow_config=settings_path, report_interval=1.0)
+    for device_config in devices(args, url):
+        supervisor.add(device_config, args.flow, max_iterations=args.iterations)
+    try:
+        results = supervisor.run()
+    finally:
+        supervisor.stop(5)
+        logger.stop()
+    workers = [worker.status for worker in supervisor.workers]  # 正常退出的工作进程保留最后一次上报的状态
+    worker_rss = sum(status.get("max_rss_mb") or 0 for status in workers)
+    worker_cpu = sum(status.get("cpu_s") or 0 for status in workers)
+    return {
+        "ok": sum(1 for result in results if result["ok"]),
+        "workers": len(workers),
+        "parent_rss_mb": round(max_rss_mb(), 1),
+        "rss_mb": round(max_rss_mb() + worker_rss, 1),
+        "cpu_s": round(cpu_seconds() + worker_cpu, 3),
+    }
+
+
+def child(args):
+    """在新进程中按 --mode 运行一次，输出一行 JSON"""
+    warnings.simplefilter("ignore")
+    with open(args.settings, encoding="utf-8") as f:
+        url = json.load(f)["server_url"]
+    if args.mode == "threaded":
+        report = run_threaded(args, url, args.settings)
+    else:
+        report = run_processes(args, url, args.settings, int(args.mode.split("-", 1)[1]))
+    report["cold_start_s"] = round(time.time() - args.launched_at, 3)
+    print(json.dumps(report), flush=True)
+
+
+def launch(args, mode, settings_path):
+    command = [
+        sys.executable, os.path.abspath(__file__), "--child", "--mode", mode, "--settings", settings_path,
+        "--launched-at", repr(time.time()), "--devices", str(args.devices), "--flow", args.flow,
+        "--iterations", str(args.iterations), "--threads", str(args.threads),
+    ]
+    if args.start_method:
+        command += ["--start-method", args.start_method]
+    output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True,
+                            env=dict(os.environ, PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(os.path.abspath(__file__))])))
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--group-size", type=int, action="append", help="devices per worker process, may repeat (default 1)")
+    parser.add_argument("--start-method", default=None, help="forkserver (default where available) or spawn")
+    parser.add_argument("--flow", default="swip")
+    parser.add_argument("--iterations", type=int, default=1, help="product detail iterations per device")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.002)
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-pattern", default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", action="store_true", help="print the report as one JSON line")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", default="threaded", help=argparse.SUPPRESS)
+    parser.add_argument("--settings", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--launched-at", type=float, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    process, url = start_server(args)
+    with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+        json.dump({"server_url": url, "wait_poll_interval": 0.05}, f)
+        settings_path = f.name
+    modes = ["threaded"] + ["processes-{}".format(size) for size in args.group_size or [1]]
+    report = {}
+    try:
+        for mode in modes:
+            runs = [launch(args, mode, settings_path) for _ in range(args.repeat)]
+            best = min(runs, key=lambda run: run["cold_start_s"])
+            best["rss_mb_per_device"] = round(best["rss_mb"] / args.devices, 1)
+            report[mode] = best
+    finally:
+        process.terminate()
+        process.wait()
+        os.unlink(settings_path)
+    if args.json:
+        print(json.dumps(report))
+    else:
+        for mode, result in report.items():
+            print("{:<14} {}".format(mode, "  ".join("{}={}".format(key, value) for key, value in result.items())))
+
+
+if __name__ == "__main__":
+    main()
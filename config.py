@@ -1,26 +1,248 @@
 import json
 import os
+import threading
+from logger import Logger
+
+logger = Logger("Config")
+
+NUMBER = (int, float)
+
+# 已知配置项的类型；未列出的键(如 appium:* capabilities)不做检查
+SCHEMA = {
+    "platformName": str,
+    "server": str,
+    "port": int,
+    "server_url": str,
+    "servers": list,
+    "server_failure_threshold": int,
+    "server_slow_factor": NUMBER,
+    "server_cooldown": NUMBER,
+    "local_appium": dict,
+    "wait_poll_interval": NUMBER,
+    "wait_jitter": list,
+    "wait_record_savings": bool,
+    "fast_locators": bool,
+    "delay_scale": NUMBER,
+    "orchestrator_threads": int,
+    "per_server_concurrency": int,
+    "rebalance_interval": NUMBER,
+    "shutdown_timeout": NUMBER,
+    "metrics_port": int,
+    "metrics_snapshot": dict,
+    "logging": dict,
+    "screenshots": dict,
+    "adb": dict,
+    "resilience": dict,
+    "default_flow": str,
+    "flow_params": dict,
+    "devices": dict,
+    "config_watch_interval": NUMBER,
+    "record": dict,
+    "replay": dict,
+    "processes": dict,
+}
+
+
+class ConfigError(ValueError):
+    """配置文件内容不合法"""
+
+
+class FrozenDict(dict):
+    """只读的 dict，配置被多个线程共享，加载后不允许修改"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Config is read-only")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return FrozenDict, (dict(self),)
+
+
+def freeze(value):
+    """递归地把 dict 转为 FrozenDict、list 转为 tuple"""
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def validate(data, file_path, schema=SCHEMA):
+    """按 SCHEMA 检查配置项的类型，出错时抛出 ConfigError"""
+    if not isinstance(data, dict):
+        raise ConfigError("{}: top level must be an object".format(file_path))
+    for key, expected in schema.items():
+        if key not in data or data[key] is None:
+            continue
+        value = data[key]
+        if expected is list:
+            expected = (list, tuple)
+        if not isinstance(value, expected) or (isinstance(value, bool) and expected is not bool):  # bool 是 int 的子类
+            raise ConfigError("{}: {} must be {}, got {!r}".format(file_path, key, _type_name(expected), value))
+    jitter = data.get("wait_jitter")
+    if jitter is not None and (len(jitter) != 2 or not all(isinstance(v, NUMBER) for v in jitter)):
+        raise ConfigError("{}: wait_jitter must be [min, max]".format(file_path))
+    for udid, overrides in (data.get("devices") or {}).items():
+        if not isinstance(overrides, dict):
+            raise ConfigError("{}: devices.{} must be an object".format(file_path, udid))
+        nested = {key: value for key, value in overrides.items() if key != "devices"}
+        validate(nested, "{} devices.{}".format(file_path, udid), schema)
+
+
+def _type_name(expected):
+    names = {str: "a string", int: "an integer", bool: "true or false", dict: "an object", (list, tuple): "a list", NUMBER: "a number"}
+    return names.get(expected, str(expected))
+
+
+def merge(base, overrides):
+    """设备覆盖项叠加在基础配置上，对象类型的值(如 resilience)按键合并"""
+    merged = dict(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            merged[key] = dict(base[key], **value)
+        else:
+            merged[key] = value
+    return merged
+
 
 class Config:
-    def __init__(self, file_path='config.json'):
+    """只读的配置：加载时解析并校验一次，之后可在多个线程、多台设备间共享
+
+    由 ConfigService 加载的配置会记录来源，refresh() 返回文件变化后重新加载的最新版本。
+    """
+
+    def __init__(self, file_path='config.json', data=None, schema=SCHEMA, source=None, udid=None, version=0):
         self.file_path = file_path
-        self.config_data = self.load_config()
+        self.source = source  # 加载它的 ConfigService
+        self.udid = udid  # 叠加了哪台设备的覆盖项
+        self.version = version  # 文件每重新加载一次加一
+        data = self.load_config() if data is None else data
+        if schema is not None:
+            validate(data, file_path, schema)
+        self.config_data = freeze(data)
+        self._derived = {}  # 由配置计算出的值(如 capabilities)的缓存
+        self._lock = threading.Lock()
 
     def load_config(self):
         """从指定的 JSON 文件加载配置"""
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"Configuration file not found: {self.file_path}")
-        
+
         with open(self.file_path, 'r', encoding='utf-8') as f:
-            config = json.load(f)
+            try:
+                config = json.load(f)
+            except ValueError as e:
+                raise ConfigError("{}: {}".format(self.file_path, e))
         return config
 
     def get(self, key, default=None):
         """获取配置项的值，如果不存在则返回默认值"""
         return self.config_data.get(key, default)
 
+    def derive(self, key, factory):
+        """返回由配置计算出的值，同一份配置只计算一次"""
+        with self._lock:
+            if key not in self._derived:
+                self._derived[key] = factory()
+            return self._derived[key]
+
+    def for_device(self, udid):
+        """叠加了 devices.<udid> 覆盖项的配置，没有覆盖项时返回自身"""
+        overrides = (self.get("devices") or {}).get(udid) if udid else None
+        if not overrides:
+            return self
+        return self.derive(("device", udid), lambda: Config(
+            self.file_path, data=merge(self.config_data, overrides), schema=None, source=self.source, udid=udid,
+            version=self.version,
+        ))
+
+    def refresh(self):
+        """返回最新的配置：文件没有变化时返回自身"""
+        if self.source is None:
+            return self
+        return self.source.load(self.file_path).for_device(self.udid)
+
+
+class ConfigService:
+    """按路径缓存解析好的配置，可在后台轮询文件修改时间并重新加载
+
+    重新加载失败(文件不合法)时保留旧配置；成功时调用监听者 listener(旧配置, 新配置)。
+    """
+
+    def __init__(self):
+        self._configs = {}  # 绝对路径 -> (修改时间, Config)
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self, file_path):
+        """返回已缓存的配置，第一次使用时解析并校验"""
+        path = os.path.abspath(file_path)
+        entry = self._configs.get(path)
+        if entry is not None:
+            return entry[1]
+        with self._lock:
+            entry = self._configs.get(path)
+            if entry is None:
+                mtime = os.path.getmtime(path) if os.path.exists(path) else None
+                entry = self._configs[path] = (mtime, Config(path, source=self))
+            return entry[1]
 
-if __name__ == "__main__":  
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def watch(self, interval=2.0):
+        """启动后台线程，每隔 interval 秒检查已加载的文件是否被修改"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._watch, args=(interval,), name="ConfigWatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _watch(self, interval):
+        while not self._stop.wait(interval):
+            self.check()
+
+    def check(self):
+        """重新加载修改过的文件，返回重新加载成功的路径"""
+        reloaded = []
+        for path, (mtime, old) in list(self._configs.items()):
+            try:
+                current = os.path.getmtime(path)
+            except OSError:
+                continue
+            if current == mtime:
+                continue
+            try:
+                new = Config(path, source=self, version=old.version + 1)
+            except (ConfigError, OSError) as e:
+                logger.error("Ignoring invalid config %s, keeping version %d: %s", path, old.version, e)
+                with self._lock:
+                    self._configs[path] = (current, old)  # 文件再次修改后重试
+                continue
+            with self._lock:
+                self._configs[path] = (current, new)
+            logger.warning("Reloaded config %s (version %d)", path, new.version)
+            reloaded.append(path)
+            for listener in list(self._listeners):
+                try:
+                    listener(old, new)
+                except Exception as e:
+                    logger.error("Config listener failed for %s: %s", path, e)
+        return reloaded
+
+
+configs = ConfigService()  # 进程内共用的配置缓存
+
+
+if __name__ == "__main__":
     config = Config()
     print(config.get("platformName"))
-
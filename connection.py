@@ -0,0 +1,23 @@
+import time
+from appium.webdriver.appium_connection import AppiumConnection
+
+
+class PooledConnection(AppiumConnection):
+    """同一服务上所有会话共享的命令执行器，每条命令完成后回调监听者上报耗时"""
+
+    def __init__(self, url, listener=None, **kwargs):
+        super().__init__(url, **kwargs)
+        self.url = url
+        self.listener = listener  # listener(url, elapsed, ok)
+
+    def execute(self, command, params):
+        if self.listener is None:
+            return super().execute(command, params)
+        start = time.perf_counter()
+        ok = False
+        try:
+            response = super().execute(command, params)
+            ok = (response or {}).get("status", 0) < 500  # 找不到元素等业务错误不算服务故障
+            return response
+        finally:
+            self.listener(self.url, time.perf_counter() - start, ok)
@@ -0,0 +1,292 @@
+import re
+import socket
+import subprocess
+import threading
+from logger import Logger
+
+logger = Logger("Devices")
+
+# 一次 shell 调用查询设备属性，输出依次为型号、SDK 版本、系统版本、分辨率、像素密度
+PROPERTY_COMMAND = "getprop ro.product.model; getprop ro.build.version.sdk; getprop ro.build.version.release; wm size; wm density"
+
+
+class AdbError(Exception):
+    """adb 服务返回 FAIL 或协议异常"""
+
+
+def _recv_exact(sock, size):
+    data = b""
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise AdbError("adb server closed the connection")
+        data += chunk
+    return data
+
+
+def _read_message(sock):
+    """读取一条以 4 位十六进制长度开头的消息"""
+    length = int(_recv_exact(sock, 4), 16)
+    return _recv_exact(sock, length).decode("utf-8", "replace") if length else ""
+
+
+def parse_devices(text):
+    """解析 "serial\\tstate" 格式的设备列表，返回 [(serial, state)]"""
+    devices = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) >= 2:
+            devices.append((parts[0], parts[1]))
+    return devices
+
+
+def adb_devices(binary="adb"):
+    """通过 adb 命令行获取设备列表(会在需要时启动 adb 服务)，返回 [(serial, state)]"""
+    result = subprocess.run([binary, 'devices'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30)
+    return parse_devices("\n".join(result.stdout.strip().split('\n')[1:]))  # 跳过第一行
+
+
+class DeviceInfo:
+    """一台就绪设备及其属性"""
+
+    def __init__(self, serial, model=None, sdk=None, release=None, width=None, height=None, density=None):
+        self.serial = serial
+        self.model = model
+        self.sdk = sdk
+        self.release = release
+        self.width = width
+        self.height = height
+        self.density = density
+
+    @classmethod
+    def parse(cls, serial, output):
+        """解析 PROPERTY_COMMAND 的输出；wm 命令的 Override 值优先于 Physical 值"""
+        lines = [line.strip() for line in output.splitlines()]
+        model, sdk, release = (lines + ["", "", ""])[:3]
+        sizes = {}
+        densities = {}
+        for line in lines[3:]:
+            match = re.match(r'(Physical|Override) size: (\d+)x(\d+)', line)
+            if match:
+                sizes[match.group(1)] = (int(match.group(2)), int(match.group(3)))
+            match = re.match(r'(Physical|Override) density: (\d+)', line)
+            if match:
+                densities[match.group(1)] = int(match.group(2))
+        width, height = sizes.get("Override") or sizes.get("Physical") or (None, None)
+        return cls(
+            serial,
+            model=model or None,
+            sdk=int(sdk) if sdk.isdigit() else None,
+            release=release or None,
+            width=width,
+            height=height,
+            density=densities.get("Override") or densities.get("Physical"),
+        )
+
+    def to_dict(self):
+        return {
+            "serial": self.serial,
+            "model": self.model,
+            "sdk": self.sdk,
+            "release": self.release,
+            "width": self.width,
+            "height": self.height,
+            "density": self.density,
+        }
+
+
+class DeviceTracker:
+    """host:track-devices 长连接，设备列表每变化一次产出一次 [(serial, state)]"""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def __iter__(self):
+        while True:
+            yield parse_devices(_read_message(self.sock))
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class AdbClient:
+    """直接使用 adb 服务(默认 127.0.0.1:5037)的套接字协议，不为每次查询启动 adb 进程"""
+
+    def __init__(self, host="127.0.0.1", port=5037, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def _connect(self):
+        return socket.create_connection((self.host, self.port), timeout=self.timeout)
+
+    def _request(self, sock, payload):
+        data = payload.encode("utf-8")
+        sock.sendall(b"%04x" % len(data) + data)
+        status = _recv_exact(sock, 4)
+        if status == b"FAIL":
+            raise AdbError(_read_message(sock))
+        if status != b"OKAY":
+            raise AdbError("Unexpected adb response: {!r}".format(status))
+
+    def devices(self):
+        """返回 [(serial, state)]"""
+        with self._connect() as sock:
+            self._request(sock, "host:devices")
+            return parse_devices(_read_message(sock))
+
+    def track(self):
+        """打开 host:track-devices 长连接，返回 DeviceTracker"""
+        sock = self._connect()
+        try:
+            self._request(sock, "host:track-devices")
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(None)  # 设备列表不变时服务端不会发送任何数据
+        return DeviceTracker(sock)
+
+    def shell(self, serial, command):
+        """在设备上执行 shell 命令并返回输出"""
+        with self._connect() as sock:
+            self._request(sock, "host:transport:{}".format(serial))
+            self._request(sock, "shell:{}".format(command))
+            chunks = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b"".join(chunks).decode("utf-8", "replace")
+
+    def properties(self, serial):
+        """一次 shell 调用获取设备属性"""
+        return DeviceInfo.parse(serial, self.shell(serial, PROPERTY_COMMAND))
+
+
+class DeviceWatcher:
+    """设备发现：通过 track-devices 长连接感知设备接入和断开，连接不可用时退回轮询
+
+    只有状态为 device 的设备视为就绪，offline/unauthorized 等状态会被忽略；
+    设备属性按 serial 缓存，同一设备重新接入时不再查询。
+    on_added(DeviceInfo) 和 on_removed(serial) 在后台线程中调用。
+    """
+
+    def __init__(self, client=None, on_added=None, on_removed=None, poll_interval=2.0, use_track=True, adb_binary="adb"):
+        self.client = client or AdbClient()
+        self.on_added = on_added
+        self.on_removed = on_removed
+        self.poll_interval = poll_interval
+        self.use_track = use_track
+        self.adb_binary = adb_binary
+        self.devices = {}  # serial -> DeviceInfo，当前就绪的设备
+        self._properties = {}  # serial -> DeviceInfo，属性缓存
+        self._states = {}  # serial -> 最近一次看到的状态
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._tracker = None
+        self._track_failed = False
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """从配置的 adb 段创建：{"host", "port", "poll_interval", "track"}"""
+        options = config.get("adb") or {}
+        client = AdbClient(options.get("host", "127.0.0.1"), options.get("port", 5037))
+        return cls(client, poll_interval=options.get("poll_interval", 2.0), use_track=options.get("track", True), **kwargs)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="DeviceWatcher", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        tracker = self._tracker
+        if tracker is not None:
+            tracker.close()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def snapshot(self):
+        with self._lock:
+            return [info.to_dict() for info in self.devices.values()]
+
+    def _run(self):
+        while not self._stop.is_set():
+            if self.use_track:
+                try:
+                    self._tracker = self.client.track()
+                    if self._track_failed:
+                        logger.debug("adb track-devices connection restored")
+                        self._track_failed = False
+                    for entries in self._tracker:
+                        self._apply(entries)
+                except (OSError, AdbError) as e:
+                    if self._stop.is_set():
+                        break
+                    if not self._track_failed:
+                        logger.warning("adb track-devices unavailable, falling back to polling: %s", e)
+                        self._track_failed = True
+                finally:
+                    if self._tracker is not None:
+                        self._tracker.close()
+                        self._tracker = None
+            self.poll()
+            self._stop.wait(self.poll_interval)
+
+    def poll(self):
+        """查询一次设备列表；adb 服务不可达时用 adb 命令行(会启动 adb 服务)"""
+        try:
+            entries = self.client.devices()
+        except (OSError, AdbError):
+            try:
+                entries = adb_devices(self.adb_binary)
+            except (OSError, subprocess.SubprocessError) as e:
+                logger.error("Failed to list adb devices: %s", e)
+                return
+        self._apply(entries)
+
+    def _apply(self, entries):
+        states = dict(entries)
+        for serial, state in states.items():
+            if state != "device" and self._states.get(serial) != state:
+                logger.warning("Ignoring device %s in state %s", serial, state)
+        self._states = states
+        with self._lock:
+            removed = [serial for serial in self.devices if states.get(serial) != "device"]
+            for serial in removed:
+                del self.devices[serial]
+        for serial in removed:
+            logger.debug("Device %s removed", serial)
+            self._emit(self.on_removed, serial)
+        for serial in sorted(states):
+            if states[serial] != "device" or serial in self.devices:
+                continue
+            info = self._describe(serial)
+            with self._lock:
+                self.devices[serial] = info
+            logger.debug("Device %s added: %s", serial, info.to_dict())
+            self._emit(self.on_added, info)
+
+    def _describe(self, serial):
+        info = self._properties.get(serial)
+        if info is None:
+            try:
+                info = self._properties[serial] = self.client.properties(serial)
+            except (OSError, AdbError) as e:
+                logger.warning("Failed to query properties of %s: %s", serial, e)
+                info = DeviceInfo(serial)  # 不缓存，下次接入时重新查询
+        return info
+
+    def _emit(self, callback, arg):
+        if callback is None:
+            return
+        try:
+            callback(arg)
+        except Exception as e:
+            logger.error("Device event handler failed for %s: %s", arg, e)
@@ -0,0 +1,169 @@
+import argparse
+import socketserver
+import threading
+
+DEFAULT_PROPERTIES = {
+    "ro.product.model": "Pixel 7",
+    "ro.build.version.sdk": "34",
+    "ro.build.version.release": "14",
+    "size": "1080x2400",
+    "density": "420",
+}
+
+
+class FakeAdbServer:
+    """本地模拟的 adb 服务，实现 host:devices、host:track-devices、host:transport 和 shell，用于离线验证设备发现"""
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.host = host
+        self.devices = {}  # serial -> 状态(device/offline/unauthorized)
+        self.properties = {}  # serial -> getprop 和 wm 的返回值
+        self.shell_commands = []  # (serial, command) 记录收到的 shell 命令
+        self.requests = []  # 收到的所有 host 请求
+        self.version = 0  # 设备列表每变化一次加一，通知 track-devices 连接
+        self.changed = threading.Condition()
+        self.stopped = False
+        self.server = socketserver.ThreadingTCPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = None
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.server.serve_forever, name="FakeAdb-{}".format(self.port), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止服务并断开所有 track-devices 连接"""
+        with self.changed:
+            self.stopped = True
+            self.changed.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def set_device(self, serial, state="device", **properties):
+        """接入设备或修改设备状态"""
+        with self.changed:
+            self.devices[serial] = state
+            self.properties[serial] = dict(DEFAULT_PROPERTIES, **properties)
+            self.version += 1
+            self.changed.notify_all()
+
+    def remove_device(self, serial):
+        """断开设备"""
+        with self.changed:
+            self.devices.pop(serial, None)
+            self.version += 1
+            self.changed.notify_all()
+
+    def device_list(self):
+        with self.changed:
+            return "".join("{}\t{}\n".format(serial, state) for serial, state in self.devices.items())
+
+    def shell(self, serial, command):
+        """按 ; 拆分命令，模拟 getprop、wm size、wm density 和 echo 的输出"""
+        self.shell_commands.append((serial, command))
+        properties = self.properties.get(serial, DEFAULT_PROPERTIES)
+        output = []
+        for part in command.split(";"):
+            words = part.split()
+            if words[:1] == ["getprop"] and len(words) == 2:
+                output.append(properties.get(words[1], ""))
+            elif words == ["wm", "size"]:
+                output.append("Physical size: {}".format(properties["size"]))
+            elif words == ["wm", "density"]:
+                output.append("Physical density: {}".format(properties["density"]))
+            elif words[:1] == ["echo"]:
+                output.append(" ".join(words[1:]))
+        return "".join(line + "\n" for line in output)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def _read_request(self):
+                header = self._recv_exact(4)
+                if header is None:
+                    return None
+                payload = self._recv_exact(int(header, 16))
+                return payload.decode("utf-8") if payload is not None else None
+
+            def _recv_exact(self, size):
+                data = b""
+                while len(data) < size:
+                    chunk = self.request.recv(size - len(data))
+                    if not chunk:
+                        return None
+                    data += chunk
+                return data
+
+            def _send_message(self, text):
+                data = text.encode("utf-8")
+                self.request.sendall(b"%04x" % len(data) + data)
+
+            def _fail(self, message):
+                self.request.sendall(b"FAIL")
+                self._send_message(message)
+
+            def handle(self):
+                request = self._read_request()
+                if request is None:
+                    return
+                server.requests.append(request)
+                if request in ("host:devices", "host:devices-l"):
+                    self.request.sendall(b"OKAY")
+                    self._send_message(server.device_list())
+                elif request == "host:version":
+                    self.request.sendall(b"OKAY")
+                    self._send_message("0029")
+                elif request == "host:track-devices":
+                    self._track()
+                elif request.startswith("host:transport:"):
+                    self._transport(request[len("host:transport:"):])
+                else:
+                    self._fail("unknown host service")
+
+            def _track(self):
+                self.request.sendall(b"OKAY")
+                version = None
+                while True:
+                    with server.changed:
+                        while server.version == version and not server.stopped:
+                            server.changed.wait()
+                        if server.stopped:
+                            return
+                        version = server.version
+                    try:
+                        self._send_message(server.device_list())
+                    except OSError:
+                        return  # 客户端断开
+
+            def _transport(self, serial):
+                if server.devices.get(serial) != "device":
+                    self._fail("device '{}' not found".format(serial))
+                    return
+                self.request.sendall(b"OKAY")
+                request = self._read_request()
+                if request is None or not request.startswith("shell:"):
+                    self._fail("unsupported device service")
+                    return
+                self.request.sendall(b"OKAY")
+                self.request.sendall(server.shell(serial, request[len("shell:"):]).encode("utf-8"))
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake adb server for offline device discovery")
+    parser.add_argument("--port", type=int, default=5037)
+    parser.add_argument("--devices", nargs="*", default=["emulator-5554"], help="serials of connected devices")
+    args = parser.parse_args()
+    server = FakeAdbServer(port=args.port).start()
+    for serial in args.devices:
+        server.set_device(serial)
+    print("Fake adb server listening on {}:{}".format(server.host, server.port), flush=True)
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,247 @@
+import argparse
+import json
+import random
+import re
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from locator import PageIndex
+
+# 默认首页页面源，包含流程中用到的首页图标和搜索框
+DEFAULT_PAGE_SOURCE = (
+    '<?xml version="1.0" encoding="UTF-8"?>'
+    '<hierarchy rotation="0">'
+    '<android.widget.FrameLayout class="android.widget.FrameLayout" bounds="[0,0][1080,2400]">'
+    '<android.widget.EditText class="android.widget.EditText" content-desc="搜索" bounds="[40,120][1040,220]"/>'
+    '<android.widget.RelativeLayout class="android.widget.RelativeLayout" content-desc="首页" bounds="[0,2250][216,2400]"/>'
+    '</android.widget.FrameLayout>'
+    '</hierarchy>'
+)
+
+# 1x1 的灰色 PNG，作为截图接口的返回值
+BLANK_SCREENSHOT = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGNoaGgAAAMEAYFL09IQAAAAAElFTkSuQmCC"
+
+
+class FakeAppiumServer:
+    """本地模拟的 Appium/WebDriver HTTP 服务，用于离线验证会话管理和流程
+
+    latency/latency_jitter 模拟每个请求的服务端耗时；failure_rate 按概率让会话内的命令返回 500，
+    failure_pattern 可把故障限定在路径匹配的命令上(如 "actions|element")。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, page_source=DEFAULT_PAGE_SOURCE, latency=0.0, screen_size=(1080, 2400), density=440,
+                 latency_jitter=0.0, failure_rate=0.0, failure_pattern=None, seed=None):
+        self.host = host
+        self.screen_size = screen_size
+        self.density = density
+        self.latency = latency  # 每个请求额外的模拟耗时(秒)
+        self.latency_jitter = latency_jitter  # 在 latency 之上再叠加 [0, latency_jitter) 的随机耗时
+        self.failure_rate = failure_rate
+        self.failure_pattern = re.compile(failure_pattern) if failure_pattern else None
+        self.failures = 0  # 已注入的故障次数
+        self.random = random.Random(seed)
+        self.page_source = page_source
+        self._tree = (None, None)  # (页面源, PageIndex)，模拟设备上已有的控件树
+        self.sessions = {}  # session_id -> capabilities
+        self.commands = []  # (method, path) 记录所有收到的请求
+        self.performed_actions = []  # 收到的 W3C actions 请求体
+        self.connections = set()  # 当前打开的客户端连接，停止时一起关闭
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        """在后台线程中启动服务"""
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="FakeAppium-{}".format(self.port), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """停止服务并断开所有 keep-alive 连接，已建立的会话也无法再发送命令(模拟服务宕机)"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self.lock:
+            connections, self.connections = list(self.connections), set()
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass  # 客户端已经断开
+            connection.close()
+
+    def kill_session(self, session_id):
+        """模拟服务端会话超时被回收"""
+        with self.lock:
+            self.sessions.pop(session_id, None)
+
+    def count(self, method=None, pattern=None):
+        """统计收到的请求数量，可按方法和路径正则过滤"""
+        with self.lock:
+            commands = list(self.commands)
+        return sum(
+            1 for m, path in commands
+            if (method is None or m == method) and (pattern is None or re.search(pattern, path))
+        )
+
+    def handle(self, method, path, body):
+        """分发请求，返回 (状态码, value)"""
+        with self.lock:
+            self.commands.append((method, path))
+        delay = self.latency + (self.random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if delay:
+            time.sleep(delay)
+        parts = [p for p in path.split("/") if p]
+        if parts == ["status"]:
+            return 200, {"ready": True, "message": "fake appium ready"}
+        if parts == ["session"] and method == "POST":
+            return self._new_session(body)
+        if len(parts) < 2 or parts[0] != "session":
+            return 404, {"error": "unknown command", "message": path}
+        session_id = parts[1]
+        with self.lock:
+            alive = session_id in self.sessions
+        if not alive:
+            return 404, {"error": "invalid session id", "message": "Session {} does not exist".format(session_id)}
+        rest = parts[2:]
+        if not rest and method == "DELETE":
+            self.kill_session(session_id)
+            return 200, None
+        if self._should_fail(path):
+            return 500, {"error": "unknown error", "message": "Injected failure: {} {}".format(method, path)}
+        if rest == ["appium", "device", "current_activity"]:
+            return 200, ".ui.activity.MainFrameActivity"
+        if rest == ["window", "rect"] or rest == ["window", "current", "size"]:
+            return 200, {"x": 0, "y": 0, "width": self.screen_size[0], "height": self.screen_size[1]}
+        if rest == ["appium", "device", "display_density"]:
+            return 200, self.density
+        if rest == ["execute", "sync"]:
+            return 200, self.density if body.get("script") == "mobile: getDisplayDensity" else None
+        if rest == ["actions"] and method == "POST":
+            with self.lock:
+                self.performed_actions.append(body.get("actions") or [])
+            return 200, None
+        if rest == ["screenshot"]:
+            return 200, BLANK_SCREENSHOT
+        if rest == ["source"]:
+            return 200, self.page_source
+        if rest in (["element"], ["elements"]) and method == "POST":
+            return self._find(body, many=rest == ["elements"])
+        return 200, None
+
+    def _should_fail(self, path):
+        if not self.failure_rate or (self.failure_pattern is not None and not self.failure_pattern.search(path)):
+            return False
+        with self.lock:
+            if self.random.random() >= self.failure_rate:
+                return False
+            self.failures += 1
+        return True
+
+    def _new_session(self, body):
+        caps = (body.get("capabilities") or {}).get("alwaysMatch") or {}
+        session_id = uuid.uuid4().hex
+        with self.lock:
+            self.sessions[session_id] = caps
+        return 200, {"sessionId": session_id, "capabilities": caps}
+
+    def _find(self, body, many=False):
+        """与 UiAutomator2 相同：XPath 每次都导出并解析整棵控件树，其余定位方式直接查询已有的控件树"""
+        using = body.get("using")
+        value = body.get("value") or ""
+        if using == "xpath":
+            index = PageIndex(self.page_source)
+        else:
+            source, index = self._tree
+            if source is not self.page_source:
+                index = PageIndex(self.page_source)
+                self._tree = (self.page_source, index)
+        found = index.find(using, value) is not None
+        element = {"element-6066-11e4-a52e-4f735466cecf": uuid.uuid4().hex}
+        if many:
+            return 200, [element] if found else []
+        if not found:
+            return 404, {"error": "no such element", "message": "Element not found: {}".format(value)}
+        return 200, element
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # 避免 keep-alive 下小包的 40ms 延迟
+
+            def setup(self):
+                super().setup()
+                with server.lock:
+                    server.connections.add(self.connection)
+
+            def finish(self):
+                with server.lock:
+                    server.connections.discard(self.connection)
+                try:
+                    super().finish()
+                except OSError:
+                    pass  # 服务停止时连接已被关闭
+
+            def _dispatch(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                try:
+                    body = json.loads(raw) if raw else {}
+                except ValueError:
+                    body = {}
+                status, value = server.handle(method, self.path, body)
+                payload = json.dumps({"value": value}).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Appium server for offline runs")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4723, help="0 picks a free port")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--latency-jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-pattern", default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    server = FakeAppiumServer(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        failure_rate=args.failure_rate,
+        failure_pattern=args.failure_pattern,
+        seed=args.seed,
+    ).start()
+    print("Fake Appium server listening on {}".format(server.url), flush=True)
+    try:
+        server.thread.join()
+    except KeyboardInterrupt:
+        server.stop()
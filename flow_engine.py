@@ -0,0 +1,399 @@
+import inspect
+import os
+import threading
+import time
+from config import Config
+from resilience import iter_retry
+
+# 流程定义是 JSON：{"config": "simple_config.json", "steps": [步骤, ...]}，步骤有以下几种：
+#   {"action": "swipe_up", "args": {...}}                执行流程执行方上登记的动作，参数值 "$name" 取自流程变量
+#   {"delay": [0.5, 2.5]}                                拟人停顿
+#   {"wait": "site", "min": 3, "max": 4, "until": "page_idle"}  等待界面就绪，until 可省略(固定等待)
+#   {"loop": {"iterations": 10, "duration": 60}, "retry": true, "steps": [...]}
+#                                                        循环执行，达到次数或时长预算即停止，都省略时一直执行；
+#                                                        retry 为 true 时每一轮失败按 resilience 的策略退避重试
+#   {"choice": [{"probability": 0.4, "steps": [...]}, {"steps": [...]}]}
+#                                                        按概率选择一个分支，不带 probability 的分支取剩余概率
+#   {"steps": [...]}                                     顺序执行一组步骤
+# 每个步骤都可以带 "name"：带名字的步骤耗时会上报给执行方(指标)，并作为统计中的步骤名。
+# 流程变量是设备配置加上流程选项(如 max_iterations、duration)。
+
+DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "flows")
+UNTIL = ("page_idle",)
+STEP_KEYS = ("action", "delay", "wait", "loop", "choice", "steps")
+
+
+class FlowDefinitionError(ValueError):
+    """流程定义不合法，消息中带有出错的位置，如 steps[1].loop.iterations"""
+
+    def __init__(self, path, message):
+        super().__init__("{}: {}".format(path, message))
+        self.path = path
+
+
+def _variable(value, variables, required):
+    """解析 "$name" 形式的流程变量"""
+    if not (isinstance(value, str) and value.startswith("$")):
+        return value
+    resolved = variables.get(value[1:])
+    if resolved is None and required:
+        raise ValueError("Flow variable '{}' is required but not provided".format(value[1:]))
+    return resolved
+
+
+def _number(path, value, allow_variable=False):
+    if allow_variable and isinstance(value, str) and value.startswith("$"):
+        return value
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+        raise FlowDefinitionError(path, "expected a non-negative number, got {!r}".format(value))
+    return value
+
+
+class StepStats:
+    """一个步骤的执行次数、失败次数和累计耗时，多台设备共用"""
+
+    def __init__(self):
+        self.runs = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.first_start = None
+        self.last_end = None
+        self._lock = threading.Lock()
+
+    def record(self, start, end, ok):
+        with self._lock:
+            self.runs += 1
+            if not ok:
+                self.errors += 1
+            self.seconds += end - start
+            if self.first_start is None or start < self.first_start:
+                self.first_start = start
+            self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    def to_dict(self):
+        with self._lock:
+            window = (self.last_end - self.first_start) if self.runs else 0.0
+            return {
+                "runs": self.runs,
+                "errors": self.errors,
+                "avg_seconds": round(self.seconds / self.runs, 4) if self.runs else 0.0,
+                "per_second": round(self.runs / window, 3) if window > 0 else 0.0,  # 所有设备合计的吞吐
+            }
+
+
+class Step:
+    """编译后的步骤节点；iter_run 是 yield 停顿秒数的生成器"""
+
+    def __init__(self, label, name=None):
+        self.label = label
+        self.name = name
+        self.stats = StepStats()
+
+    def iter_run(self, runner, variables):
+        start = time.perf_counter()
+        try:
+            result = yield from self.iter_body(runner, variables)
+        except Exception:
+            self._record(runner, start, False)
+            raise
+        self._record(runner, start, True)  # 被取消时不记录
+        return result
+
+    def _record(self, runner, start, ok):
+        end = time.perf_counter()
+        self.stats.record(start, end, ok)
+        if self.name is not None:
+            runner.observe_step(self.name, end - start, ok)
+
+    def iter_body(self, runner, variables):
+        raise NotImplementedError
+
+    def walk(self):
+        yield self
+
+
+class ActionStep(Step):
+    def __init__(self, label, name, method, args):
+        super().__init__(label, name)
+        self.method = method
+        self.args = args
+
+    def iter_body(self, runner, variables):
+        args = {key: _variable(value, variables, True) for key, value in self.args.items()}
+        result = getattr(runner, self.method)(**args)
+        if inspect.isgenerator(result):
+            result = yield from result
+        return result
+
+
+class DelayStep(Step):
+    def __init__(self, label, name, min_delay, max_delay):
+        super().__init__(label, name)
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+
+    def iter_body(self, runner, variables):
+        yield from runner.human_delay(self.min_delay, self.max_delay)
+
+
+class WaitStep(Step):
+    def __init__(self, label, name, site, min_delay, max_delay, until):
+        super().__init__(label, name)
+        self.site = site
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.until = until
+
+    def iter_body(self, runner, variables):
+        until = runner.waiter.page_idle() if self.until == "page_idle" else None
+        return (yield from runner.waiter.iter_wait(self.site, self.min_delay, self.max_delay, until=until))
+
+
+class SequenceStep(Step):
+    """顺序执行一组步骤，返回其中所有循环完成的轮数"""
+
+    def __init__(self, label, name, steps):
+        super().__init__(label, name)
+        self.steps = steps
+
+    def iter_body(self, runner, variables):
+        iterations = 0
+        for step in self.steps:
+            runner.sync_config()  # 步骤边界上应用重新加载的配置
+            result = yield from step.iter_run(runner, variables)
+            if isinstance(step, (LoopStep, SequenceStep, ChoiceStep)):
+                iterations += result or 0
+        return iterations
+
+    def walk(self):
+        yield self
+        for step in self.steps:
+            yield from step.walk()
+
+
+class LoopStep(Step):
+    """循环：每一轮执行一次 body(循环的 name 用于每一轮)，返回完成的轮数"""
+
+    def __init__(self, label, body, iterations, duration, retry):
+        super().__init__(label)
+        self.body = body
+        self.iterations = iterations
+        self.duration = duration
+        self.retry = retry
+
+    def _exhausted(self, variables, iterations, start, clock):
+        """预算每一轮重新读取，配置重新加载后修改的 flow_params 立即生效"""
+        max_iterations = _variable(self.iterations, variables, False)
+        duration = _variable(self.duration, variables, False)
+        return (max_iterations is not None and iterations >= max_iterations) or \
+            (duration is not None and clock() - start >= duration)
+
+    def iter_body(self, runner, variables):
+        on_failure = runner.step_failed(self.body.name or self.body.label) if self.retry else None
+        start = runner.clock()
+        iterations = 0
+        while not self._exhausted(variables, iterations, start, runner.clock):
+            runner.token.raise_if_cancelled()  # 收到退出信号后在下一轮之前停止
+            if self.retry:
+                yield from iter_retry(lambda: self.body.iter_run(runner, variables), runner.breaker,
+                                      runner.recover_session, on_failure=on_failure, rng=runner.rng)
+            else:
+                yield from self.body.iter_run(runner, variables)
+            iterations += 1
+        return iterations
+
+    def walk(self):
+        yield self
+        yield from self.body.walk()
+
+
+class ChoiceStep(Step):
+    def __init__(self, label, name, branches):
+        super().__init__(label, name)
+        self.branches = branches  # [(累计概率上限, SequenceStep)]
+
+    def iter_body(self, runner, variables):
+        draw = runner.rng.random()
+        for bound, branch in self.branches:
+            if draw < bound:
+                return (yield from branch.iter_run(runner, variables))
+        return 0  # 概率之和小于 1 且没有默认分支时什么都不做
+
+    def walk(self):
+        yield self
+        for _, branch in self.branches:
+            yield from branch.walk()
+
+
+class CompiledFlow:
+    """编译后的流程图，不保存设备状态，可被多台设备同时执行"""
+
+    def __init__(self, name, root, config_path=None):
+        self.name = name
+        self.root = root
+        self.config_path = config_path
+
+    def iter_run(self, runner, variables):
+        """在 runner(Automator)上执行流程，返回所有循环完成的轮数"""
+        return (yield from self.root.iter_run(runner, variables))
+
+    def stats(self):
+        """步骤名 -> 执行次数、失败次数、平均耗时和每秒执行次数"""
+        return {step.name or step.label: step.stats.to_dict() for step in self.root.walk()
+                if step is not self.root and step.stats.runs}
+
+
+class Compiler:
+    """校验流程定义并编译为 Step 图；actions 是动作名 -> 执行方的方法名"""
+
+    def __init__(self, actions):
+        self.actions = actions
+
+    def compile(self, name, definition):
+        if not isinstance(definition, dict):
+            raise FlowDefinitionError(name, "flow definition must be an object")
+        unknown = set(definition) - {"config", "steps", "description"}
+        if unknown:
+            raise FlowDefinitionError(name, "unknown keys {}".format(sorted(unknown)))
+        root = self._sequence(name, None, definition.get("steps"))
+        return CompiledFlow(name, root, definition.get("config"))
+
+    def _sequence(self, path, name, steps):
+        if not isinstance(steps, (list, tuple)) or not steps:
+            raise FlowDefinitionError(path, "steps must be a non-empty list")
+        return SequenceStep(path, name, [self._step("{}.steps[{}]".format(path, i), step) for i, step in enumerate(steps)])
+
+    def _step(self, path, step):
+        if not isinstance(step, dict):
+            raise FlowDefinitionError(path, "step must be an object")
+        kinds = [key for key in STEP_KEYS if key in step and not (key == "steps" and "loop" in step)]  # 循环体也写在 steps 中
+        if len(kinds) != 1:
+            raise FlowDefinitionError(path, "step must have exactly one of {}".format(", ".join(STEP_KEYS)))
+        kind = kinds[0]
+        allowed = {kind, "name"} | {"action": {"args"}, "wait": {"min", "max", "until"}, "loop": {"steps", "retry"},
+                                    "steps": set(), "delay": set(), "choice": set()}[kind]
+        unknown = set(step) - allowed
+        if unknown:
+            raise FlowDefinitionError(path, "unknown keys {} for {} step".format(sorted(unknown), kind))
+        name = step.get("name")
+        if name is not None and not isinstance(name, str):
+            raise FlowDefinitionError(path + ".name", "expected a string")
+        node = getattr(self, "_" + kind)(path, name, step)
+        node.label = "{}:{}".format(path, step[kind] if kind in ("action", "wait") else kind)  # 没有 name 时统计中用到的步骤名
+        return node
+
+    def _action(self, path, name, step):
+        action = step["action"]
+        if action not in self.actions:
+            raise FlowDefinitionError(path + ".action", "unknown action {!r}, expected one of {}".format(action, sorted(self.actions)))
+        args = step.get("args", {})
+        if not isinstance(args, dict):
+            raise FlowDefinitionError(path + ".args", "expected an object")
+        return ActionStep(path, name, self.actions[action], args)
+
+    def _delay(self, path, name, step):
+        delay = step["delay"]
+        if not isinstance(delay, (list, tuple)) or len(delay) != 2:
+            raise FlowDefinitionError(path + ".delay", "expected [min, max]")
+        min_delay, max_delay = (_number(path + ".delay", value) for value in delay)
+        if min_delay > max_delay:
+            raise FlowDefinitionError(path + ".delay", "min is greater than max")
+        return DelayStep(path, name, min_delay, max_delay)
+
+    def _wait(self, path, name, step):
+        if not isinstance(step["wait"], str):
+            raise FlowDefinitionError(path + ".wait", "expected the wait site name")
+        min_delay = _number(path + ".min", step.get("min", 0))
+        max_delay = _number(path + ".max", step.get("max", min_delay))
+        if min_delay > max_delay:
+            raise FlowDefinitionError(path, "min is greater than max")
+        until = step.get("until")
+        if until is not None and until not in UNTIL:
+            raise FlowDefinitionError(path + ".until", "expected one of {}".format(UNTIL))
+        return WaitStep(path, name, step["wait"], min_delay, max_delay, until)
+
+    def _loop(self, path, name, step):
+        budget = step["loop"]
+        if not isinstance(budget, dict) or set(budget) - {"iterations", "duration"}:
+            raise FlowDefinitionError(path + ".loop", "expected {\"iterations\": ..., \"duration\": ...}")
+        iterations = budget.get("iterations")
+        duration = budget.get("duration")
+        if iterations is not None:
+            _number(path + ".loop.iterations", iterations, allow_variable=True)
+        if duration is not None:
+            _number(path + ".loop.duration", duration, allow_variable=True)
+        retry = step.get("retry", False)
+        if not isinstance(retry, bool):
+            raise FlowDefinitionError(path + ".retry", "expected true or false")
+        return LoopStep(path, self._sequence(path + ".body", name, step.get("steps")), iterations, duration, retry)
+
+    def _steps(self, path, name, step):
+        return self._sequence(path, name, step["steps"])
+
+    def _choice(self, path, name, step):
+        branches = step["choice"]
+        if not isinstance(branches, (list, tuple)) or not branches:
+            raise FlowDefinitionError(path + ".choice", "expected a non-empty list of branches")
+        compiled = []
+        total = 0.0
+        default = None
+        for i, branch in enumerate(branches):
+            branch_path = "{}.choice[{}]".format(path, i)
+            if not isinstance(branch, dict) or set(branch) - {"probability", "steps", "name"}:
+                raise FlowDefinitionError(branch_path, "expected {\"probability\": ..., \"steps\": [...]}")
+            sequence = self._sequence(branch_path, branch.get("name"), branch.get("steps"))
+            if "probability" not in branch:
+                if default is not None:
+                    raise FlowDefinitionError(branch_path, "only one branch may omit probability")
+                default = sequence
+                continue
+            probability = _number(branch_path + ".probability", branch["probability"])
+            total += probability
+            compiled.append((total, sequence))
+        if total > 1.0 + 1e-9:
+            raise FlowDefinitionError(path + ".choice", "probabilities add up to {:.3f}, more than 1".format(total))
+        if default is not None:
+            compiled.append((1.0, default))
+        return ChoiceStep(path, name, compiled)
+
+
+class FlowLibrary:
+    """按名字从 flows/<name>.json 加载流程定义(通过 Config)，校验并编译一次后缓存，所有设备共用"""
+
+    def __init__(self, actions, directory=DIRECTORY):
+        self.compiler = Compiler(actions)
+        self.directory = directory
+        self._flows = {}
+        self._lock = threading.Lock()
+
+    def names(self):
+        return sorted(os.path.splitext(name)[0] for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def get(self, name):
+        with self._lock:
+            flow = self._flows.get(name)
+            if flow is None:
+                path = os.path.join(self.directory, name + ".json")
+                if not os.path.exists(path):
+                    raise KeyError("Unknown flow {!r}, expected one of {}".format(name, self.names()))
+                flow = self._flows[name] = self.compiler.compile(name, Config(path, schema=None).config_data)
+            return flow
+
+    def stats(self):
+        """流程名 -> 各步骤的统计"""
+        with self._lock:
+            flows = list(self._flows.values())
+        return {flow.name: flow.stats() for flow in flows}
+
+
+def assign_flow(config, udid, device_name):
+    """按配置的 devices.<udid> 和 default_flow 确定设备执行的流程，返回 (设备配置, 流程名)"""
+    device_config = dict((config.get("devices") or {}).get(udid, {}), device_name=device_name, udid=udid)
+    flow = device_config.pop("flow", config.get("default_flow", "swip"))  # 每台设备可以执行不同的流程
+    return device_config, flow
+
+
+def flows_in_use(config):
+    """配置中用到的所有流程名，用于启动前校验"""
+    devices = config.get("devices") or {}
+    return {config.get("default_flow", "swip")} | {item["flow"] for item in devices.values() if "flow" in item}
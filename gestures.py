@@ -0,0 +1,141 @@
+import random
+from screen_profile import DEFAULT_PROFILE
+
+DEFAULT_MOVE_DURATION = 250  # 与 selenium ActionBuilder 默认的移动时长一致(毫秒)
+
+
+class Swipe:
+    """滑动手势：从 start 按下滑到 end 抬起
+
+    坐标和 jitter 都是相对屏幕宽高的比例，编译时按设备的屏幕信息换算为像素；
+    jitter 为起止点共同的随机偏移范围。
+    """
+
+    def __init__(self, start, end, jitter=(0.093, 0.008), duration=DEFAULT_MOVE_DURATION, pause_after=0):
+        self.start = start
+        self.end = end
+        self.jitter = jitter
+        self.duration = duration
+        self.pause_after = pause_after
+        self._compiled = {}  # 屏幕信息键 -> CompiledGesture
+
+    def points(self, profile):
+        """返回起止点的像素坐标"""
+        return profile.point(*self.start), profile.point(*self.end)
+
+    def steps(self, profile):
+        """手势的动作模板：(类型, 时长, x, y)"""
+        start, end = self.points(profile)
+        return (
+            ("pointerMove", 0, start[0], start[1]),
+            ("pointerDown", 0, None, None),
+            ("pointerMove", self.duration, end[0], end[1]),
+            ("pointerUp", 0, None, None),
+        )
+
+    def compile(self, profile=DEFAULT_PROFILE):
+        """按屏幕信息编译为可重复使用的动作模板，同一屏幕只编译一次"""
+        compiled = self._compiled.get(profile.key)
+        if compiled is None:
+            jitter = (round(self.jitter[0] * profile.width), round(self.jitter[1] * profile.height))
+            compiled = CompiledGesture(self.steps(profile), jitter, self.pause_after)
+            self._compiled[profile.key] = compiled
+        return compiled
+
+
+class Tap(Swipe):
+    """点击手势：按下停留 hold 毫秒后抬起
+
+    指定 anchor 时优先点击已探测控件内 anchor_point 比例处，控件未探测到时退回 point。
+    """
+
+    def __init__(self, point, hold=100, jitter=(0, 0), pause_after=0, anchor=None, anchor_point=(0.5, 0.5)):
+        super().__init__(point, point, jitter=jitter, duration=0, pause_after=pause_after)
+        self.hold = hold
+        self.anchor = anchor
+        self.anchor_point = anchor_point
+
+    def points(self, profile):
+        point = None
+        if self.anchor:
+            point = profile.anchor_point(self.anchor, *self.anchor_point)
+        if point is None:
+            point = profile.point(*self.start)
+        return point, point
+
+    def steps(self, profile):
+        point, _ = self.points(profile)
+        return (
+            ("pointerMove", 0, point[0], point[1]),
+            ("pointerDown", 0, None, None),
+            ("pause", self.hold, None, None),
+            ("pointerUp", 0, None, None),
+        )
+
+
+class Pause:
+    """手势之间的停顿，时长在 min_ms 与 max_ms 之间随机"""
+
+    def __init__(self, min_ms, max_ms=None):
+        self.min_ms = min_ms
+        self.max_ms = min_ms if max_ms is None else max_ms
+
+    def compile(self, profile=DEFAULT_PROFILE):
+        return self
+
+    def render(self, rng=random):
+        return [{"type": "pause", "duration": int(rng.uniform(self.min_ms, self.max_ms))}]
+
+
+class CompiledGesture:
+    """编译后的手势，每次发送时只需套用新的随机偏移"""
+
+    def __init__(self, steps, jitter, pause_after=0):
+        self.steps = steps
+        self.jitter = jitter
+        self.pause_after = pause_after
+
+    def render(self, rng=random):
+        """生成一段 W3C pointer 动作，同一手势内的所有坐标使用同一个偏移"""
+        offset_x = rng.randint(-self.jitter[0], self.jitter[0]) if self.jitter[0] else 0
+        offset_y = rng.randint(-self.jitter[1], self.jitter[1]) if self.jitter[1] else 0
+        actions = []
+        for kind, duration, x, y in self.steps:
+            if kind == "pointerMove":
+                actions.append({"type": kind, "duration": duration, "x": int(x + offset_x), "y": int(y + offset_y), "origin": "viewport"})
+            elif kind == "pause":
+                actions.append({"type": kind, "duration": duration})
+            else:
+                actions.append({"type": kind, "duration": 0, "button": 0})
+        if self.pause_after:
+            actions.append({"type": "pause", "duration": self.pause_after})
+        return actions
+
+
+def build_payload(gestures, profile=DEFAULT_PROFILE, rng=random):
+    """把多个手势(及其间的停顿)拼成一个 W3C actions 请求体"""
+    actions = []
+    for gesture in gestures:
+        actions.extend(gesture.compile(profile).render(rng))
+    return {"actions": [{"type": "pointer", "parameters": {"pointerType": "touch"}, "id": "touch", "actions": actions}]}
+
+
+def perform(driver, *gestures, profile=DEFAULT_PROFILE, rng=random):
+    """一次 HTTP 往返执行一组手势"""
+    from selenium.webdriver.remote.command import Command  # 已有会话时 selenium 已经加载
+    driver.execute(Command.W3C_ACTIONS, build_payload(gestures, profile, rng))
+
+
+# 手势定义，坐标为屏幕宽高的比例(由 1080x2400 屏幕上采集的坐标换算)
+SWIPE_DOWN_QUICKLY = Swipe((0.492, 0.879), (0.504, 0.314))
+SWIPE_DOWN_SLOWLY = Swipe((0.499, 0.777), (0.499, 0.472))
+SWIPE_UP = Swipe((0.504, 0.377), (0.497, 0.589))
+HOME_SCROLL_BURST = (
+    Swipe((0.463, 0.704), (0.463, 0.345)),
+    Pause(150, 400),
+    Swipe((0.550, 0.290), (0.446, 0.603)),
+    Pause(150, 400),
+    Swipe((0.564, 0.406), (0.449, 0.759)),
+)
+TAP_SEARCH_BAR = Tap((0.470, 0.062), anchor="search_bar")
+TAP_SEARCH_BUTTON = Tap((0.929, 0.065), anchor="search_bar", anchor_point=(0.95, 0.5))
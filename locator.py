@@ -0,0 +1,225 @@
+import re
+import xml.etree.ElementTree as ET
+
+
+class AppiumBy:
+    """用到的定位方式，取值与 appium.webdriver.common.appiumby.AppiumBy 相同；导入 appium.webdriver 会加载整个 selenium.webdriver，这里不依赖它"""
+    ID = "id"
+    XPATH = "xpath"
+    ACCESSIBILITY_ID = "accessibility id"
+    ANDROID_UIAUTOMATOR = "-android uiautomator"
+
+
+# 形如 //android.widget.EditText[@content-desc="搜索"] 或 //*[contains(@content-desc,"搜索")] 的简单 XPath
+SIMPLE_XPATH = re.compile(
+    r'^//(\*|[\w.]+)\[(?:@([\w-]+)=(["\'])(.*?)\3|contains\(@([\w-]+),\s*(["\'])(.*?)\6\))\]$'
+)
+UISELECTOR_METHOD = re.compile(r'\.(\w+)\("((?:[^"\\]|\\.)*)"\)')
+UISELECTOR_ESCAPE = re.compile(r'\\(.)')
+
+# UiSelector 方法 <-> (属性, 匹配方式)
+UISELECTOR_ATTRS = {
+    "description": ("content-desc", "eq"),
+    "descriptionContains": ("content-desc", "contains"),
+    "text": ("text", "eq"),
+    "textContains": ("text", "contains"),
+    "resourceId": ("resource-id", "eq"),
+}
+ATTR_METHODS = {value: key for key, value in UISELECTOR_ATTRS.items()}
+INDEXED_ATTRS = ("content-desc", "resource-id", "text")
+
+
+class Selector:
+    """解析后的定位条件：控件类名加一个属性条件"""
+
+    def __init__(self, cls=None, attr=None, value=None, op="eq"):
+        self.cls = cls
+        self.attr = attr
+        self.value = value
+        self.op = op
+
+    def matches(self, node):
+        if self.cls is not None and node.get("class") != self.cls:
+            return False
+        if self.attr is None:
+            return True
+        actual = node.get(self.attr)
+        if actual is None:
+            return False
+        return actual == self.value if self.op == "eq" else self.value in actual
+
+
+def parse_selector(by, value):
+    """把 XPath / accessibility id / id / UiSelector 解析为 Selector，无法识别时返回 None"""
+    if by == AppiumBy.XPATH:
+        match = SIMPLE_XPATH.match(value)
+        if not match:
+            return None
+        cls = None if match.group(1) == "*" else match.group(1)
+        if match.group(2):
+            return Selector(cls, match.group(2), match.group(4), "eq")
+        return Selector(cls, match.group(5), match.group(7), "contains")
+    if by == AppiumBy.ACCESSIBILITY_ID:
+        return Selector(None, "content-desc", value)
+    if by == AppiumBy.ID:
+        return Selector(None, "resource-id", value)
+    if by == AppiumBy.ANDROID_UIAUTOMATOR:
+        selector = Selector()
+        for method, argument in UISELECTOR_METHOD.findall(value):
+            argument = UISELECTOR_ESCAPE.sub(r'\1', argument)
+            if method == "className":
+                selector.cls = argument
+            elif method in UISELECTOR_ATTRS and selector.attr is None:
+                selector.attr, selector.op = UISELECTOR_ATTRS[method]
+                selector.value = argument
+            else:
+                return None
+        return selector
+    return None
+
+
+def translate(by, value):
+    """把 XPath 转换为 UiAutomator2 上更快的定位方式，无法转换时原样返回"""
+    if by != AppiumBy.XPATH:
+        return by, value
+    selector = parse_selector(by, value)
+    if selector is None or (selector.attr, selector.op) not in ATTR_METHODS:
+        return by, value
+    if selector.cls is None and selector.op == "eq" and selector.attr == "content-desc":
+        return AppiumBy.ACCESSIBILITY_ID, selector.value
+    if selector.cls is None and selector.op == "eq" and selector.attr == "resource-id":
+        return AppiumBy.ID, selector.value
+    uiselector = "new UiSelector()"
+    if selector.cls is not None:
+        uiselector += '.className("{}")'.format(_quote(selector.cls))
+    uiselector += '.{}("{}")'.format(ATTR_METHODS[(selector.attr, selector.op)], _quote(selector.value))
+    return AppiumBy.ANDROID_UIAUTOMATOR, uiselector
+
+
+def _quote(value):
+    """UiSelector 的字符串参数(Java 字符串字面量)中转义反斜杠和双引号"""
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def parse_bounds(bounds):
+    """把 "[0,2250][216,2400]" 解析为 [left, top, right, bottom]"""
+    numbers = re.findall(r'-?\d+', bounds or "")
+    return [int(n) for n in numbers[:4]] if len(numbers) >= 4 else None
+
+
+class Locator:
+    """一个控件的定位方式，保留原始写法并预先计算更快的等价写法"""
+
+    def __init__(self, by, value):
+        self.by = by
+        self.value = value
+        self.selector = parse_selector(by, value)
+        self.fast = translate(by, value)
+
+    def __repr__(self):
+        return "Locator({!r}, {!r})".format(self.by, self.value)
+
+
+class PageIndex:
+    """把一次获取的 page_source 解析为本地索引，用于批量回答多个定位查询"""
+
+    def __init__(self, page_source):
+        root = ET.fromstring(page_source.encode("utf-8") if isinstance(page_source, str) else page_source)
+        self.nodes = []
+        self._by_attr = {}  # (属性, 值) -> [节点]
+        for element in root.iter():
+            if element is root:
+                continue
+            node = dict(element.attrib)
+            node.setdefault("class", element.tag)
+            node["bounds"] = parse_bounds(node.get("bounds"))
+            self.nodes.append(node)
+            for attr in INDEXED_ATTRS:
+                attr_value = node.get(attr)
+                if attr_value:
+                    self._by_attr.setdefault((attr, attr_value), []).append(node)
+
+    def match(self, selector):
+        """返回所有满足条件的节点"""
+        if selector.attr in INDEXED_ATTRS and selector.op == "eq":
+            candidates = self._by_attr.get((selector.attr, selector.value), [])
+        else:
+            candidates = self.nodes
+        return [node for node in candidates if selector.matches(node)]
+
+    def find(self, by, value):
+        """返回第一个匹配的节点，找不到或无法解析时返回 None"""
+        selector = parse_selector(by, value)
+        if selector is None:
+            return None
+        nodes = self.match(selector)
+        return nodes[0] if nodes else None
+
+    def lookup(self, *locators):
+        """一次性回答多个定位查询，返回与 locators 对应的节点列表"""
+        return [self.find(locator.by, locator.value) for locator in locators]
+
+
+class LocatorService:
+    """按界面状态缓存元素 ID，导航后失效；可用一次 page_source 回答多个查询"""
+
+    def __init__(self, driver, use_fast=True):
+        self.driver = driver
+        self.use_fast = use_fast
+        self.state = 0  # 界面状态编号，每次导航后递增
+        self._elements = {}  # (by, value) -> (state, element)
+        self._index = None  # (state, PageIndex)
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    def _strategy(self, locator):
+        return locator.fast if self.use_fast else (locator.by, locator.value)
+
+    def find(self, locator):
+        """查找元素，当前界面状态下已找到过的元素直接复用"""
+        key = (locator.by, locator.value)
+        cached = self._elements.get(key)
+        if cached is not None and cached[0] == self.state:
+            self.stats["hits"] += 1
+            return cached[1]
+        self.stats["misses"] += 1
+        element = self.driver.find_element(*self._strategy(locator))
+        self._elements[key] = (self.state, element)
+        return element
+
+    def find_all(self, locator):
+        """查找所有匹配的元素，不做缓存"""
+        return self.driver.find_elements(*self._strategy(locator))
+
+    def click(self, locator):
+        """点击元素并视为一次导航；缓存的元素已失效时重新查找一次"""
+        try:
+            self.find(locator).click()
+        except Exception as e:
+            from selenium.common.exceptions import StaleElementReferenceException  # 出错时才需要，避免启动时加载 selenium
+            if not isinstance(e, StaleElementReferenceException):
+                raise
+            self.invalidate()
+            self.find(locator).click()
+        self.invalidate()
+
+    def invalidate(self):
+        """界面发生导航，之前缓存的元素和页面索引全部失效"""
+        self.state += 1
+        self._elements.clear()
+        self._index = None
+        self.stats["invalidations"] += 1
+
+    def snapshot(self):
+        """返回当前界面状态的页面索引，同一状态只获取一次 page_source"""
+        if self._index is None or self._index[0] != self.state:
+            self._index = (self.state, PageIndex(self.driver.page_source))
+        return self._index[1]
+
+    def lookup(self, *locators):
+        """用一次 page_source 回答多个定位查询"""
+        return self.snapshot().lookup(*locators)
+
+
+# 流程中用到的控件
+HOME_TAB = Locator(AppiumBy.XPATH, "//android.widget.RelativeLayout[@content-desc=\"首页\"]")
+SEARCH_INPUT = Locator(AppiumBy.XPATH, "//android.widget.EditText[@content-desc=\"搜索\"]")
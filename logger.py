@@ -1,56 +1,362 @@
+import atexit
+import json
 import logging
-import logging.handlers
+import os
+import queue
 import sys
-from datetime import datetime
-from queue import Queue
 import threading
 import time
+from datetime import datetime
+
+# 默认配置，可通过 configure() 或配置文件的 logging 段覆盖
+DEFAULTS = {
+    "level": "DEBUG",
+    "directory": ".",
+    "filename": None,  # 为 None 时以年月日命名，跨天自动切换文件
+    "max_bytes": 50 * 1024 * 1024,  # 单个文件超过该大小时轮转，0 表示不按大小轮转
+    "backup_count": 5,
+    "per_device": False,  # 带 udid 的日志写入各设备自己的文件
+    "json": False,  # 以 JSON lines 格式写文件
+    "console": True,
+    "queue_size": 20000,  # 容纳 100 台设备同时各连续输出 200 条日志的突发
+    "batch_size": 512,  # 后台线程每次最多合并写入的条数
+    "block_timeout": 0.05,  # 队列满时 WARNING 及以上级别最多等待的秒数，DEBUG 直接丢弃
+    "drop_report_interval": 5.0,  # 有日志被丢弃时，最多每隔这么多秒写一条 WARNING 说明丢弃的条数
+}
+
+TEXT_FORMAT = '%(asctime)s - %(threadName)s - %(name)s%(device)s - %(levelname)s - %(message)s'
+
+_STOP = object()
+
+
+class _TextFormatter(logging.Formatter):
+    """输出与 TEXT_FORMAT 相同的文本，每秒只格式化一次时间"""
+
+    def __init__(self):
+        super().__init__(TEXT_FORMAT)
+        self._second = None
+        self._stamp = ""
+
+    def format(self, record):
+        second = int(record.created)
+        if second != self._second:
+            self._second = second
+            self._stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(second))
+        udid = getattr(record, "udid", None)
+        text = "%s,%03d - %s - %s%s - %s - %s" % (self._stamp, record.msecs, record.threadName, record.name,
+                                                  " - " + udid if udid else "", record.levelname, record.getMessage())
+        if record.exc_info:
+            text += "\n" + self.formatException(record.exc_info)
+        return text
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "udid": getattr(record, "udid", None),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _RotatingFile:
+    """按日期命名、超过大小后轮转的日志文件"""
+
+    def __init__(self, directory, filename, suffix, ext, max_bytes, backup_count):
+        self.directory = directory
+        self.filename = filename
+        self.suffix = suffix  # 设备文件的 ".<udid>"
+        self.ext = ext
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.path = None
+        self.file = None
+        self.size = 0
+
+    def _current_path(self):
+        name = self.filename or datetime.now().strftime('%Y-%m-%d') + self.suffix + self.ext
+        return os.path.join(self.directory, name)
+
+    def _open(self, path):
+        if self.file is not None:
+            self.file.close()
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = path
+        self.file = open(path, 'ab')
+        self.size = self.file.tell()
+
+    def _rotate(self):
+        self.file.close()
+        self.file = None
+        if self.backup_count > 0:
+            for i in range(self.backup_count - 1, 0, -1):
+                source = "{}.{}".format(self.path, i)
+                if os.path.exists(source):
+                    os.replace(source, "{}.{}".format(self.path, i + 1))
+            os.replace(self.path, self.path + ".1")
+        else:
+            os.remove(self.path)
+        self._open(self.path)
+
+    def write(self, data):
+        path = self._current_path()
+        if path != self.path:
+            self._open(path)  # 跨天切换到新文件
+        if self.max_bytes and self.size and self.size + len(data) > self.max_bytes:
+            self._rotate()
+        self.file.write(data)
+        self.size += len(data)
+
+    def flush(self):
+        if self.file is not None:
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class _Backend:
+    """所有 Logger 共用的有界队列和后台写线程
+
+    调用方线程只创建 LogRecord 并入队；格式化、分文件、轮转和写盘都在后台线程中按批完成。
+    """
+
+    def __init__(self):
+        self.options = dict(DEFAULTS)
+        self.queue = None
+        self.thread = None
+        self.dropped = {}  # 级别名 -> 因队列满被丢弃的条数
+        self.reported = {}  # 级别名 -> 已在日志中报告过的丢弃条数
+        self.written = 0
+        self.lock = threading.Lock()
+        self._atexit = False
+
+    def after_fork(self):
+        """fork 出的子进程中没有父进程的写线程，丢弃继承的队列，下一条日志启动子进程自己的写线程"""
+        self.queue = self.thread = None
+        self.dropped = {}
+        self.reported = {}
+        self.written = 0
+        self.lock = threading.Lock()  # fork 时可能正被父进程的其他线程持有
+
+    def configure(self, **options):
+        unknown = set(options) - set(DEFAULTS)
+        if unknown:
+            raise ValueError("Unknown logging options: {}".format(", ".join(sorted(unknown))))
+        self.stop()  # 先写完已入队的日志，下一条日志按新配置重新启动
+        with self.lock:
+            self.options.update(options)
+        level = logging.getLevelName(str(self.options["level"]).upper())
+        for logger in list(_loggers.values()):
+            logger.setLevel(level)
+
+    def _start(self):
+        with self.lock:
+            if self.queue is None:
+                self.queue = queue.Queue(maxsize=self.options["queue_size"])
+                self.thread = threading.Thread(target=self._run, args=(self.queue, dict(self.options)), name="LogWriter", daemon=True)
+                self.thread.start()
+                if not self._atexit:
+                    self._atexit = True
+                    atexit.register(self.stop)
+            return self.queue
+
+    def enqueue(self, record):
+        log_queue = self.queue or self._start()
+        try:
+            log_queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+        if record.levelno >= logging.WARNING:
+            try:
+                log_queue.put(record, timeout=self.options["block_timeout"])
+                return
+            except queue.Full:
+                pass
+        with self.lock:
+            self.dropped[record.levelname] = self.dropped.get(record.levelname, 0) + 1
+
+    def _run(self, log_queue, options):
+        text_formatter = _TextFormatter()
+        formatter = _JsonFormatter() if options["json"] else text_formatter
+        console = text_formatter if options["console"] else None
+        ext = ".jsonl" if options["json"] else ".log"
+        files = {}  # udid 或 None -> _RotatingFile
+
+        def sink(udid):
+            key = udid if options["per_device"] else None
+            file = files.get(key)
+            if file is None:
+                filename = options["filename"]
+                if key is not None and filename:
+                    filename = "{}.{}{}".format(os.path.splitext(filename)[0], key, ext)
+                file = files[key] = _RotatingFile(options["directory"], filename, ".{}".format(key) if key else "", ext,
+                                                  options["max_bytes"], options["backup_count"])
+            return file
+
+        stopping = False
+        next_report = 0.0
+        while not stopping:
+            batch = [log_queue.get()]
+            while len(batch) < options["batch_size"]:
+                try:
+                    batch.append(log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [record for record in batch if record is not _STOP]
+            if stopping or time.monotonic() >= next_report:
+                summary = self._drop_summary()
+                if summary is not None:
+                    batch.append(summary)
+                    next_report = time.monotonic() + options["drop_report_interval"]
+            self._write(batch, formatter, console, sink)
+        for file in files.values():
+            file.close()
+
+    def _write(self, batch, formatter, console, sink):
+        chunks = {}  # _RotatingFile -> [行]
+        lines = []
+        for record in batch:
+            try:
+                text = formatter.format(record)
+                if console is not None:
+                    lines.append(text if console is formatter else console.format(record))
+            except Exception as e:
+                text = "Failed to format log record {!r} with args {!r}: {}".format(record.msg, record.args, e)
+                if console is not None:
+                    lines.append(text)
+            chunks.setdefault(sink(getattr(record, "udid", None)), []).append(text)
+        for file, texts in chunks.items():
+            try:
+                file.write(("\n".join(texts) + "\n").encode("utf-8"))
+                file.flush()
+            except OSError as e:
+                sys.stderr.write("Failed to write log file {}: {}\n".format(file.path, e))
+        if lines:
+            try:
+                sys.stdout.write("\n".join(lines) + "\n")
+                sys.stdout.flush()
+            except (OSError, ValueError):
+                pass
+        with self.lock:
+            self.written += len(batch)
+
+    def _drop_summary(self):
+        """上次报告之后新丢弃的日志条数，没有时返回 None"""
+        with self.lock:
+            new = {level: count - self.reported.get(level, 0) for level, count in self.dropped.items()
+                   if count > self.reported.get(level, 0)}
+            self.reported = dict(self.dropped)
+            total = sum(self.dropped.values())
+        if not new:
+            return None
+        return logging.LogRecord("Logger", logging.WARNING, "", 0,
+                                 "Dropped %d log records under pressure (%d in total, queue_size %d): %s",
+                                 (sum(new.values()), total, self.options["queue_size"], new), None)
+
+    def stats(self):
+        with self.lock:
+            return {"written": self.written, "dropped": dict(self.dropped), "queued": self.queue.qsize() if self.queue else 0}
+
+    def stop(self, timeout=5):
+        """写完已入队的日志并停止后台线程，最多等待 timeout 秒；返回是否已写完"""
+        with self.lock:
+            log_queue, thread = self.queue, self.thread
+            self.queue = self.thread = None
+        if log_queue is None:
+            return True
+        try:
+            log_queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            return False
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def stop_from_signal(self, timeout=5):
+        """在信号处理函数中停止：被中断的线程可能正持有锁或队列的锁，由另一个线程执行 stop，最多等待 timeout 秒"""
+        stopper = threading.Thread(target=self.stop, args=(timeout,), name="LogStopper", daemon=True)
+        stopper.start()
+        stopper.join(timeout)
+        return not stopper.is_alive()
+
+
+class _QueueHandler(logging.Handler):
+    """只把原始 LogRecord 放入共用队列，不在调用方线程格式化"""
+
+    def handle(self, record):
+        _backend.enqueue(record)
+        return True
+
+    def emit(self, record):
+        _backend.enqueue(record)
+
+
+_backend = _Backend()
+_handler = _QueueHandler()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_backend.after_fork)
+_loggers = {}  # 名称 -> logging.Logger
+
+
+def configure(**options):
+    """设置日志选项(见 DEFAULTS)，已启动时先写完已入队的日志再按新配置生效"""
+    _backend.configure(**options)
+
+
+def stats():
+    """已写入、因队列满丢弃和当前排队的日志条数"""
+    return _backend.stats()
+
 
 class Logger:
-    def __init__(self, name, filename=None):
-        self.log_queue = Queue()
-        self.queue_handler = logging.handlers.QueueHandler(self.log_queue)
-        
-        # 默认以年月日的形式创建文件名
-        if filename is None:
-            filename = datetime.now().strftime('%Y-%m-%d') + '.log'
-        
-        # 设置日志格式，包含线程名
-        self.logger = logging.getLogger(name)
-        self.logger.setLevel(logging.DEBUG)
-        self.logger.addHandler(self.queue_handler)
-
-        # 创建控制台处理器
-        ch = logging.StreamHandler(sys.stdout)
-        ch.setLevel(logging.DEBUG)
-
-        # 创建文件处理器
-        fh = logging.FileHandler(filename)
-        fh.setLevel(logging.DEBUG)
-
-        # 创建格式器并将其添加到处理器
-        formatter = logging.Formatter('%(asctime)s - %(threadName)s - %(name)s - %(levelname)s - %(message)s')
-        ch.setFormatter(formatter)
-        fh.setFormatter(formatter)
-
-        # 创建监听器
-        self.listener = logging.handlers.QueueListener(self.log_queue, ch, fh)
-        self.listener.start()
-
-    def debug(self, message):
-        self.logger.debug(message)
-
-    def error(self, message):
-        self.logger.error(message)
-
-    def warning(self, message):
-        self.logger.warning(message)
-
-    def stop(self):
-        """停止日志监听器"""
-        self.listener.stop()  # 停止监听器
-        self.logger.handlers[0].flush()
-        self.logger.handlers[0].close()
+    """日志记录器，参数按 % 风格延迟格式化：logger.debug("Created %s for %s", a, b)"""
+
+    def __init__(self, name, filename=None, **fields):
+        self.logger = _loggers.get(name)
+        if self.logger is None:
+            self.logger = logging.getLogger(name)
+            self.logger.setLevel(logging.getLevelName(str(_backend.options["level"]).upper()))
+            self.logger.addHandler(_handler)
+            _loggers[name] = self.logger
+        self.fields = fields or None  # 附加到每条记录上的字段，如 udid
+        if filename is not None and filename != _backend.options["filename"]:
+            configure(filename=filename)
+
+    def bind(self, **fields):
+        """返回附带固定字段的记录器，如 logger.bind(udid=udid)"""
+        return Logger(self.logger.name, **dict(self.fields or {}, **fields))
+
+    def _log(self, level, message, args):
+        logger = self.logger
+        if logger.isEnabledFor(level):
+            # 不查找调用位置(findCaller)，格式中也没有用到文件名和行号
+            logger.handle(logger.makeRecord(logger.name, level, "", 0, message, args, None, extra=self.fields))
+
+    def debug(self, message, *args):
+        self._log(logging.DEBUG, message, args)
+
+    def error(self, message, *args):
+        self._log(logging.ERROR, message, args)
+
+    def warning(self, message, *args):
+        self._log(logging.WARNING, message, args)
+
+    def stop(self, timeout=5, from_signal=False):
+        """写完已入队的日志并停止后台写线程，最多等待 timeout 秒；在信号处理函数中调用时传 from_signal=True"""
+        if from_signal:
+            return _backend.stop_from_signal(timeout)
+        return _backend.stop(timeout)
 
 # 创建 Logger 实例
 # logger = Logger()
@@ -0,0 +1,296 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from logger import Logger
+
+logger = Logger("Metrics")
+
+# 直方图桶上界(秒)，覆盖从单条命令的毫秒级到会话创建的数十秒
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """固定分桶的耗时直方图"""
+
+    __slots__ = ("counts", "sum", "count", "lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一个桶为 +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(BUCKETS, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q):
+        """按桶估算分位数，返回所在桶的上界"""
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for index, count in enumerate(counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[index] if index < len(BUCKETS) else float("inf")
+        return float("inf")
+
+    def to_dict(self):
+        with self.lock:
+            return {"count": self.count, "sum": self.sum, "buckets": list(self.counts)}
+
+
+class _Timer:
+    __slots__ = ("metrics", "device", "step", "start")
+
+    def __init__(self, metrics, device, step):
+        self.metrics = metrics
+        self.device = device
+        self.step = step
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.device, self.step, time.perf_counter() - self.start)
+        if exc_type is not None and issubclass(exc_type, Exception):
+            self.metrics.error(self.device, self.step)
+        return False
+
+
+class Metrics:
+    """按设备、按步骤记录耗时直方图和错误次数"""
+
+    def __init__(self):
+        self._steps = {}  # (device, step) -> Histogram
+        self._commands = {}  # (device, command) -> Histogram
+        self._errors = {}  # (device, step) -> 次数
+        self._command_errors = {}  # (device, command) -> 次数
+        self._lock = threading.Lock()
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = table.setdefault(key, Histogram())
+        return histogram
+
+    def observe(self, device, step, seconds):
+        """记录一次流程步骤的耗时"""
+        self._histogram(self._steps, (device, step)).observe(seconds)
+
+    def observe_command(self, device, command, seconds):
+        """记录一次 WebDriver 命令的耗时"""
+        self._histogram(self._commands, (device, command)).observe(seconds)
+
+    def error(self, device, step):
+        """记录一次步骤失败"""
+        with self._lock:
+            self._errors[(device, step)] = self._errors.get((device, step), 0) + 1
+
+    def command_error(self, device, command):
+        """记录一次 WebDriver 命令失败"""
+        with self._lock:
+            self._command_errors[(device, command)] = self._command_errors.get((device, command), 0) + 1
+
+    def timer(self, device, step):
+        """with metrics.timer(device, step): 记录代码块耗时，抛出异常时同时计一次错误"""
+        return _Timer(self, device, step)
+
+    def snapshot(self):
+        """返回可序列化为 JSON 的快照"""
+        with self._lock:
+            steps = list(self._steps.items())
+            commands = list(self._commands.items())
+            errors = list(self._errors.items())
+            command_errors = list(self._command_errors.items())
+        return {
+            "timestamp": time.time(),
+            "buckets": list(BUCKETS),
+            "steps": [dict(device=device, step=step, **h.to_dict()) for (device, step), h in steps],
+            "commands": [dict(device=device, command=command, **h.to_dict()) for (device, command), h in commands],
+            "errors": [{"device": device, "step": step, "count": count} for (device, step), count in errors],
+            "command_errors": [{"device": device, "command": command, "count": count}
+                               for (device, command), count in command_errors],
+        }
+
+    def to_prometheus(self):
+        """导出为 Prometheus 文本格式"""
+        return render_prometheus(self.snapshot())
+
+
+def render_prometheus(snapshot):
+    """把指标快照导出为 Prometheus 文本格式"""
+    lines = []
+    for family, label, items, help_text in (
+        ("automator_step_seconds", "step", snapshot["steps"], "Flow step duration per device."),
+        ("automator_command_seconds", "command", snapshot["commands"], "WebDriver command duration per device."),
+    ):
+        lines.append("# HELP {} {}".format(family, help_text))
+        lines.append("# TYPE {} histogram".format(family))
+        for item in items:
+            labels = 'device="{}",{}="{}"'.format(_escape(item["device"]), label, _escape(item[label]))
+            cumulative = 0
+            for bound, count in zip(list(BUCKETS) + ["+Inf"], item["buckets"]):
+                cumulative += count
+                lines.append('{}_bucket{{{},le="{}"}} {}'.format(family, labels, bound, cumulative))
+            lines.append("{}_sum{{{}}} {}".format(family, labels, item["sum"]))
+            lines.append("{}_count{{{}}} {}".format(family, labels, item["count"]))
+    for family, label, items, help_text in (
+        ("automator_step_errors_total", "step", snapshot["errors"], "Failed flow steps per device."),
+        ("automator_command_errors_total", "command", snapshot["command_errors"], "Failed WebDriver commands per device."),
+    ):
+        lines.append("# HELP {} {}".format(family, help_text))
+        lines.append("# TYPE {} counter".format(family))
+        for item in items:
+            lines.append('{}{{device="{}",{}="{}"}} {}'.format(
+                family, _escape(item["device"]), label, _escape(item[label]), item["count"]))
+    return "\n".join(lines) + "\n"
+
+
+class MergedMetrics:
+    """汇总多个来源(如各工作进程)上报的指标快照，提供与 Metrics 相同的 snapshot() 和 to_prometheus()
+
+    各来源负责的设备互不重叠；同一来源的新快照替换旧快照(工作进程重启后从零开始计数)。
+    """
+
+    def __init__(self):
+        self._snapshots = {}  # 来源 -> 最近一次快照
+        self._lock = threading.Lock()
+
+    def update(self, source, snapshot):
+        with self._lock:
+            self._snapshots[source] = snapshot
+
+    def snapshot(self):
+        with self._lock:
+            snapshots = list(self._snapshots.values())
+        return {
+            "timestamp": time.time(),
+            "buckets": list(BUCKETS),
+            "steps": [item for snapshot in snapshots for item in snapshot["steps"]],
+            "commands": [item for snapshot in snapshots for item in snapshot["commands"]],
+            "errors": [item for snapshot in snapshots for item in snapshot["errors"]],
+            "command_errors": [item for snapshot in snapshots for item in snapshot["command_errors"]],
+        }
+
+    def to_prometheus(self):
+        return render_prometheus(self.snapshot())
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def instrument_driver(driver, metrics, device):
+    """包装 driver.execute，按命令名记录每条 WebDriver 命令的耗时和失败次数"""
+    if getattr(driver, "_metrics", None) is metrics:
+        return driver  # 会话池复用的会话只包装一次
+    execute = driver.execute
+    histograms = {}
+
+    def timed_execute(driver_command, params=None):
+        start = time.perf_counter()
+        try:
+            return execute(driver_command, params)
+        except Exception:
+            metrics.command_error(device, driver_command)
+            raise
+        finally:
+            histogram = histograms.get(driver_command)
+            if histogram is None:
+                histogram = histograms[driver_command] = metrics._histogram(metrics._commands, (device, driver_command))
+            histogram.observe(time.perf_counter() - start)
+
+    driver.execute = timed_execute
+    driver._metrics = metrics
+    return driver
+
+
+class MetricsServer:
+    """在 /metrics 上提供 Prometheus 文本格式的指标"""
+
+    def __init__(self, metrics, port=9108, host="0.0.0.0"):
+        self.metrics = metrics
+        from http.server import ThreadingHTTPServer  # 只有配置了 metrics_port 时才需要
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="MetricsServer", daemon=True)
+        self.thread.start()
+        logger.debug("Metrics endpoint listening on port %s", self.port)
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _make_handler(self):
+        from http.server import BaseHTTPRequestHandler
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                payload = metrics.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class SnapshotWriter:
+    """定期把指标快照写入 JSON 文件"""
+
+    def __init__(self, metrics, path="metrics.json", interval=30):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="MetricsSnapshot", daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def write(self):
+        """立即写一次快照(先写临时文件再替换，避免读到半个文件)"""
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.metrics.snapshot(), f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error("Failed to write metrics snapshot %s: %s", self.path, e)
+
+    def stop(self):
+        self._stop.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.write()
@@ -0,0 +1,286 @@
+import asyncio
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from logger import Logger
+from steps import advance, Cancelled
+
+logger = Logger("Orchestrator")
+
+
+class FlowJob:
+    """设备上要执行的一个流程任务"""
+
+    def __init__(self, flow, factory, **options):
+        self.flow = flow
+        self.factory = factory  # factory(flow, device_config, **options) 返回步骤生成器
+        self.options = options
+
+    def start(self, device_config):
+        return self.factory(self.flow, device_config, **self.options)
+
+
+class FlowResult:
+    """流程任务的执行结果"""
+
+    def __init__(self, udid, device_name, flow, endpoint):
+        self.udid = udid
+        self.device_name = device_name
+        self.flow = flow
+        self.endpoint = endpoint
+        self.ok = False
+        self.value = None  # 流程生成器的返回值
+        self.error = None
+        self.started_at = time.time()
+        self.finished_at = None
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.time()) - self.started_at
+
+    def to_dict(self):
+        return {
+            "udid": self.udid,
+            "device_name": self.device_name,
+            "flow": self.flow,
+            "endpoint": self.endpoint,
+            "ok": self.ok,
+            "value": self.value,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "elapsed": self.elapsed,
+        }
+
+
+def _finish_and_close(future, steps):
+    """等待正在执行的步骤结束后关闭生成器，触发其中的 finally 归还会话"""
+    if future is not None:
+        wait([future])
+    steps.close()
+
+
+class Orchestrator:
+    """基于 asyncio 的多设备编排器
+
+    每台设备有一个按提交顺序执行的任务队列；流程中的阻塞调用在少量线程上执行，
+    停顿期间不占用线程；同一个 Appium 服务上同时执行的步骤数受 per_endpoint_limit 限制。
+    指定 placement(如 ServerRegistry)时，每个任务开始前由它决定设备使用的服务，每一步按它的最新分配限制并发，
+    并每隔 rebalance_interval 秒做一次健康检查和重新平衡(流程在步骤边界跟随新的分配，见 Automator.sync_config)。
+    pause_scale 按比例缩放流程中的停顿，离线基准测试时设为 0 可只测量流程本身的开销。
+    token(CancelToken)被取消时停止所有设备上的任务，最多等待 shutdown_timeout 秒让流程归还会话。
+    keep_running 为 True 时所有任务结束后继续等待新提交的任务(设备热插拔)，直到被取消；
+    此时任务因带 retry_after 属性的异常(如 resilience.DeviceParked)失败后，在 retry_after 秒后重新执行。
+    on_result(FlowResult) 在每个任务结束(包括失败和取消)后在事件循环线程中调用。
+    results 只保留最近 max_results 个结果(None 表示全部保留)，stats 累计成功、失败和取消的任务数。
+    """
+
+    def __init__(self, threads=8, per_endpoint_limit=8, placement=None, rebalance_interval=30, pause_scale=1.0,
+                 token=None, shutdown_timeout=10, keep_running=False, on_result=None,
+                 max_results=1000):
+        self.threads = max(1, threads)
+        self.per_endpoint_limit = max(1, per_endpoint_limit)
+        self.placement = placement
+        self.rebalance_interval = rebalance_interval
+        self.pause_scale = pause_scale
+        self.token = token
+        self.shutdown_timeout = shutdown_timeout
+        self.keep_running = keep_running
+        self.on_result = on_result
+        self.results = collections.deque(maxlen=max_results)
+        self.stats = {"ok": 0, "failed": 0, "cancelled": 0}
+        self._pending = []  # run() 之前提交的任务：(device_config, job, endpoint)
+        self._loop = None
+        self._executor = None
+        self._queues = {}  # udid -> asyncio.Queue
+        self._workers = {}  # udid -> asyncio.Task
+        self._retired = []  # 设备断开时被取消、仍在归还会话的 asyncio.Task
+        self._semaphores = {}  # endpoint -> asyncio.Semaphore
+        self._submit_lock = threading.Lock()
+        self._stopping = False
+        self._stop_requested = None  # asyncio.Event，cancel() 时置位，让 run() 不再无限期等待设备任务
+
+    def submit(self, device_config, job, endpoint="default"):
+        """为设备追加一个流程任务，同一设备上的任务按提交顺序依次执行；运行中也可以调用"""
+        with self._submit_lock:
+            if self._loop is None:
+                self._pending.append((device_config, job, endpoint))
+                return
+            loop = self._loop
+        loop.call_soon_threadsafe(self._enqueue, device_config, job, endpoint)
+
+    def cancel_device(self, udid):
+        """停止设备上正在执行和排队的任务(如设备已断开)；可在任意线程中调用"""
+        with self._submit_lock:
+            if self._loop is None:
+                self._pending = [item for item in self._pending if item[0].get("udid") != udid]
+                return
+            loop = self._loop
+        loop.call_soon_threadsafe(self._cancel_device, udid)
+
+    def _cancel_device(self, udid):
+        self._queues.pop(udid, None)
+        worker = self._workers.pop(udid, None)
+        if worker is not None and not worker.done():
+            logger.debug("Cancelling flows on %s", udid)
+            worker.cancel()
+            self._retired.append(worker)  # 设备重新接入时启动新的任务，不必等它结束
+
+    def _enqueue(self, device_config, job, endpoint):
+        udid = device_config.get("udid")
+        queue = self._queues.get(udid)
+        if queue is None:
+            queue = self._queues[udid] = asyncio.Queue()
+        queue.put_nowait((device_config, job, endpoint))
+        worker = self._workers.get(udid)
+        if worker is None or worker.done():
+            self._workers[udid] = asyncio.ensure_future(self._run_device(udid, queue))
+
+    def cancel(self):
+        """取消所有设备上正在执行和排队的任务，只能在事件循环线程中调用"""
+        self._stopping = True
+        if self._stop_requested is not None:
+            self._stop_requested.set()
+        for worker in self._workers.values():
+            worker.cancel()
+
+    def _semaphore(self, endpoint):
+        semaphore = self._semaphores.get(endpoint)
+        if semaphore is None:
+            semaphore = self._semaphores[endpoint] = asyncio.Semaphore(self.per_endpoint_limit)
+        return semaphore
+
+    async def run(self):
+        """执行所有已提交的任务，全部完成后返回结果列表"""
+        with self._submit_lock:
+            self._loop = asyncio.get_running_loop()
+            pending, self._pending = self._pending, []
+        self._stopping = False
+        self._stop_requested = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="Orchestrator")
+        loop = self._loop
+
+        def on_cancel():
+            loop.call_soon_threadsafe(self.cancel)  # 令牌可能在信号处理函数或其他线程中被取消
+
+        if self.token is not None:
+            self.token.add_callback(on_cancel)
+        rebalancer = None
+        try:
+            for device_config, job, endpoint in pending:
+                self._enqueue(device_config, job, endpoint)
+            rebalancer = asyncio.ensure_future(self._rebalance_loop()) if self.placement is not None else None
+            while not self._stopping:  # 取消后交给 finally，最多等待 shutdown_timeout 秒
+                self._retired = [worker for worker in self._retired if not worker.done()]
+                workers = [worker for worker in list(self._workers.values()) + self._retired if not worker.done()]
+                if workers:
+                    stop = asyncio.ensure_future(self._stop_requested.wait())
+                    try:
+                        await asyncio.wait(workers + [stop], return_when=asyncio.FIRST_COMPLETED)
+                    finally:
+                        stop.cancel()
+                elif self.keep_running:
+                    await asyncio.sleep(0.2)  # 等待新接入的设备提交任务
+                else:
+                    break
+        finally:
+            if not self._stopping:
+                self.cancel()  # 已取消的任务正在归还会话，不能再次取消打断它
+            if rebalancer is not None:
+                rebalancer.cancel()
+            workers = [worker for worker in list(self._workers.values()) + self._retired if not worker.done()]
+            if rebalancer is not None:
+                workers.append(rebalancer)
+            abandoned = set()
+            if workers:
+                # 被取消的任务在线程池中关闭生成器并归还会话，卡在请求中的步骤最多等 shutdown_timeout 秒
+                _, abandoned = await asyncio.wait(workers, timeout=self.shutdown_timeout)
+            for worker in abandoned:
+                logger.warning("Abandoned a device worker still running after %ss", self.shutdown_timeout)
+            self._executor.shutdown(wait=not abandoned)
+            if self.token is not None:
+                self.token.remove_callback(on_cancel)
+            with self._submit_lock:
+                self._loop = None
+        return list(self.results)
+
+    async def _run_device(self, udid, queue):
+        """依次执行一台设备上的任务"""
+        while not queue.empty():
+            submitted = queue.get_nowait()
+            device_config, job, endpoint = submitted
+            retry_after = None
+            if self.placement is not None:
+                endpoint = self.placement.place(udid)  # 任务边界上应用最新的分配
+                device_config = dict(device_config, server_url=endpoint)
+            result = FlowResult(udid, device_config.get("device_name"), job.flow, endpoint)
+            self.results.append(result)
+            logger.debug("Starting flow %s on %s via %s", job.flow, udid, endpoint)
+            try:
+                result.value = await self._drive(job.start(device_config), endpoint, udid)
+                result.ok = True
+            except asyncio.CancelledError:
+                result.error = "cancelled"
+                raise
+            except Cancelled:
+                result.error = "cancelled"
+                return
+            except Exception as e:
+                result.error = "{}: {}".format(type(e).__name__, str(e))
+                logger.error("Flow %s failed on %s: %s", job.flow, udid, result.error)
+                if self.keep_running:
+                    retry_after = getattr(e, "retry_after", None)
+            finally:
+                result.finished_at = time.time()
+                self._report(result)
+            if retry_after is not None:
+                # 设备暂停期结束后重新执行同一个任务；设备断开时随设备任务一起被取消
+                logger.warning("Resuming flow %s on %s in %.0fs", job.flow, udid, retry_after)
+                await asyncio.sleep(retry_after)
+                queue.put_nowait(submitted)
+
+    def _report(self, result):
+        """任务结束时立即记录结果，不等整个运行结束"""
+        if result.ok:
+            self.stats["ok"] += 1
+            logger.debug("Flow %s finished on %s via %s in %.1fs: %s",
+                         result.flow, result.udid, result.endpoint, result.elapsed, result.value)
+        elif result.error == "cancelled":
+            self.stats["cancelled"] += 1
+            logger.debug("Flow %s cancelled on %s", result.flow, result.udid)
+        else:
+            self.stats["failed"] += 1  # 失败原因已在捕获异常时记录
+        if self.on_result is not None:
+            self.on_result(result)
+
+    async def _rebalance_loop(self):
+        """定期检查服务健康状态并重新平衡设备分配"""
+        while True:
+            await asyncio.sleep(self.rebalance_interval)
+            try:
+                await self._loop.run_in_executor(self._executor, self.placement.check_health)
+                self.placement.rebalance()
+            except Exception as e:
+                logger.error("Failed to rebalance endpoints: %s", e)
+
+    async def _drive(self, steps, endpoint, udid=None):
+        """在线程池中推进步骤生成器，生成器 yield 的停顿用 asyncio.sleep 等待"""
+        future = None
+        try:
+            while True:
+                if self.token is not None:
+                    self.token.raise_if_cancelled()
+                if self.placement is not None:
+                    endpoint = self.placement.place(udid)  # 设备可能在流程中迁到了其他服务
+                async with self._semaphore(endpoint):
+                    future = self._executor.submit(advance, steps)
+                    done, value = await asyncio.wrap_future(future)
+                future = None
+                if done:
+                    return value
+                if value and self.pause_scale:
+                    await asyncio.sleep(value * self.pause_scale)
+        except (asyncio.CancelledError, Cancelled):
+            await self._loop.run_in_executor(self._executor, _finish_and_close, future, steps)
+            raise
@@ -0,0 +1,385 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from appium import webdriver
+from appium.webdriver.appium_connection import AppiumConnection
+from logger import Logger
+from screen_profile import ScreenProfileCache
+from connection import PooledConnection
+
+logger = Logger("Replay")
+
+# 轨迹文件是 JSON lines，每台设备一个 <directory>/<udid>.trace，只追加；每次运行以一条 run 记录开头：
+#   {"k": "run", "run": "<run_id>", "udid": "...", "started": 1700000000.0}
+#   {"k": "cmd", "c": "findElement", "p": {...}, "d": 0.012, "r": {"status": 200, "value": ...}}
+#                 一条 WebDriver 命令：参数、耗时和响应；与本次运行中第 n 条命令的响应相同时写 "s": n 代替 "r"，
+#                 连接异常时写 "e": ["类型", "消息"] 代替 "r"
+#   {"k": "r", "v": 0.42}     一次 random() 抽取
+#   {"k": "b", "v": 12345}    一次 getrandbits() 抽取(randint/choice 等)
+#   {"k": "c", "v": 123.456}  一次时钟读数(等待超时、循环时长预算)
+DEDUP_MIN_SIZE = 256  # 响应超过该长度(如页面源、截图)时才查找相同的响应
+DEDUP_ENTRIES = 128  # 查找相同响应时保留的最近响应数
+
+
+class ReplayDivergence(Exception):
+    """回放时的命令或随机数抽取超出了轨迹，说明本次执行与录制时走了不同的路径"""
+
+
+def trace_path(directory, udid):
+    return os.path.join(directory, re.sub(r"[^\w.-]", "_", udid) + ".trace")
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class TraceWriter:
+    """追加写入一台设备的轨迹，命令执行器、随机数发生器和时钟在不同线程中共用"""
+
+    def __init__(self, path, udid, run_id=None):
+        self.path = path
+        self.udid = udid
+        self.commands = 0
+        self._seen = OrderedDict()  # 较大的响应 -> 第几条命令，用于去重
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+        self._write({"k": "run", "run": run_id or uuid.uuid4().hex, "udid": udid, "started": time.time()})
+
+    def _write(self, entry):
+        self._file.write(_dumps(entry) + "\n")
+
+    def command(self, command, params, elapsed, response=None, error=None):
+        """记录一条命令；error 为连接异常时记录异常类型和消息"""
+        parts = ['{"k":"cmd","c":', _dumps(command), ',"p":', _dumps(params), ',"d":', "%.6f" % elapsed]
+        with self._lock:
+            seq = self.commands
+            self.commands += 1
+            if error is not None:
+                parts += [',"e":', _dumps([type(error).__name__, str(error)])]
+            else:
+                body = _dumps(response)
+                same = self._seen.get(body) if len(body) >= DEDUP_MIN_SIZE else None
+                if same is not None:
+                    parts += [',"s":', str(same)]
+                    self._seen.move_to_end(body)
+                else:
+                    parts += [',"r":', body]
+                    if len(body) >= DEDUP_MIN_SIZE:
+                        self._seen[body] = seq
+                        if len(self._seen) > DEDUP_ENTRIES:
+                            self._seen.popitem(last=False)
+            self._file.write("".join(parts) + "}\n")
+
+    def draw(self, kind, value):
+        with self._lock:
+            self._write({"k": kind, "v": value})
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class TraceReader:
+    """读取轨迹中的一次运行，按命令名依次取出录制的响应，按类型依次取出随机数和时钟读数
+
+    同一命令名的响应按录制顺序返回，不要求不同命令之间的顺序一致(截图由后台线程发出，与流程命令交错)。
+    """
+
+    def __init__(self, path, run=-1):
+        self.path = path
+        self.udid = None
+        self.run_id = None
+        self.commands = 0
+        self.replayed = 0
+        self.mismatches = 0  # 参数与录制时不同的命令数
+        self._pending = {}  # 命令名 -> deque(录制的命令)
+        self._draws = {"r": deque(), "b": deque(), "c": deque()}
+        self._lock = threading.Lock()
+        self._load(run)
+
+    def _load(self, run):
+        runs = []
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                entry = json.loads(line)
+                if entry["k"] == "run":
+                    runs.append((entry, []))
+                elif runs:
+                    runs[-1][1].append(entry)
+        if not runs:
+            raise ValueError("{}: no recorded run".format(self.path))
+        header, entries = runs[run]
+        self.udid = header.get("udid")
+        self.run_id = header.get("run")
+        responses = []
+        for entry in entries:
+            kind = entry["k"]
+            if kind == "cmd":
+                if "s" in entry:
+                    entry["r"] = responses[entry["s"]]
+                responses.append(entry.get("r"))
+                entry["p"] = _without_session(entry["p"])
+                self._pending.setdefault(entry["c"], deque()).append(entry)
+                self.commands += 1
+            elif kind in self._draws:
+                self._draws[kind].append(entry["v"])
+
+    def next_command(self, command, params):
+        """取出下一条同名命令的录制记录"""
+        with self._lock:
+            pending = self._pending.get(command)
+            if not pending:
+                raise ReplayDivergence("{}: no more recorded '{}' commands (replayed {} of {})".format(
+                    self.path, command, self.replayed, self.commands))
+            entry = pending.popleft()
+            self.replayed += 1
+            if entry["p"] != _without_session(params):
+                self.mismatches += 1
+                if self.mismatches == 1:
+                    logger.warning("Replay of %s diverged at '%s': recorded %s, got %s",
+                                   self.path, command, entry["p"], params)
+        return entry
+
+    def next_draw(self, kind):
+        with self._lock:
+            draws = self._draws[kind]
+            if not draws:
+                raise ReplayDivergence("{}: no more recorded '{}' draws".format(self.path, kind))
+            return draws.popleft()
+
+    def stats(self):
+        """已回放和剩余的命令数、参数不一致的命令数和剩余的抽取数"""
+        with self._lock:
+            return {
+                "run": self.run_id,
+                "commands": self.commands,
+                "replayed": self.replayed,
+                "remaining": sum(len(pending) for pending in self._pending.values()),
+                "remaining_commands": {command: len(pending) for command, pending in self._pending.items() if pending},
+                "mismatches": self.mismatches,
+                "draws_remaining": sum(len(draws) for draws in self._draws.values()),
+            }
+
+
+def _without_session(params):
+    """用于比较的参数：忽略 sessionId，序列化后比较(tuple 和 list 视为相同)"""
+    return _dumps({key: value for key, value in (params or {}).items() if key != "sessionId"})
+
+
+class RecordingConnection(PooledConnection):
+    """录制模式下单台设备专用的命令执行器，把每条命令的参数、响应和耗时写入轨迹"""
+
+    def __init__(self, url, trace, listener=None, **kwargs):
+        super().__init__(url, listener=listener, **kwargs)
+        self.trace = trace
+
+    def execute(self, command, params):
+        recorded = dict(params)  # 父类会从 params 中删除拼进 URL 的参数(如元素 id)
+        start = time.perf_counter()
+        try:
+            response = super().execute(command, params)
+        except Exception as e:
+            self.trace.command(command, recorded, time.perf_counter() - start, error=e)
+            raise
+        self.trace.command(command, recorded, time.perf_counter() - start, response)
+        return response
+
+
+class ReplayConnection(AppiumConnection):
+    """回放模式的命令执行器：不连接服务，返回轨迹中录制的响应
+
+    speed 为 1.0 时按录制的耗时返回，0 时立即返回。
+    """
+
+    def __init__(self, trace, speed=0.0):
+        super().__init__("http://replay.invalid", keep_alive=False)
+        self.trace = trace
+        self.speed = speed
+
+    def execute(self, command, params):
+        entry = self.trace.next_command(command, params)
+        if self.speed:
+            time.sleep(entry["d"] * self.speed)
+        if "e" in entry:
+            raise ConnectionError("Replayed {}: {}".format(*entry["e"]))  # 与连接异常一样按临时错误处理
+        response = entry["r"]
+        return dict(response) if isinstance(response, dict) else response  # driver 会原地替换 value，同一响应可能被多次返回
+
+
+class RecordingRandom(random.Random):
+    """把每次抽取写入轨迹的 Random；uniform/randint/choice 等都由 random() 和 getrandbits() 派生"""
+
+    def __init__(self, trace, seed=None):
+        self.trace = trace
+        super().__init__(seed)
+
+    def random(self):
+        value = super().random()
+        self.trace.draw("r", value)
+        return value
+
+    def getrandbits(self, k):
+        value = super().getrandbits(k)
+        self.trace.draw("b", value)
+        return value
+
+
+class ReplayRandom(random.Random):
+    """按录制顺序返回抽取结果的 Random"""
+
+    def __init__(self, trace):
+        self.trace = trace
+        super().__init__()
+
+    def random(self):
+        return self.trace.next_draw("r")
+
+    def getrandbits(self, k):
+        return self.trace.next_draw("b")
+
+
+class TraceProfileCache(ScreenProfileCache):
+    """录制和回放时使用的屏幕信息缓存：只保存在内存中，每次运行都会探测一次，两边发出的命令一致"""
+
+    def _load(self):
+        if self._profiles is None:
+            self._profiles = {}
+        return self._profiles
+
+    def _save(self):
+        pass
+
+
+class Recorder:
+    """录制模式：为每台设备创建写入 <directory>/<udid>.trace 的命令执行器、随机数发生器和时钟
+
+    create_driver 可作为 SessionPool 的 driver_factory；每台设备单独一个连接，不与其他设备共享连接池。
+    """
+
+    def __init__(self, directory="traces", pool=None, run_id=None):
+        self.directory = directory
+        self.pool = pool  # 命令耗时仍然回调会话池的 command_listener(服务负载统计)
+        self.run_id = run_id or uuid.uuid4().hex
+        self.profiles = TraceProfileCache()
+        self._traces = {}  # udid -> TraceWriter
+        self._connections = {}  # (udid, url) -> RecordingConnection
+        self._rngs = {}
+        self._lock = threading.Lock()
+
+    def trace(self, udid):
+        with self._lock:
+            trace = self._traces.get(udid)
+            if trace is None:
+                trace = self._traces[udid] = TraceWriter(trace_path(self.directory, udid), udid, self.run_id)
+                logger.debug("Recording %s to %s", udid, trace.path)
+            return trace
+
+    def create_driver(self, url, capabilities):
+        udid = capabilities.get("appium:udid") or "default"
+        trace = self.trace(udid)
+        with self._lock:
+            connection = self._connections.get((udid, url))
+            if connection is None:
+                listener = self.pool.command_listener if self.pool is not None else None
+                connection = self._connections[(udid, url)] = RecordingConnection(url, trace, listener=listener, keep_alive=True)
+        return webdriver.Remote(command_executor=connection, desired_capabilities=capabilities)
+
+    def rng(self, udid):
+        """设备的随机数发生器，跨流程任务保留"""
+        trace = self.trace(udid)
+        with self._lock:
+            if udid not in self._rngs:
+                self._rngs[udid] = RecordingRandom(trace)
+            return self._rngs[udid]
+
+    def clock(self, udid):
+        trace = self.trace(udid)
+
+        def monotonic():
+            value = time.monotonic()
+            trace.draw("c", value)
+            return value
+        return monotonic
+
+    def close(self):
+        with self._lock:
+            connections = list(self._connections.values())
+            traces = list(self._traces.values())
+            self._connections.clear()
+        for connection in connections:
+            connection.close()
+        for trace in traces:
+            trace.close()
+        logger.debug("Recorded %s", {trace.udid: trace.commands for trace in traces})
+
+
+class Replayer:
+    """回放模式：按 udid 读取 <directory>/<udid>.trace，用录制的响应、抽取结果和时钟读数代替设备
+
+    speed 为 1.0 时按录制的命令耗时返回(拟人停顿由驱动方的 pause_scale 控制)，0 时尽快回放；
+    run 选择文件中的第几次运行，默认最后一次。
+    """
+
+    def __init__(self, directory="traces", speed=0.0, run=-1):
+        self.directory = directory
+        self.speed = speed
+        self.run = run
+        self.profiles = TraceProfileCache()
+        self._traces = {}  # udid -> TraceReader
+        self._rngs = {}
+        self._lock = threading.Lock()
+
+    def devices(self):
+        """目录中录制过的设备"""
+        names = sorted(name for name in os.listdir(self.directory) if name.endswith(".trace"))
+        return [self._load(os.path.join(self.directory, name)).udid for name in names]
+
+    def _load(self, path):
+        with self._lock:
+            for trace in self._traces.values():
+                if trace.path == path:
+                    return trace
+            trace = TraceReader(path, self.run)
+            self._traces[trace.udid] = trace
+            return trace
+
+    def trace(self, udid):
+        with self._lock:
+            trace = self._traces.get(udid)
+        return trace if trace is not None else self._load(trace_path(self.directory, udid))
+
+    def create_driver(self, url, capabilities):
+        trace = self.trace(capabilities.get("appium:udid") or "default")
+        return webdriver.Remote(command_executor=ReplayConnection(trace, self.speed), desired_capabilities=capabilities)
+
+    def rng(self, udid):
+        trace = self.trace(udid)
+        with self._lock:
+            if udid not in self._rngs:
+                self._rngs[udid] = ReplayRandom(trace)
+            return self._rngs[udid]
+
+    def clock(self, udid):
+        trace = self.trace(udid)
+        return lambda: trace.next_draw("c")
+
+    def stats(self):
+        """udid -> 回放进度，remaining 和 mismatches 都为 0 时与录制完全一致"""
+        with self._lock:
+            traces = list(self._traces.values())
+        return {trace.udid: trace.stats() for trace in traces}
+
+    def close(self):
+        for udid, stats in self.stats().items():
+            log = logger.warning if stats["remaining"] or stats["mismatches"] else logger.debug
+            log("Replayed %s: %s", udid, stats)
@@ -0,0 +1,278 @@
+import random
+import threading
+import time
+from logger import Logger
+
+logger = Logger("Resilience")
+
+# 错误类型
+SESSION = "session"  # 会话或设备已失效，重试没有意义，需要重建会话
+ELEMENT = "element"  # 元素找不到或不可操作，页面可能还没就绪
+TRANSIENT = "transient"  # 服务端偶发错误或网络超时，退避后重试
+FATAL = "fatal"  # 程序错误(如配置缺失)，不重试
+
+# WebDriverException 的消息中出现这些片段时视为会话失效(UiAutomator2 崩溃、设备断开等)
+SESSION_GONE_MESSAGES = (
+    "invalid session id",
+    "session is either terminated or not started",
+    "instrumentation process is not running",
+    "could not proxy command",
+    "socket hang up",
+    "device offline",
+    "could not find a connected android device",
+)
+
+
+def classify(error):
+    """把异常归为 SESSION / ELEMENT / TRANSIENT / FATAL"""
+    # 出错时才需要，避免启动时加载 selenium 和 urllib3
+    from selenium.common.exceptions import (
+        WebDriverException, InvalidSessionIdException, NoSuchDriverException, SessionNotCreatedException,
+        NoSuchElementException, StaleElementReferenceException, ElementNotInteractableException,
+        ElementClickInterceptedException, InvalidElementStateException, TimeoutException,
+    )
+    from urllib3.exceptions import HTTPError as Urllib3Error
+    if isinstance(error, (InvalidSessionIdException, NoSuchDriverException, SessionNotCreatedException)):
+        return SESSION
+    if isinstance(error, (NoSuchElementException, StaleElementReferenceException, ElementNotInteractableException,
+                          ElementClickInterceptedException, InvalidElementStateException)):
+        return ELEMENT
+    if isinstance(error, TimeoutException):
+        return TRANSIENT
+    if isinstance(error, WebDriverException):
+        message = (error.msg or "").lower()
+        if any(part in message for part in SESSION_GONE_MESSAGES):
+            return SESSION
+        return TRANSIENT
+    if isinstance(error, (Urllib3Error, ConnectionError, TimeoutError)):
+        return TRANSIENT
+    return FATAL
+
+
+class DeviceParked(Exception):
+    """设备连续多次重建会话仍然失败，在 park_seconds 内不再执行流程；retry_after 为暂停期剩余的秒数"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RetryPolicy:
+    """重试和熔断参数，对应配置文件的 resilience 段
+
+    max_attempts: 同一步骤连续失败的最多尝试次数(不含重建会话后的重试)
+    base_delay/multiplier/max_delay/jitter: 第 n 次失败后停顿 min(max_delay, base_delay * multiplier ** (n - 1))，
+        再乘以 [1 - jitter, 1] 之间的随机数，避免多台设备同时重试
+    failure_threshold: 连续失败达到该次数时熔断并重建会话；会话失效的错误立即熔断
+    max_recoveries: 没有一次成功的情况下最多重建会话的次数，超过后暂停设备 park_seconds 秒
+    """
+
+    def __init__(self, max_attempts=5, base_delay=0.5, multiplier=2.0, max_delay=30.0, jitter=0.5,
+                 failure_threshold=3, max_recoveries=3, park_seconds=600):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.multiplier = multiplier
+        self.max_delay = max_delay
+        self.jitter = min(max(jitter, 0.0), 1.0)
+        self.failure_threshold = max(1, failure_threshold)
+        self.max_recoveries = max(1, max_recoveries)
+        self.park_seconds = park_seconds
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(**(config.get("resilience") or {}))
+
+    def backoff(self, attempt, rng=random):
+        """第 attempt 次(从 1 开始)失败后的停顿秒数"""
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (attempt - 1))
+        return delay * rng.uniform(1.0 - self.jitter, 1.0)
+
+
+class CircuitBreaker:
+    """单台设备的熔断器：连续失败达到阈值或会话失效时熔断并重建会话，重建多次仍失败时暂停设备"""
+
+    def __init__(self, udid, policy=None, listener=None):
+        self.udid = udid
+        self.policy = policy or RetryPolicy()
+        self.listener = listener  # listener(udid, event, value)：("error", 错误类型) 或 ("recovered", 恢复耗时)
+        self.consecutive = 0  # 连续失败次数
+        self.recoveries = 0  # 上次成功以来重建会话的次数
+        self.failing_since = None  # 本轮连续失败开始的时间
+        self.parked_until = None
+        self.stats = {"calls": 0, "failures": {}, "retries": 0, "recoveries": 0, "recovery_failures": 0,
+                      "parked": 0, "recovered": 0, "recovery_seconds_total": 0.0, "recovery_seconds_max": 0.0}
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.parked_until is not None:
+            return "parked"
+        return "open" if self.recoveries else "closed"
+
+    def check(self):
+        """设备处于暂停期时抛出 DeviceParked"""
+        with self._lock:
+            if self.parked_until is None:
+                return
+            remaining = self.parked_until - time.monotonic()
+            if remaining <= 0:
+                self.parked_until = None
+                self.consecutive = self.recoveries = 0
+                logger.debug("Device %s is no longer parked", self.udid)
+                return
+        raise DeviceParked("Device {} is parked for another {:.0f}s".format(self.udid, remaining), retry_after=remaining)
+
+    def record_success(self):
+        with self._lock:
+            self.stats["calls"] += 1
+            failing_since = self.failing_since
+            self.consecutive = self.recoveries = 0
+            self.failing_since = None
+            if failing_since is None:
+                return
+            elapsed = time.monotonic() - failing_since
+            self.stats["recovered"] += 1
+            self.stats["recovery_seconds_total"] += elapsed
+            self.stats["recovery_seconds_max"] = max(self.stats["recovery_seconds_max"], elapsed)
+        logger.debug("Device %s recovered after %.2fs", self.udid, elapsed)
+        self._notify("recovered", elapsed)
+
+    def record_failure(self, kind):
+        """记录一次失败，返回是否需要重建会话"""
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats["failures"][kind] = self.stats["failures"].get(kind, 0) + 1
+            self.consecutive += 1
+            if self.failing_since is None:
+                self.failing_since = time.monotonic()
+            trip = kind == SESSION or self.consecutive >= self.policy.failure_threshold
+        self._notify("error", kind)
+        return trip
+
+    def record_retry(self):
+        with self._lock:
+            self.stats["retries"] += 1
+
+    def record_recovery(self, ok):
+        """记录一次会话重建"""
+        with self._lock:
+            if ok:
+                self.stats["recoveries"] += 1
+                self.consecutive = 0  # 新会话重新计数
+            else:
+                self.stats["recovery_failures"] += 1
+            self.recoveries += 1
+
+    def ensure_can_recover(self):
+        """已重建 max_recoveries 次仍未成功时暂停设备并抛出 DeviceParked"""
+        with self._lock:
+            exhausted = self.recoveries >= self.policy.max_recoveries
+        if exhausted:
+            self.park()
+
+    def park(self):
+        with self._lock:
+            self.parked_until = time.monotonic() + self.policy.park_seconds
+            self.stats["parked"] += 1
+        logger.error("Device %s parked for %ss after %d session recoveries without success",
+                     self.udid, self.policy.park_seconds, self.recoveries)
+        raise DeviceParked("Device {} parked after {} session recoveries".format(self.udid, self.recoveries),
+                           retry_after=self.policy.park_seconds)
+
+    def reset(self):
+        """清除暂停状态和失败计数(如设备重新接入)"""
+        with self._lock:
+            self.parked_until = self.failing_since = None
+            self.consecutive = self.recoveries = 0
+
+    def to_dict(self):
+        with self._lock:
+            stats = dict(self.stats, failures=dict(self.stats["failures"]))
+        failed = sum(stats["failures"].values())
+        stats["state"] = self.state
+        stats["error_rate"] = round(failed / stats["calls"], 4) if stats["calls"] else 0.0
+        return stats
+
+    def _notify(self, event, value):
+        if self.listener is not None:
+            self.listener(self.udid, event, value)
+
+
+class BreakerRegistry:
+    """按 udid 保存熔断器，跨流程保留失败计数和暂停状态"""
+
+    def __init__(self, listener=None):
+        self.listener = listener
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, udid, policy=None):
+        with self._lock:
+            breaker = self._breakers.get(udid)
+            if breaker is None:
+                breaker = self._breakers[udid] = CircuitBreaker(udid, policy, self.listener)
+            elif policy is not None:
+                breaker.policy = policy
+            return breaker
+
+    def reset(self, udid):
+        with self._lock:
+            breaker = self._breakers.get(udid)
+        if breaker is not None:
+            breaker.reset()
+
+    def stats(self):
+        """udid -> 调用次数、各类错误次数、重试、重建会话、暂停次数、错误率和恢复耗时"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {breaker.udid: breaker.to_dict() for breaker in breakers}
+
+
+def iter_retry(factory, breaker, recover, on_failure=None, rng=random):
+    """执行 factory() 返回的步骤生成器，失败时按错误类型退避重试，返回步骤的返回值
+
+    停顿以 yield 秒数的形式交给驱动方，可被取消。元素错误和临时错误退避后重试，
+    连续失败 max_attempts 次后抛出最后一个异常；会话失效或连续失败达到阈值时调用 recover() 重建会话，
+    多次重建仍未成功时抛出 DeviceParked；FATAL 错误直接抛出。
+    on_failure(kind, error, attempt) 在每次失败后调用。
+    """
+    policy = breaker.policy
+    attempt = 0
+    while True:
+        breaker.check()
+        try:
+            result = yield from factory()
+        except Exception as e:
+            attempt += 1
+            kind = classify(e)
+            trip = breaker.record_failure(kind)
+            if on_failure is not None:
+                on_failure(kind, e, attempt)
+            if kind == FATAL or (not trip and attempt >= policy.max_attempts):
+                raise
+            breaker.record_retry()
+            yield policy.backoff(attempt, rng)
+            if trip:
+                yield from _iter_recover(breaker, recover, rng)
+                attempt = 0  # 新会话上重新计算尝试次数
+            continue
+        breaker.record_success()
+        return result
+
+
+def _iter_recover(breaker, recover, rng):
+    """重建会话直到成功；重建次数用尽时抛出 DeviceParked"""
+    failures = 0
+    while True:
+        breaker.ensure_can_recover()
+        try:
+            recover()
+        except Exception as e:
+            logger.warning("Failed to recreate session for %s: %s", breaker.udid, e)
+            failures += 1
+            breaker.record_recovery(False)
+            yield breaker.policy.backoff(failures, rng)
+            continue
+        logger.warning("Recreated session for %s", breaker.udid)
+        breaker.record_recovery(True)
+        return
@@ -0,0 +1,133 @@
+import json
+import os
+import threading
+import time
+from logger import Logger
+from locator import PageIndex
+
+logger = Logger("ScreenProfile")
+
+REFERENCE_SIZE = (1080, 2400)  # 手势坐标最初采集时的屏幕尺寸
+
+# 需要探测位置的控件：名称 -> 候选定位方式列表
+DEFAULT_ANCHOR_LOCATORS = {
+    "search_bar": [["xpath", "//*[contains(@content-desc,\"搜索\")]"]],
+}
+
+
+class ScreenProfile:
+    """单台设备的屏幕信息：窗口尺寸、像素密度以及探测到的控件边界"""
+
+    def __init__(self, udid, width, height, density=None, anchors=None):
+        self.udid = udid
+        self.width = width
+        self.height = height
+        self.density = density
+        self.anchors = anchors or {}  # 名称 -> [left, top, right, bottom]
+
+    @property
+    def key(self):
+        """用于缓存编译后手势的键"""
+        return (self.width, self.height, tuple(sorted((name, tuple(bounds)) for name, bounds in self.anchors.items())))
+
+    def point(self, fx, fy):
+        """把屏幕比例坐标换算为像素坐标"""
+        return (fx * self.width, fy * self.height)
+
+    def anchor_point(self, name, fx, fy):
+        """把控件内的比例坐标换算为像素坐标，控件未探测到时返回 None"""
+        bounds = self.anchors.get(name)
+        if not bounds:
+            return None
+        left, top, right, bottom = bounds
+        return (left + fx * (right - left), top + fy * (bottom - top))
+
+    def to_dict(self):
+        return {"width": self.width, "height": self.height, "density": self.density, "anchors": self.anchors, "probed_at": time.time()}
+
+    @classmethod
+    def from_dict(cls, udid, data):
+        return cls(udid, data["width"], data["height"], data.get("density"), data.get("anchors"))
+
+
+DEFAULT_PROFILE = ScreenProfile(None, *REFERENCE_SIZE)
+
+
+class ScreenProfileCache:
+    """按 udid 缓存屏幕信息到本地文件，后续会话无需再次探测"""
+
+    def __init__(self, path=".screen_profiles.json", anchor_locators=None):
+        self.path = path
+        self.anchor_locators = anchor_locators or DEFAULT_ANCHOR_LOCATORS
+        self._lock = threading.Lock()
+        self._profiles = None
+
+    def _load(self):
+        if self._profiles is None:
+            self._profiles = {}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                    self._profiles = {udid: ScreenProfile.from_dict(udid, item) for udid, item in data.items()}
+                except (ValueError, KeyError) as e:
+                    logger.warning("Ignoring corrupt screen profile cache %s: %s", self.path, e)
+        return self._profiles
+
+    def _save(self):
+        data = {udid: profile.to_dict() for udid, profile in self._profiles.items()}
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, driver, udid):
+        """返回设备的屏幕信息，缓存中没有时探测并写入缓存"""
+        if udid is None:
+            return self.probe(driver, udid) or DEFAULT_PROFILE
+        with self._lock:
+            profile = self._load().get(udid)
+        if profile is not None:
+            return profile
+        profile = self.probe(driver, udid)
+        if profile is None:
+            return DEFAULT_PROFILE
+        with self._lock:
+            self._load()[udid] = profile
+            self._save()
+        return profile
+
+    def invalidate(self, udid):
+        """删除某台设备的缓存，下次使用时重新探测"""
+        with self._lock:
+            if self._load().pop(udid, None) is not None:
+                self._save()
+
+    def probe(self, driver, udid):
+        """通过会话探测屏幕尺寸、密度和控件位置，失败时返回 None"""
+        try:
+            size = driver.get_window_size()
+        except Exception as e:
+            logger.error("Failed to probe window size for %s: %s", udid, e)
+            return None
+        try:
+            density = driver.get_display_density()
+        except Exception as e:
+            logger.warning("Failed to probe display density for %s: %s", udid, e)
+            density = None
+        anchors = {}
+        try:
+            index = PageIndex(driver.page_source)  # 所有控件位置用同一份页面源解析
+        except Exception as e:
+            logger.warning("Failed to fetch page source for %s: %s", udid, e)
+            index = None
+        if index is not None:
+            for name, locators in self.anchor_locators.items():
+                for by, value in locators:
+                    node = index.find(by, value)
+                    if node is not None and node["bounds"]:
+                        anchors[name] = node["bounds"]
+                        break
+        logger.debug("Probed screen profile for %s: %sx%s density=%s anchors=%s",
+                     udid, size["width"], size["height"], density, anchors)
+        return ScreenProfile(udid, size["width"], size["height"], density, anchors)
@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import io
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from logger import Logger
+
+try:
+    from PIL import Image  # 可选依赖，用于缩放和转换为 WebP/JPEG
+except ImportError:
+    Image = None
+
+logger = Logger("Screenshots")
+
+_STOP = object()
+
+
+class ScreenshotPipeline:
+    """后台截图管线
+
+    capture() 在调用方线程上限流并立即获取截图，保证拿到的是出错时的画面；后台线程负责解码、
+    按内容哈希去重、可选缩放编码并写入 root/<udid>/<run_id>/，每台设备最多保留 retention 张。
+    """
+
+    def __init__(self, root="screenshots", run_id=None, queue_size=32, min_interval=30, fmt="png",
+                 scale=1.0, quality=80, retention=200, dedup_window=64):
+        self.root = root
+        self.run_id = run_id or datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.min_interval = min_interval  # 同一设备同一标识两次截图的最小间隔(秒)
+        self.fmt = fmt.lower()
+        self.scale = scale
+        self.quality = quality
+        self.retention = retention
+        self.dedup_window = dedup_window
+        self.stats = {"requested": 0, "rate_limited": 0, "dropped": 0, "duplicates": 0, "written": 0, "failed": 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last_capture = {}  # (udid, identifier) -> 上次截图时间
+        self._recent_hashes = {}  # udid -> OrderedDict(hash -> None)
+        self._files = {}  # udid -> deque(已保存的文件路径)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._warned_encoder = False
+
+    @classmethod
+    def from_config(cls, config):
+        options = config.get("screenshots") or {}
+        return cls(**options)
+
+    def capture(self, driver, udid, identifier="default"):
+        """获取一次截图并交给后台保存；被限流、队列已满或获取失败时直接丢弃，返回是否已入队"""
+        key = (udid, identifier)
+        now = time.monotonic()
+        with self._lock:
+            self.stats["requested"] += 1
+            last = self._last_capture.get(key)
+            if last is not None and now - last < self.min_interval:
+                self.stats["rate_limited"] += 1
+                return False
+            self._last_capture[key] = now
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="ScreenshotPipeline", daemon=True)
+                self._worker.start()
+        if self._queue.full():
+            with self._lock:
+                self.stats["dropped"] += 1  # 后台积压时不再向设备请求截图
+            return False
+        taken_at = datetime.now()
+        try:
+            encoded = driver.get_screenshot_as_base64()
+        except Exception as e:
+            with self._lock:
+                self.stats["failed"] += 1
+            logger.error("Failed to take screenshot %s for %s: %s", identifier, udid, e)
+            return False
+        try:
+            self._queue.put_nowait((encoded, udid, identifier, taken_at))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            encoded, udid, identifier, taken_at = item
+            try:
+                self._process(encoded, udid, identifier, taken_at)
+            except Exception as e:
+                with self._lock:
+                    self.stats["failed"] += 1
+                logger.error("Failed to save screenshot %s for %s: %s", identifier, udid, e)
+
+    def _process(self, encoded, udid, identifier, taken_at):
+        png = base64.b64decode(encoded)
+        digest = hashlib.sha1(png).hexdigest()
+        device = udid or "default"
+        with self._lock:
+            recent = self._recent_hashes.setdefault(device, OrderedDict())
+            if digest in recent:
+                recent.move_to_end(digest)
+                self.stats["duplicates"] += 1
+                return
+            recent[digest] = None
+            if len(recent) > self.dedup_window:
+                recent.popitem(last=False)
+
+        data, ext = self._encode(png)
+        directory = os.path.join(self.root, device, self.run_id)
+        os.makedirs(directory, exist_ok=True)
+        safe_identifier = re.sub(r'[^\w.-]', '_', identifier)
+        filename = "{}_{}_{}.{}".format(taken_at.strftime('%H%M%S-%f')[:-3], safe_identifier, digest[:8], ext)
+        path = os.path.join(directory, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with self._lock:
+            self.stats["written"] += 1
+        logger.debug("Screenshot saved to: %s", path)
+        self._enforce_retention(device, path)
+
+    def _encode(self, png):
+        """按配置缩放和转换格式，没有 Pillow 时原样保存 PNG"""
+        if self.fmt == "png" and self.scale == 1.0:
+            return png, "png"
+        if Image is None:
+            if not self._warned_encoder:
+                self._warned_encoder = True
+                logger.warning("Pillow is not installed, saving screenshots as PNG without scaling.")
+            return png, "png"
+        image = Image.open(io.BytesIO(png))
+        if self.scale != 1.0:
+            image = image.resize((max(1, int(image.width * self.scale)), max(1, int(image.height * self.scale))))
+        output = io.BytesIO()
+        if self.fmt in ("jpg", "jpeg"):
+            image.convert("RGB").save(output, "JPEG", quality=self.quality)
+            return output.getvalue(), "jpg"
+        if self.fmt == "webp":
+            image.save(output, "WEBP", quality=self.quality)
+            return output.getvalue(), "webp"
+        image.save(output, "PNG", optimize=True)
+        return output.getvalue(), "png"
+
+    def _enforce_retention(self, device, path):
+        """每台设备最多保留 retention 张截图，超出时删除最旧的"""
+        files = self._files.get(device)
+        if files is None:
+            existing = []
+            for directory, _, names in os.walk(os.path.join(self.root, device)):
+                existing.extend(os.path.join(directory, name) for name in names)
+            existing.sort(key=os.path.getmtime)
+            files = self._files[device] = deque(existing)
+        else:
+            files.append(path)
+        while len(files) > self.retention:
+            oldest = files.popleft()
+            try:
+                os.remove(oldest)
+            except OSError:
+                pass
+
+    def close(self, timeout=10):
+        """处理完队列中剩余的截图后停止后台线程"""
+        if self._worker is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._worker.join(timeout)
+        self._worker = None
+        logger.debug("Screenshot pipeline stats: %s", dict(self.stats))
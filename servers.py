@@ -0,0 +1,295 @@
+import json
+import shutil
+import subprocess
+import threading
+import time
+from logger import Logger
+from session_pool import server_url
+
+logger = Logger("Servers")
+
+
+class Endpoint:
+    """一个 Appium 服务及其负载、延迟统计"""
+
+    def __init__(self, url, weight=1.0):
+        self.url = url.rstrip("/")
+        self.weight = max(float(weight), 0.01)
+        self.assigned = set()  # 分配到该服务的 udid
+        self.latency = None  # 命令耗时的指数滑动平均(秒)
+        self.commands = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.open_until = 0.0  # 命令连续失败后在此时刻(time.monotonic)之前不恢复，/status 正常也不行
+        self.retired = False  # 已从配置中移除，设备迁走后删除
+
+    def load(self, reference_latency=None, extra=0):
+        """按权重和延迟折算后的负载，越小越空闲"""
+        load = (len(self.assigned) + extra) / self.weight
+        if reference_latency and self.latency:
+            load *= max(1.0, self.latency / reference_latency)
+        return load
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "devices": sorted(self.assigned),
+            "latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+            "commands": self.commands,
+            "failures": self.failures,
+            "healthy": self.healthy,
+        }
+
+
+class ServerRegistry:
+    """Appium 服务注册表：把设备分配到负载最低的服务，并根据实时延迟和故障重新平衡"""
+
+    def __init__(self, endpoints, alpha=0.2, failure_threshold=3, slow_factor=2.0, health_timeout=3, cooldown=60):
+        if not endpoints:
+            raise ValueError("At least one Appium endpoint is required.")
+        self.endpoints = {endpoint.url: endpoint for endpoint in endpoints}
+        self.alpha = alpha  # 延迟滑动平均的平滑系数
+        self.failure_threshold = failure_threshold  # 连续失败多少次视为服务故障
+        self.slow_factor = slow_factor  # 延迟超过中位数多少倍视为变慢
+        self.health_timeout = health_timeout
+        self.cooldown = cooldown  # 命令连续失败的服务至少隔离多少秒
+        self._placement = {}  # udid -> url
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def endpoints_from_config(config, extra_endpoints=()):
+        """配置的 servers 列表加上 extra_endpoints，都没有时使用 server/port"""
+        endpoints = []
+        for item in config.get("servers") or []:
+            url = item.get("url") or "http://{}:{}".format(item.get("server", "localhost"), item.get("port", 4723))
+            endpoints.append(Endpoint(url, item.get("weight", 1)))
+        endpoints.extend(extra_endpoints)
+        if not endpoints:
+            endpoints.append(Endpoint(server_url(config)))
+        return endpoints
+
+    @classmethod
+    def from_config(cls, config, extra_endpoints=()):
+        """从配置的 servers 列表创建注册表，未配置时使用 server/port"""
+        return cls(
+            cls.endpoints_from_config(config, extra_endpoints),
+            failure_threshold=config.get("server_failure_threshold", 3),
+            slow_factor=config.get("server_slow_factor", 2.0),
+            cooldown=config.get("server_cooldown", 60),
+        )
+
+    def update(self, endpoints):
+        """替换服务列表(如配置重新加载)：新服务立即参与分配，已移除服务上的设备在下一个步骤边界迁走"""
+        urls = set()
+        with self._lock:
+            for endpoint in endpoints:
+                urls.add(endpoint.url)
+                current = self.endpoints.get(endpoint.url)
+                if current is None:
+                    self.endpoints[endpoint.url] = endpoint
+                    logger.debug("Added endpoint %s", endpoint.url)
+                else:
+                    current.weight = endpoint.weight
+                    if current.retired:
+                        current.retired = False
+                        current.healthy = True
+            for url, endpoint in list(self.endpoints.items()):
+                if url in urls or endpoint.retired:
+                    continue
+                logger.debug("Retiring endpoint %s", url)
+                endpoint.retired = True
+                endpoint.healthy = False
+            self._drop_retired()
+
+    def _drop_retired(self):
+        for url, endpoint in list(self.endpoints.items()):
+            if endpoint.retired and not endpoint.assigned:
+                del self.endpoints[url]
+
+    def _reference_latency(self):
+        """健康服务延迟的(下)中位数"""
+        latencies = sorted(e.latency for e in self.endpoints.values() if e.healthy and e.latency is not None)
+        return latencies[(len(latencies) - 1) // 2] if latencies else None
+
+    def _least_loaded(self, exclude=None):
+        reference = self._reference_latency()
+        candidates = [e for e in self.endpoints.values() if e.healthy and e.url != exclude]
+        if not candidates:
+            active = [e for e in self.endpoints.values() if not e.retired] or list(self.endpoints.values())
+            candidates = [e for e in active if e.url != exclude] or active
+        return min(candidates, key=lambda e: (e.load(reference, extra=1), e.url))
+
+    def place(self, udid):
+        """返回设备应使用的服务地址，已分配且服务健康时保持不变"""
+        with self._lock:
+            url = self._placement.get(udid)
+            if url is not None and self.endpoints[url].healthy:
+                return url
+            if url is not None:
+                self.endpoints[url].assigned.discard(udid)
+                self._drop_retired()
+            endpoint = self._least_loaded()
+            endpoint.assigned.add(udid)
+            self._placement[udid] = endpoint.url
+            logger.debug("Placed %s on %s", udid, endpoint.url)
+            return endpoint.url
+
+    def release(self, udid):
+        """设备离线时释放其分配"""
+        with self._lock:
+            url = self._placement.pop(udid, None)
+            if url is not None:
+                self.endpoints[url].assigned.discard(udid)
+                self._drop_retired()
+
+    def record(self, url, elapsed, ok=True):
+        """记录一次命令的耗时和结果，供 SessionPool 的命令监听回调使用"""
+        endpoint = self.endpoints.get(url.rstrip("/"))
+        if endpoint is None:
+            return
+        with self._lock:
+            endpoint.commands += 1
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.latency = elapsed if endpoint.latency is None else (1 - self.alpha) * endpoint.latency + self.alpha * elapsed
+            else:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                if endpoint.consecutive_failures >= self.failure_threshold and endpoint.healthy:
+                    endpoint.healthy = False
+                    endpoint.open_until = time.monotonic() + self.cooldown
+                    logger.warning("Endpoint %s marked unhealthy after %s consecutive failures", url, endpoint.consecutive_failures)
+
+    def _probe(self, endpoint):
+        """请求服务的 /status，返回耗时(秒)，失败时返回 None"""
+        import urllib.request  # 只有健康检查用到，不在启动时加载
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(endpoint.url + "/status", timeout=self.health_timeout) as response:
+                json.load(response)
+        except Exception as e:
+            logger.warning("Health check failed for %s: %s", endpoint.url, e)
+            return None
+        return time.perf_counter() - start
+
+    def check_health(self):
+        """请求各服务的 /status，更新健康状态；命令连续失败的服务在 cooldown 秒内保持故障"""
+        for endpoint in list(self.endpoints.values()):
+            if endpoint.retired:
+                continue
+            elapsed = self._probe(endpoint)
+            with self._lock:
+                healthy = elapsed is not None and time.monotonic() >= endpoint.open_until
+                if healthy and not endpoint.healthy:
+                    logger.debug("Endpoint %s is healthy again", endpoint.url)
+                    endpoint.consecutive_failures = 0
+                endpoint.healthy = healthy
+            if elapsed is not None:
+                self.record(endpoint.url, elapsed)
+
+    def failover(self, udid):
+        """设备重建会话前调用：当前服务的 /status 不可用时标记为故障，返回设备应使用的(健康)服务地址"""
+        with self._lock:
+            url = self._placement.get(udid)
+            endpoint = self.endpoints.get(url) if url is not None else None
+        if endpoint is not None and endpoint.healthy and self._probe(endpoint) is None:
+            with self._lock:
+                endpoint.healthy = False
+                endpoint.open_until = time.monotonic() + self.cooldown
+            logger.warning("Endpoint %s marked unhealthy during session recovery of %s", endpoint.url, udid)
+        return self.place(udid)
+
+    def rebalance(self):
+        """把故障服务上的设备全部迁走，变慢的服务每次迁走一台；返回 [(udid, 原地址, 新地址)]
+
+        迁移只修改分配关系，设备在下一个步骤边界(或重建会话时)通过 place() 拿到新地址，把会话迁到新的服务。
+        """
+        moves = []
+        with self._lock:
+            reference = self._reference_latency()
+            for endpoint in list(self.endpoints.values()):
+                if not endpoint.assigned:
+                    continue
+                if not endpoint.healthy:
+                    victims = sorted(endpoint.assigned)
+                elif reference and endpoint.latency and endpoint.latency > self.slow_factor * reference and len(endpoint.assigned) > 1:
+                    victims = sorted(endpoint.assigned)[:1]
+                else:
+                    continue
+                for udid in victims:
+                    target = self._least_loaded(exclude=endpoint.url)
+                    if target is endpoint or not target.healthy:
+                        continue
+                    if endpoint.healthy and target.load(reference, extra=1) >= endpoint.load(reference):
+                        continue  # 迁过去也不会更空闲
+                    endpoint.assigned.discard(udid)
+                    target.assigned.add(udid)
+                    self._placement[udid] = target.url
+                    moves.append((udid, endpoint.url, target.url))
+            self._drop_retired()
+        for udid, source, target in moves:
+            logger.debug("Rebalanced %s from %s to %s", udid, source, target)
+        return moves
+
+    def snapshot(self):
+        with self._lock:
+            return [endpoint.to_dict() for endpoint in self.endpoints.values()]
+
+
+class LocalAppiumLauncher:
+    """在本机不同端口上启动多个 Appium 服务"""
+
+    def __init__(self, count, base_port=4723, binary="appium", host="127.0.0.1", extra_args=None, startup_timeout=60):
+        self.count = count
+        self.base_port = base_port
+        self.binary = binary
+        self.host = host
+        self.extra_args = list(extra_args or [])
+        self.startup_timeout = startup_timeout
+        self.processes = []
+
+    def start(self):
+        """启动服务并等待全部就绪，返回 Endpoint 列表"""
+        if shutil.which(self.binary) is None:
+            raise FileNotFoundError("Appium binary not found: {}".format(self.binary))
+        endpoints = []
+        for i in range(self.count):
+            port = self.base_port + i
+            process = subprocess.Popen(
+                [self.binary, "--address", self.host, "--port", str(port)] + self.extra_args,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            self.processes.append(process)
+            endpoints.append(Endpoint("http://{}:{}".format(self.host, port)))
+        deadline = time.monotonic() + self.startup_timeout
+        for endpoint in endpoints:
+            while not self._ready(endpoint.url):
+                if time.monotonic() > deadline:
+                    self.stop()
+                    raise TimeoutError("Appium server {} did not become ready".format(endpoint.url))
+                time.sleep(0.5)
+            logger.debug("Local Appium server ready at %s", endpoint.url)
+        return endpoints
+
+    @staticmethod
+    def _ready(url):
+        import urllib.request
+        try:
+            with urllib.request.urlopen(url + "/status", timeout=2) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    def stop(self):
+        """停止所有启动的服务"""
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        self.processes = []
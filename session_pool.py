@@ -0,0 +1,223 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from logger import Logger
+
+logger = Logger("SessionPool")
+
+
+def build_capabilities(config, device_config=None):
+    """根据配置构造 Appium 会话所需的 capabilities，同一份配置和设备只构造一次，返回副本"""
+    key = ("capabilities", device_config.get("device_name"), device_config.get("udid")) if device_config else ("capabilities",)
+    return dict(config.derive(key, lambda: _build_capabilities(config, device_config)))
+
+
+def _build_capabilities(config, device_config=None):
+    desired_capabilities = {
+        "platformName": config.get("platformName", "Android"),  # 默认平台名称
+        "appium:automationName": config.get("appium:automationName", "UiAutomator2"),  # 默认自动化名称
+        "appium:appPackage": config.get("appium:appPackage", "com.xunmeng.pinduoduo"),  # 默认应用包名
+        "appium:appActivity": config.get("appium:appActivity", ".ui.activity.MainFrameActivity"),  # 默认应用活动
+        "appium:forceAppLaunch": config.get("appium:forceAppLaunch", True),  # 默认强制启动应用
+        "appium:noReset": config.get("appium:noReset", True),  # 默认不重置应用
+        "appium:printPageSourceOnFindFailure": config.get("appium:printPageSourceOnFindFailure", True),  # 默认打印页面源代码
+        "appium:skipDeviceInitialization": config.get("appium:skipDeviceInitialization", True),  # 默认跳过设备初始化
+        "appium:unicodeKeyBoard": config.get("appium:unicodeKeyBoard", True),  # 默认使用 Unicode 键盘
+    }
+
+    if device_config:
+        desired_capabilities["appium:deviceName"] = device_config.get("device_name")
+        desired_capabilities["appium:udid"] = device_config.get("udid")
+    return desired_capabilities
+
+
+def server_url(config, device_config=None):
+    """返回 Appium 服务地址，设备配置中分配了 server_url 时优先使用"""
+    if device_config and device_config.get("server_url"):
+        return device_config["server_url"]
+    server = config.get("server", "localhost")  # 默认服务器地址
+    port = config.get("port", 4723)  # 默认端口
+    return f'http://{server}:{port}'
+
+
+class PooledSession:
+    """会话池中的一个会话条目"""
+
+    def __init__(self, key, driver, url, capabilities):
+        self.key = key
+        self.driver = driver
+        self.url = url
+        self.capabilities = capabilities
+        self.in_use = False
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.uses = 0
+        self.evicted = False  # 设备断开后标记，归还时直接关闭
+
+
+class SessionPool:
+    """按 udid 复用 Appium 会话，出借前做健康检查，失效会话自动重建"""
+
+    def __init__(self, idle_timeout=50, connection_pool_size=16, driver_factory=None, command_listener=None):
+        # idle_timeout 应小于服务端的 newCommandTimeout(默认 60 秒)，超过则不再信任空闲会话
+        self.idle_timeout = idle_timeout
+        self.connection_pool_size = connection_pool_size
+        self.driver_factory = driver_factory or self._create_driver
+        self.command_listener = command_listener  # 每条命令的耗时回调，用于服务负载统计
+        self._sessions = {}  # key(udid) -> PooledSession
+        self._orphans = []  # 设备重新接入时被替换、仍在被已取消的流程使用的会话，归还时关闭
+        self._executors = {}  # server url -> 共享的 PooledConnection
+        self._lock = threading.Lock()
+        self.stats = {"created": 0, "reused": 0, "recreated": 0}
+
+    def executor_for(self, url):
+        """返回某个服务地址共享的命令执行器，同一服务上的会话共用一个 HTTP 连接池"""
+        from connection import PooledConnection  # appium 在第一次建立会话时才导入
+        with self._lock:
+            executor = self._executors.get(url)
+            if executor is None:
+                executor = PooledConnection(
+                    url,
+                    listener=self.command_listener,
+                    keep_alive=True,
+                    init_args_for_pool_manager={"maxsize": self.connection_pool_size},
+                )
+                self._executors[url] = executor
+            return executor
+
+    def _create_driver(self, url, capabilities):
+        from appium import webdriver
+        return webdriver.Remote(
+            command_executor=self.executor_for(url),
+            desired_capabilities=capabilities
+        )
+
+    def acquire(self, config, device_config=None):
+        """获取一个健康的会话，没有可复用的会话时新建"""
+        url = server_url(config, device_config)
+        capabilities = build_capabilities(config, device_config)
+        key = capabilities.get("appium:udid") or url
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is not None:
+                if entry.in_use and entry.evicted:
+                    # 设备断开后很快重新接入，已取消的流程还没归还旧会话：新建会话，旧会话归还时再关闭
+                    logger.debug("Replacing evicted session for %s", key)
+                    self._sessions.pop(key, None)
+                    self._orphans.append(entry)
+                    entry = None
+                elif entry.in_use:
+                    raise RuntimeError("Session for {} is already in use".format(key))
+                else:
+                    entry.in_use = True
+
+        if entry is not None:
+            if entry.url == url and entry.capabilities == capabilities and self.is_healthy(entry):
+                entry.uses += 1
+                entry.last_used = time.monotonic()
+                self.stats["reused"] += 1
+                logger.debug("Reusing session %s for %s", entry.driver.session_id, key)
+                return entry.driver
+            logger.debug("Discarding stale session for %s", key)
+            self._quit(entry)
+            self.stats["recreated"] += 1
+
+        try:
+            driver = self.driver_factory(url, capabilities)
+        except Exception:
+            with self._lock:
+                if self._sessions.get(key) is entry:
+                    self._sessions.pop(key, None)
+            raise
+        new_entry = PooledSession(key, driver, url, capabilities)
+        new_entry.in_use = True
+        new_entry.uses = 1
+        with self._lock:
+            self._sessions[key] = new_entry
+        self.stats["created"] += 1
+        logger.debug("Created session %s for %s", driver.session_id, key)
+        return driver
+
+    def evict(self, key):
+        """丢弃设备的会话(如设备已断开)：空闲会话立即关闭，使用中的会话在归还时关闭"""
+        with self._lock:
+            entry = self._sessions.get(key)
+            if entry is None:
+                return
+            if entry.in_use:
+                entry.evicted = True
+                return
+            self._sessions.pop(key, None)
+        self._quit(entry)
+
+    def is_healthy(self, entry):
+        """检查会话是否仍然可用"""
+        if entry.driver.session_id is None:
+            return False
+        if time.monotonic() - entry.last_used > self.idle_timeout:
+            return False
+        try:
+            entry.driver.current_activity  # 轻量命令，失效会话会抛出异常
+            return True
+        except Exception as e:
+            logger.warning("Session health check failed for %s: %s", entry.key, e)
+            return False
+
+    def release(self, driver, discard=False):
+        """归还会话，discard 为 True 时直接关闭该会话"""
+        with self._lock:
+            orphan = next((e for e in self._orphans if e.driver is driver), None)
+            if orphan is not None:
+                self._orphans.remove(orphan)
+        if orphan is not None:
+            self._quit(orphan)  # 已被新会话替换，不放回池中
+            return
+        with self._lock:
+            entry = next((e for e in self._sessions.values() if e.driver is driver), None)
+            if entry is None:
+                return
+            entry.in_use = False
+            entry.last_used = time.monotonic()
+            discard = discard or entry.evicted
+            if discard:
+                self._sessions.pop(entry.key, None)
+        if discard:
+            self._quit(entry)
+
+    def _quit(self, entry):
+        with self._lock:
+            if self._sessions.get(entry.key) is entry and not entry.in_use:
+                self._sessions.pop(entry.key, None)
+        try:
+            # 只结束会话，不调用 driver.quit()，避免清空同一服务上其他会话共享的连接池
+            from selenium.webdriver.remote.command import Command
+            entry.driver.execute(Command.QUIT)
+            return True
+        except Exception as e:
+            logger.warning("Failed to quit session for %s: %s", entry.key, e)
+            return False
+
+    def close_all(self, timeout=None):
+        """并行关闭池中所有会话(包括仍在使用的)；返回 {"closed": [...], "abandoned": [...]}
+
+        超过 timeout 秒仍未结束或关闭失败的会话记为 abandoned，不再等待。
+        """
+        with self._lock:
+            entries = list(self._sessions.values()) + self._orphans
+            self._sessions.clear()
+            self._orphans = []
+        summary = {"closed": [], "abandoned": []}
+        if entries:
+            executor = ThreadPoolExecutor(max_workers=min(32, len(entries)), thread_name_prefix="SessionQuit")
+            futures = {executor.submit(self._quit, entry): entry for entry in entries}
+            done, _ = wait(futures, timeout=timeout)
+            executor.shutdown(wait=False)
+            for future, entry in futures.items():
+                closed = future in done and future.result()
+                summary["closed" if closed else "abandoned"].append(entry.key)
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors.clear()
+        for executor in executors:
+            executor.close()
+        return summary
@@ -0,0 +1,87 @@
+import threading
+import time
+
+
+class Cancelled(BaseException):
+    """流程被取消；继承 BaseException，不会被流程中的 except Exception 吞掉"""
+
+
+class CancelToken:
+    """协作式取消令牌：流程在每个循环和等待处检查，取消后在下一个检查点抛出 Cancelled"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.RLock()  # 可能在信号处理函数中调用 cancel()，用可重入锁避免自锁
+        self.reason = None
+        self.cancelled_at = None
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self, reason="cancelled"):
+        """取消并依次调用已注册的回调，重复调用无效"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self.cancelled_at = time.monotonic()
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback()
+
+    def add_callback(self, callback):
+        """注册取消时的回调，已取消时立即调用"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled(self.reason)
+
+    def sleep(self, seconds):
+        """可被取消的 sleep"""
+        if self._event.wait(seconds):
+            raise Cancelled(self.reason)
+
+
+def run_steps(steps, sleep=time.sleep, token=None):
+    """同步驱动一个步骤生成器并返回其返回值
+
+    流程以生成器的形式编写：每次 yield 一个需要停顿的秒数，由驱动方决定如何等待。
+    同步驱动直接 sleep，异步编排器则在停顿期间释放线程去驱动其他设备。
+    指定 token 时停顿可被取消，取消后关闭生成器(执行其中的 finally)并抛出 Cancelled。
+    """
+    if token is not None and sleep is time.sleep:
+        sleep = token.sleep
+    try:
+        while True:
+            if token is not None:
+                token.raise_if_cancelled()
+            try:
+                pause = next(steps)
+            except StopIteration as stop:
+                return stop.value
+            if pause:
+                sleep(pause)
+    except Cancelled:
+        steps.close()
+        raise
+
+
+def advance(steps):
+    """推进生成器一步，返回 (是否结束, 停顿秒数或返回值)"""
+    try:
+        return False, next(steps)
+    except StopIteration as stop:
+        return True, stop.value
@@ -0,0 +1,454 @@
+import asyncio
+import collections
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from multiprocessing.connection import wait as wait_ready
+from logger import Logger
+from metrics import MergedMetrics
+from steps import Cancelled
+
+try:
+    import resource  # 不支持的平台(Windows)上不上报 CPU 时间和峰值内存
+except ImportError:
+    resource = None
+
+logger = Logger("Supervisor")
+
+# 主进程和工作进程之间通过管道传递 (类型, 内容)：
+#   主进程 -> 工作进程：("add", (device_config, flow, options))、("remove", udid)、("stop", None)
+#   工作进程 -> 主进程：("ready", {"pid"})、("result", FlowResult.to_dict())、("heartbeat", 状态)、("exit", 状态)
+# 状态包括 pid、负责的设备、当前和峰值 RSS、CPU 时间、指标快照和熔断器统计，由 report_interval 控制上报间隔。
+
+
+def rss_mb():
+    """当前进程的常驻内存(MB)，没有 /proc 时返回峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576
+    except (OSError, ValueError, IndexError, AttributeError):
+        return max_rss_mb()
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux 上 ru_maxrss 的单位是 KB
+
+
+def cpu_seconds():
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class _WorkerLink:
+    """工作进程一侧的管道；事件循环线程和上报线程都会发送消息，发送时加锁"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._lock = threading.Lock()
+
+    def send(self, kind, payload):
+        with self._lock:
+            try:
+                self.conn.send((kind, payload))
+                return True
+            except (OSError, EOFError):
+                return False  # 主进程已退出
+
+
+def _worker_main(conn, index, settings_path, devices, options):
+    """工作进程入口：用本进程内的编排器驱动分配到的设备，按主进程的指令增删设备，定期上报状态"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C 由主进程处理，再通过管道通知工作进程停止
+    import automator  # 流程、会话池和 appium 只在工作进程中加载
+    from config import configs
+    from logger import configure as configure_logging
+    from orchestrator import Orchestrator, FlowJob
+    from screenshots import ScreenshotPipeline
+
+    token = automator.shutdown_token
+    signal.signal(signal.SIGTERM, lambda sig, frame: token.cancel("signal {}".format(sig)))
+    settings = configs.load(settings_path)
+    if settings.get("logging"):
+        configure_logging(**settings.get("logging"))
+    automator.screenshots = ScreenshotPipeline.from_config(settings)
+    shutdown_timeout = settings.get("shutdown_timeout", 20)
+    flow_config = options.get("flow_config")
+    link = _WorkerLink(conn)
+    active = {}  # udid -> device_config
+
+    def factory(flow, device_config, **job_options):
+        config = configs.load(flow_config).for_device(device_config.get("udid")) if flow_config else None
+        return automator.iter_flow(flow, device_config, config=config, **job_options)
+
+    orchestrator = Orchestrator(
+        threads=settings.get("orchestrator_threads", 8),
+        per_endpoint_limit=settings.get("per_server_concurrency", 8),
+        token=token,
+        shutdown_timeout=shutdown_timeout / 2,
+        keep_running=options.get("keep_running", True),
+        pause_scale=options.get("pause_scale", 1.0),
+        on_result=lambda result: link.send("result", result.to_dict()),
+    )
+
+    def add(device_config, flow, job_options):
+        active[device_config["udid"]] = device_config
+        automator.breakers.reset(device_config["udid"])  # 重新接入的设备不再暂停
+        orchestrator.submit(device_config, FlowJob(flow, factory, **job_options),
+                            endpoint=device_config.get("server_url") or "default")
+
+    def status():
+        return {
+            "index": index,
+            "pid": os.getpid(),
+            "devices": sorted(active),
+            "rss_mb": rss_mb(),
+            "max_rss_mb": max_rss_mb(),
+            "cpu_s": cpu_seconds(),
+            "metrics": automator.metrics.snapshot(),
+            "breakers": automator.breakers.stats(),
+        }
+
+    def listen():
+        while True:
+            try:
+                kind, payload = conn.recv()
+            except (EOFError, OSError):
+                token.cancel("supervisor exited")  # 主进程已退出，不再继续执行
+                return
+            if kind == "add":
+                add(*payload)
+            elif kind == "remove":
+                active.pop(payload, None)
+                orchestrator.cancel_device(payload)
+                threading.Thread(target=automator.session_pool.evict, args=(payload,), daemon=True).start()  # 关闭会话可能较慢
+            elif kind == "stop":
+                token.cancel("stopped by supervisor")
+                return
+
+    def report():
+        while True:
+            try:
+                token.sleep(options.get("report_interval", 5.0))
+            except Cancelled:
+                return
+            link.send("heartbeat", status())
+
+    for device_config, flow, job_options in devices:
+        add(device_config, flow, job_options)
+    threading.Thread(target=listen, name="SupervisorLink", daemon=True).start()
+    threading.Thread(target=report, name="SupervisorReport", daemon=True).start()
+    configs.watch(settings.get("config_watch_interval", 2.0))
+    link.send("ready", {"pid": os.getpid()})
+    try:
+        asyncio.run(orchestrator.run())
+    finally:
+        configs.stop()
+        automator.close_sessions(shutdown_timeout / 2)
+        automator.screenshots.close()
+        link.send("exit", status())
+        automator.logger.stop()  # 工作进程退出时不执行 atexit，写完日志再退出
+
+
+class WorkerProcess:
+    """主进程一侧的一个工作进程：负责的设备、管道、重启次数和最近一次上报的状态"""
+
+    def __init__(self, index):
+        self.index = index
+        self.devices = {}  # udid -> (device_config, flow, options)
+        self.process = None
+        self.conn = None
+        self.started_at = None
+        self.restarts = 0  # 连续崩溃次数，稳定运行 stable_seconds 后清零
+        self.restart_at = None  # 计划重启的时间(monotonic)
+        self.stopping = False
+        self.status = {}
+
+    @property
+    def alive(self):
+        return self.process is not None
+
+    def to_dict(self):
+        status = self.status
+        return {
+            "index": self.index,
+            "pid": status.get("pid"),
+            "alive": self.alive,
+            "devices": sorted(self.devices),
+            "restarts": self.restarts,
+            "rss_mb": status.get("rss_mb"),
+            "max_rss_mb": status.get("max_rss_mb"),
+            "cpu_s": status.get("cpu_s"),
+        }
+
+
+class Supervisor:
+    """进程隔离模式：每个工作进程负责一台设备或一组(group_size 台)设备
+
+    主进程只做设备分配、汇总工作进程上报的结果和指标(metrics 为 MergedMetrics)，不加载 appium；
+    工作进程崩溃(退出码非 0)后按 restart_delay 指数退避重启，连续崩溃超过 max_restarts 次后放弃其设备。
+    start_method 默认为 forkserver：工作进程从预先导入了 preload 模块的 forkserver 派生，启动快且共享已加载的代码页。
+    keep_running 为 False 时所有工作进程执行完流程后 run() 返回；flow_config 为流程使用的配置文件，默认读取流程定义中的配置。
+    results 只保留最近 max_results 个结果字典，result_stats 累计成功和失败的任务数。
+    """
+
+    def __init__(self, settings_path, group_size=1, start_method=None, max_restarts=5, restart_delay=1.0,
+                 stable_seconds=60, report_interval=5.0, keep_running=True, pause_scale=1.0, flow_config=None,
+                 token=None, preload=("automator",), on_result=None, max_results=1000):
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.context = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            self.context.set_forkserver_preload(list(preload))
+        self.settings_path = os.path.abspath(settings_path)  # 工作进程可能在不同的工作目录中启动
+        self.group_size = max(1, group_size)
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.stable_seconds = stable_seconds
+        self.keep_running = keep_running
+        self.token = token
+        self.on_result = on_result  # on_result(工作进程, 结果字典)
+        self.options = {
+            "report_interval": report_interval,
+            "keep_running": keep_running,
+            "pause_scale": pause_scale,
+            "flow_config": os.path.abspath(flow_config) if flow_config else None,
+        }
+        self.metrics = MergedMetrics()
+        self.results = collections.deque(maxlen=max_results)
+        self.result_stats = {"ok": 0, "failed": 0}
+        self.workers = []
+        self._next_index = 0
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_config(cls, settings, token=None, **overrides):
+        """按配置的 processes 段创建：{"group_size", "start_method", "max_restarts", "restart_delay", ...}"""
+        options = dict(settings.get("processes") or {}, **overrides)
+        return cls(settings.file_path, token=token, **options)
+
+    def add(self, device_config, flow, **options):
+        """把设备分配给未满的工作进程，没有时启动新的工作进程；可在任意线程中调用"""
+        udid = device_config["udid"]
+        with self._lock:
+            worker = self._owner(udid)
+            if worker is None:
+                worker = next((w for w in self.workers
+                               if not w.stopping and (w.alive or w.restart_at is not None) and len(w.devices) < self.group_size), None)
+            if worker is None:
+                worker = WorkerProcess(self._next_index)
+                self._next_index += 1
+                self.workers.append(worker)
+            worker.devices[udid] = (device_config, flow, options)
+            if worker.alive:
+                self._send(worker, "add", (device_config, flow, options))
+            elif worker.restart_at is None:
+                self._start(worker)
+            # 等待重启的工作进程在重启时带上新设备
+
+    def remove(self, udid):
+        """停止设备的流程；工作进程不再负责任何设备时让它退出"""
+        with self._lock:
+            worker = self._owner(udid)
+            if worker is None:
+                return
+            worker.devices.pop(udid, None)
+            if worker.devices:
+                self._send(worker, "remove", udid)
+            elif worker.alive:
+                worker.stopping = True
+                self._send(worker, "stop", None)
+            else:
+                worker.restart_at = None
+
+    def _owner(self, udid):
+        return next((w for w in self.workers if udid in w.devices), None)
+
+    def _send(self, worker, kind, payload):
+        try:
+            worker.conn.send((kind, payload))
+        except (OSError, EOFError) as e:
+            logger.warning("Failed to send %s to worker %d: %s", kind, worker.index, e)  # 进程已退出，由 run() 处理
+
+    def _start(self, worker):
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=_worker_main,
+            args=(child_conn, worker.index, self.settings_path, list(worker.devices.values()), self.options),
+            name="Worker-{}".format(worker.index),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        worker.process = process
+        worker.conn = parent_conn
+        worker.started_at = time.monotonic()
+        worker.restart_at = None
+        worker.stopping = False
+        logger.debug("Started worker %d (pid %s) for %s", worker.index, process.pid, sorted(worker.devices))
+
+    def run(self):
+        """接收工作进程的消息并重启崩溃的工作进程，直到被取消；keep_running 为 False 时所有工作进程结束后返回结果"""
+        while self.token is None or not self.token.cancelled:
+            with self._lock:
+                live = [w for w in self.workers if w.alive]
+                waiting = [w for w in self.workers if w.restart_at is not None]
+            if not live and not waiting and not self.keep_running:
+                break
+            ready = wait_ready([w.conn for w in live] + [w.process.sentinel for w in live], timeout=0.2)
+            for worker in live:
+                if worker.conn in ready:
+                    self._receive(worker)
+            for worker in live:
+                if worker.process.sentinel in ready:
+                    self._reap(worker)
+            self._restart_due()
+        return list(self.results)
+
+    def _receive(self, worker):
+        try:
+            while worker.conn.poll():
+                kind, payload = worker.conn.recv()
+                self._handle(worker, kind, payload)
+        except (EOFError, OSError):
+            pass  # 工作进程已退出，由 _reap 处理
+
+    def _handle(self, worker, kind, payload):
+        if kind == "result":
+            self.results.append(payload)
+            self.result_stats["ok" if payload["ok"] else "failed"] += 1
+            if payload["ok"]:
+                logger.debug("Flow %s finished on %s in worker %d: %s", payload["flow"], payload["udid"], worker.index, payload["value"])
+            else:
+                logger.error("Flow %s failed on %s in worker %d: %s", payload["flow"], payload["udid"], worker.index, payload["error"])
+            if self.on_result is not None:
+                self.on_result(worker, payload)
+        elif kind in ("heartbeat", "exit"):
+            worker.status = payload
+            self.metrics.update(worker.index, payload["metrics"])
+        elif kind == "ready":
+            worker.status = dict(worker.status, pid=payload["pid"])
+
+    def _reap(self, worker):
+        self._receive(worker)  # 退出前发出的结果和最后一次状态
+        worker.process.join()
+        code = worker.process.exitcode
+        uptime = time.monotonic() - worker.started_at
+        with self._lock:
+            worker.process = None
+            worker.conn.close()
+            if code == 0 or worker.stopping or not worker.devices or (self.token is not None and self.token.cancelled):
+                logger.debug("Worker %d exited with code %s", worker.index, code)
+                if not worker.devices:
+                    self.workers.remove(worker)
+                return
+            if uptime >= self.stable_seconds:
+                worker.restarts = 0
+            worker.restarts += 1
+            if worker.restarts > self.max_restarts:
+                logger.error("Worker %d crashed %d times in a row, giving up on %s", worker.index, worker.restarts, sorted(worker.devices))
+                worker.devices.clear()
+                self.workers.remove(worker)
+                return
+            delay = min(60.0, self.restart_delay * 2 ** (worker.restarts - 1))
+            worker.restart_at = time.monotonic() + delay
+        logger.error("Worker %d (pid %s) exited with code %s, restarting in %.1fs for %s",
+                     worker.index, worker.status.get("pid"), code, delay, sorted(worker.devices))
+
+    def _restart_due(self):
+        now = time.monotonic()
+        with self._lock:
+            for worker in list(self.workers):
+                if worker.restart_at is not None and worker.restart_at <= now and worker.devices:
+                    self._start(worker)
+
+    def stop(self, timeout=20):
+        """通知所有工作进程停止，在 timeout 秒内等待它们归还会话并退出，超时的直接终止；返回被终止的工作进程"""
+        with self._lock:
+            live = [w for w in self.workers if w.alive]
+            for worker in live:
+                worker.stopping = True
+                self._send(worker, "stop", None)
+            for worker in self.workers:
+                worker.restart_at = None
+        deadline = time.monotonic() + timeout
+        while live and time.monotonic() < deadline:
+            ready = wait_ready([w.conn for w in live] + [w.process.sentinel for w in live], timeout=min(0.2, deadline - time.monotonic()))
+            for worker in live:
+                if worker.conn in ready:
+                    self._receive(worker)
+            for worker in [w for w in live if w.process.sentinel in ready]:
+                self._reap(worker)
+            live = [w for w in live if w.alive]
+        for worker in live:
+            logger.warning("Terminating worker %d (pid %s) still running after %ss", worker.index, worker.process.pid, timeout)
+            worker.process.terminate()
+            worker.process.join(5)
+            with self._lock:
+                worker.process = None
+        return [worker.index for worker in live]
+
+    def stats(self):
+        with self._lock:
+            return [worker.to_dict() for worker in self.workers]
+
+
+def run_supervisor(settings, token):
+    """进程隔离模式的主进程：发现设备、分配 Appium 服务、汇总指标，设备的流程在工作进程中执行；返回退出码"""
+    from config import configs
+    from devices import DeviceWatcher
+    from flow_engine import assign_flow
+    from metrics import MetricsServer, SnapshotWriter
+    from servers import ServerRegistry, LocalAppiumLauncher
+
+    shutdown_timeout = settings.get("shutdown_timeout", 20)
+    launcher = None
+    local_endpoints = []
+    if settings.get("local_appium"):
+        launcher = LocalAppiumLauncher(**settings.get("local_appium"))
+        local_endpoints = launcher.start()
+    registry = ServerRegistry.from_config(settings, extra_endpoints=local_endpoints)
+    supervisor = Supervisor.from_config(settings, token=token)
+    exporters = []
+    if settings.get("metrics_port") is not None:
+        exporters.append(MetricsServer(supervisor.metrics, port=settings.get("metrics_port")).start())
+    if settings.get("metrics_snapshot"):
+        exporters.append(SnapshotWriter(supervisor.metrics, **settings.get("metrics_snapshot")).start())
+    device_names = {}  # udid -> device1, device2, ...，按接入顺序命名
+
+    def on_device_added(info):
+        name = device_names.setdefault(info.serial, "device{}".format(len(device_names) + 1))
+        device_config, flow = assign_flow(settings.refresh(), info.serial, name)
+        # 工作进程不向主进程上报命令延迟，这里只按设备数分配服务，不做健康检查和重新平衡
+        device_config["server_url"] = registry.place(info.serial)
+        supervisor.add(device_config, flow)
+
+    def on_device_removed(udid):
+        logger.warning("Device %s disconnected, stopping its flows", udid)
+        registry.release(udid)
+        supervisor.remove(udid)
+
+    def on_config_reloaded(old, new):
+        if new.file_path == settings.file_path:
+            registry.update(ServerRegistry.endpoints_from_config(new, extra_endpoints=local_endpoints))
+
+    configs.add_listener(on_config_reloaded)
+    configs.watch(settings.get("config_watch_interval", 2.0))
+    watcher = DeviceWatcher.from_config(settings, on_added=on_device_added, on_removed=on_device_removed).start()
+    terminated = []
+    try:
+        supervisor.run()
+    finally:
+        watcher.stop()
+        configs.stop()
+        terminated = supervisor.stop(shutdown_timeout)
+        logger.debug("Worker stats: %s, flow results: %s", supervisor.stats(), supervisor.result_stats)
+        if launcher is not None:
+            launcher.stop()
+        for exporter in exporters:
+            exporter.stop()
+    return 1 if terminated else 0
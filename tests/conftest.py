@@ -0,0 +1,69 @@
+import json
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # 各模块在仓库根目录下，没有打包
+
+import logger
+from config import Config
+from fake_appium import FakeAppiumServer
+from screen_profile import ScreenProfileCache
+from screenshots import ScreenshotPipeline
+
+# appium 对 desired_capabilities 等旧写法的弃用警告，只在建立会话的测试中忽略
+APPIUM_DEPRECATIONS = pytest.mark.filterwarnings("ignore::DeprecationWarning")
+
+
+def pytest_collection_modifyitems(items):
+    for item in items:
+        if {"fake_server", "automator_module"} & set(getattr(item, "fixturenames", ())):
+            item.add_marker(APPIUM_DEPRECATIONS)
+
+
+@pytest.fixture(autouse=True, scope="session")
+def log_directory(tmp_path_factory):
+    """日志文件写到临时目录，不写入仓库根目录"""
+    logger.configure(directory=str(tmp_path_factory.mktemp("logs")))
+    yield
+    logger.configure(directory=logger.DEFAULTS["directory"])
+
+
+@pytest.fixture
+def fake_server():
+    """启动一个模拟 Appium 服务，测试结束后停止；需要多个服务时调用返回的工厂函数"""
+    servers = []
+
+    def start(**options):
+        server = FakeAppiumServer(**options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """把字典写成配置文件并加载为 Config"""
+    def make(data, name="config.json"):
+        path = tmp_path / name
+        path.write_text(json.dumps(data), encoding="utf-8")
+        return Config(str(path))
+
+    return make
+
+
+@pytest.fixture
+def automator_module(tmp_path, monkeypatch):
+    """返回 automator 模块：屏幕信息缓存和截图写到临时目录，测试结束后恢复模块级的状态并关闭会话池中的会话"""
+    import automator
+    screenshots = ScreenshotPipeline(root=str(tmp_path / "screenshots"))
+    monkeypatch.setattr(automator, "screen_profiles", ScreenProfileCache(str(tmp_path / "screen_profiles.json")))
+    monkeypatch.setattr(automator, "screenshots", screenshots)
+    monkeypatch.setattr(automator, "placement", None)
+    monkeypatch.setattr(automator.session_pool, "command_listener", None)
+    yield automator
+    automator.session_pool.close_all(timeout=5)
+    screenshots.close()
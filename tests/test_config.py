@@ -0,0 +1,65 @@
+import json
+import os
+import pytest
+from config import ConfigError, ConfigService
+
+
+def write(path, data, mtime):
+    path.write_text(data if isinstance(data, str) else json.dumps(data), encoding="utf-8")
+    os.utime(path, (mtime, mtime))  # 修改时间精度有限，显式设置以保证被识别为修改
+
+
+@pytest.fixture
+def settings(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, {"delay_scale": 1.0, "devices": {"dev-A": {"delay_scale": 0.5}}}, 1000)
+    return path
+
+
+def test_invalid_file_is_rejected_on_load(tmp_path):
+    path = tmp_path / "config.json"
+    write(path, {"port": "4723"}, 1000)
+    with pytest.raises(ConfigError, match="port must be an integer"):
+        ConfigService().load(str(path))
+
+
+def test_reload_applies_new_version_and_device_overrides(settings):
+    service = ConfigService()
+    reloads = []
+    service.add_listener(lambda old, new: reloads.append((old.version, new.version)))
+    device = service.load(str(settings)).for_device("dev-A")
+    assert device.get("delay_scale") == 0.5
+    assert service.check() == []
+
+    write(settings, {"delay_scale": 2.0, "devices": {"dev-A": {"delay_scale": 0.25}}}, 2000)
+    assert service.check() == [str(settings)]
+    latest = device.refresh()
+    assert latest.version == 1 and latest.get("delay_scale") == 0.25
+    assert service.load(str(settings)).get("delay_scale") == 2.0
+    assert reloads == [(0, 1)]
+
+
+@pytest.mark.parametrize("content", ["{not json", json.dumps({"delay_scale": "fast"})])
+def test_invalid_reload_keeps_previous_version(settings, content):
+    service = ConfigService()
+    reloads = []
+    service.add_listener(lambda old, new: reloads.append(new.version))
+    config = service.load(str(settings))
+
+    write(settings, content, 2000)
+    assert service.check() == []
+    assert config.refresh() is config and config.get("delay_scale") == 1.0
+    assert service.check() == []  # 文件没有再次修改，不重复报错
+
+    write(settings, {"delay_scale": 3.0}, 3000)
+    assert service.check() == [str(settings)]
+    assert config.refresh().get("delay_scale") == 3.0
+    assert reloads == [1]
+
+
+def test_config_is_read_only(settings):
+    config = ConfigService().load(str(settings))
+    with pytest.raises(TypeError):
+        config.config_data["delay_scale"] = 0
+    with pytest.raises(TypeError):
+        config.get("devices")["dev-A"]["delay_scale"] = 0
@@ -0,0 +1,54 @@
+import queue
+import pytest
+from devices import AdbClient, DeviceWatcher
+from fake_adb import FakeAdbServer
+
+
+@pytest.fixture
+def adb():
+    server = FakeAdbServer().start()
+    yield server
+    server.stop()
+
+
+def next_event(events):
+    return events.get(timeout=5)
+
+
+@pytest.mark.parametrize("use_track", [True, False])
+def test_watcher_reports_add_remove_and_readd(adb, use_track):
+    events = queue.Queue()
+    watcher = DeviceWatcher(
+        AdbClient(port=adb.port),
+        on_added=lambda info: events.put(("added", info.serial, info.model)),
+        on_removed=lambda serial: events.put(("removed", serial)),
+        poll_interval=0.05,
+        use_track=use_track,
+    ).start()
+    try:
+        adb.set_device("emulator-5554", **{"ro.product.model": "Pixel 8"})
+        assert next_event(events) == ("added", "emulator-5554", "Pixel 8")
+        shell_commands = len(adb.shell_commands)
+
+        adb.remove_device("emulator-5554")
+        assert next_event(events) == ("removed", "emulator-5554")
+
+        adb.set_device("emulator-5554", **{"ro.product.model": "Pixel 8"})
+        assert next_event(events) == ("added", "emulator-5554", "Pixel 8")
+        assert len(adb.shell_commands) == shell_commands  # 重新接入时使用缓存的设备属性
+        assert [info["serial"] for info in watcher.snapshot()] == ["emulator-5554"]
+    finally:
+        watcher.stop()
+
+
+def test_offline_device_is_not_ready(adb):
+    events = queue.Queue()
+    watcher = DeviceWatcher(AdbClient(port=adb.port), on_added=lambda info: events.put(info.serial), poll_interval=0.05).start()
+    try:
+        adb.set_device("emulator-5556", state="offline")
+        adb.set_device("emulator-5554")
+        assert next_event(events) == "emulator-5554"
+        adb.set_device("emulator-5556")  # 授权或上线后才视为接入
+        assert next_event(events) == "emulator-5556"
+    finally:
+        watcher.stop()
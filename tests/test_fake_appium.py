@@ -0,0 +1,32 @@
+import http.client
+import json
+import pytest
+
+
+def request(connection, method, path, body=None):
+    connection.request(method, path, body=json.dumps(body) if body is not None else None,
+                       headers={"Content-Type": "application/json"})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read() or b"null")
+
+
+def test_failures_are_injected_only_on_matching_session_commands(fake_server):
+    server = fake_server(failure_rate=1.0, failure_pattern="actions")
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=5)
+    assert request(connection, "GET", "/status")[0] == 200
+    status, value = request(connection, "POST", "/session", {"capabilities": {"alwaysMatch": {}}})
+    session = "/session/" + value["value"]["sessionId"]
+    assert request(connection, "GET", session + "/source")[0] == 200
+    assert request(connection, "POST", session + "/actions", {"actions": []})[0] == 500
+    assert server.failures == 1
+    assert request(connection, "DELETE", session)[0] == 200
+    assert request(connection, "GET", session + "/source")[0] == 404  # 会话已结束
+
+
+def test_stop_closes_keep_alive_connections(fake_server):
+    server = fake_server()
+    connection = http.client.HTTPConnection(server.host, server.port, timeout=5)
+    assert request(connection, "GET", "/status")[0] == 200
+    server.stop()
+    with pytest.raises((ConnectionError, http.client.HTTPException, OSError)):
+        request(connection, "GET", "/status")
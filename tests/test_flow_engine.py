@@ -0,0 +1,110 @@
+import random
+import time
+import pytest
+from flow_engine import Compiler, FlowDefinitionError, FlowLibrary, assign_flow
+from resilience import CircuitBreaker, RetryPolicy
+from steps import CancelToken, run_steps
+
+
+class Runner:
+    """最小的流程执行方，记录动作调用"""
+
+    def __init__(self, seed=1):
+        self.calls = []
+        self.observed = []
+        self.delays = []
+        self.rng = random.Random(seed)
+        self.clock = time.monotonic
+        self.token = CancelToken()
+        self.breaker = CircuitBreaker("dev-A", RetryPolicy(base_delay=0.0))
+        self.failures = 0
+
+    def sync_config(self):
+        pass
+
+    def observe_step(self, name, elapsed, ok):
+        self.observed.append((name, ok))
+
+    def human_delay(self, min_delay, max_delay):
+        self.delays.append((min_delay, max_delay))
+        yield min_delay
+
+    def step_failed(self, name):
+        return None
+
+    def recover_session(self):
+        self.calls.append("recover")
+
+    def tap(self, label="home"):
+        self.calls.append(label)
+
+    def flaky(self):
+        if self.failures < 1:
+            self.failures += 1
+            raise ConnectionError("connection reset")
+        self.calls.append("flaky")
+
+
+ACTIONS = {"tap": "tap", "flaky": "flaky"}
+
+
+def run(definition, variables=None, runner=None):
+    runner = runner or Runner()
+    flow = Compiler(ACTIONS).compile("test", definition)
+    return run_steps(flow.iter_run(runner, variables or {}), sleep=lambda seconds: None), runner
+
+
+def test_loop_runs_budget_from_variables():
+    iterations, runner = run({"steps": [{"name": "browse", "loop": {"iterations": "$max_iterations"},
+                                         "steps": [{"action": "tap", "args": {"label": "$keyword"}}, {"delay": [0.5, 1.5]}]}]},
+                             {"max_iterations": 3, "keyword": "shoes"})
+    assert iterations == 3
+    assert runner.calls == ["shoes"] * 3 and runner.delays == [(0.5, 1.5)] * 3
+    assert runner.observed == [("browse", True)] * 3
+
+
+def test_choice_follows_probabilities():
+    definition = {"steps": [{"loop": {"iterations": 200}, "steps": [{"choice": [
+        {"probability": 0.25, "steps": [{"action": "tap", "args": {"label": "rare"}}]},
+        {"steps": [{"action": "tap", "args": {"label": "common"}}]},
+    ]}]}]}
+    _, runner = run(definition)
+    assert 30 < runner.calls.count("rare") < 70 and len(runner.calls) == 200
+
+
+def test_retry_loop_recovers_and_continues():
+    iterations, runner = run({"steps": [{"loop": {"iterations": 2}, "retry": True, "steps": [{"action": "flaky"}]}]})
+    assert iterations == 2 and runner.calls == ["flaky", "flaky"]
+
+
+@pytest.mark.parametrize("definition, location", [
+    ({"steps": [{"action": "fly"}]}, "test.steps[0].action"),
+    ({"steps": [{"delay": [2, 1]}]}, "test.steps[0].delay"),
+    ({"steps": [{"loop": {"iterations": -1}, "steps": [{"delay": [0, 1]}]}]}, "test.steps[0].loop.iterations"),
+    ({"steps": [{"choice": [{"probability": 0.7, "steps": [{"delay": [0, 1]}]},
+                            {"probability": 0.6, "steps": [{"delay": [0, 1]}]}]}]}, "test.steps[0].choice"),
+    ({"steps": []}, "test"),
+])
+def test_invalid_definitions_report_location(definition, location):
+    with pytest.raises(FlowDefinitionError) as error:
+        Compiler(ACTIONS).compile("test", definition)
+    assert str(error.value).startswith(location + ":")
+
+
+def test_shipped_flows_compile_and_run_on_fake_server(fake_server, make_config, automator_module):
+    for name in automator_module.flow_library.names():
+        assert automator_module.flow_library.get(name).root.steps
+    server = fake_server()
+    config = make_config({"wait_poll_interval": 0.01, "delay_scale": 0.0})
+    device_config, flow = assign_flow(config, "dev-A", "device1")
+    device_config["server_url"] = server.url
+    steps = automator_module.iter_flow(flow, device_config, config=config, max_iterations=3)
+    assert run_steps(steps, sleep=lambda seconds: None) == 3
+    assert server.count("POST", "/actions$") >= 3  # 每一轮至少执行一次滑动
+
+
+def test_flow_library_caches_compiled_flows(automator_module):
+    library = FlowLibrary(automator_module.FLOW_ACTIONS)
+    assert library.get("swip") is library.get("swip")
+    with pytest.raises(KeyError):
+        library.get("missing")
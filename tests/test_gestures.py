@@ -0,0 +1,62 @@
+import random
+import gestures
+from gestures import CompiledGesture, Pause, Swipe, Tap, build_payload
+from screen_profile import ScreenProfile
+from session_pool import SessionPool
+
+PROFILE = ScreenProfile("dev-A", 1080, 2400)
+
+
+def moves(actions):
+    return [(action["x"], action["y"]) for action in actions if action["type"] == "pointerMove"]
+
+
+def test_burst_is_one_pointer_source():
+    payload = build_payload(gestures.HOME_SCROLL_BURST, PROFILE, random.Random(1))
+    assert len(payload["actions"]) == 1
+    actions = payload["actions"][0]["actions"]
+    assert [action["type"] for action in actions].count("pointerDown") == 3
+    pauses = [action["duration"] for action in actions if action["type"] == "pause"]
+    assert len(pauses) == 2 and all(150 <= duration <= 400 for duration in pauses)
+
+
+def test_jitter_stays_within_bounds_and_is_shared_by_one_gesture():
+    swipe = Swipe((0.5, 0.8), (0.5, 0.3), jitter=(0.1, 0.01))
+    compiled = swipe.compile(PROFILE)
+    assert compiled.jitter == (108, 24)
+    rng = random.Random(7)
+    for _ in range(200):
+        (x1, y1), (x2, y2) = moves(compiled.render(rng))
+        assert abs(x1 - 540) <= 108 and abs(y1 - 1920) <= 24
+        assert (x2 - x1, y2 - y1) == (0, -1200)  # 起止点使用同一个偏移
+
+
+def test_compiled_once_per_screen():
+    swipe = Swipe((0.5, 0.8), (0.5, 0.3))
+    assert swipe.compile(PROFILE) is swipe.compile(ScreenProfile("dev-B", 1080, 2400))
+    assert swipe.compile(PROFILE) is not swipe.compile(ScreenProfile("dev-C", 720, 1600))
+
+
+def test_tap_prefers_probed_anchor():
+    tap = Tap((0.1, 0.1), anchor="search_bar", anchor_point=(0.5, 0.5))
+    probed = ScreenProfile("dev-A", 1080, 2400, anchors={"search_bar": [100, 100, 300, 200]})
+    assert moves(tap.compile(probed).render()) == [(200, 150)]
+    assert moves(tap.compile(PROFILE).render()) == [(108, 240)]
+    assert [action["duration"] for action in tap.compile(PROFILE).render() if action["type"] == "pause"] == [100]
+
+
+def test_pause_after_is_appended():
+    actions = CompiledGesture((("pointerUp", 0, None, None),), (0, 0), pause_after=300).render()
+    assert actions[-1] == {"type": "pause", "duration": 300}
+    assert Pause(50).render() == [{"type": "pause", "duration": 50}]
+
+
+def test_perform_sends_one_actions_command(fake_server, make_config):
+    server = fake_server()
+    pool = SessionPool()
+    driver = pool.acquire(make_config({}), {"udid": "dev-A", "server_url": server.url})
+    before = server.count("POST", "/actions$")
+    gestures.perform(driver, *gestures.HOME_SCROLL_BURST, profile=PROFILE)
+    assert server.count("POST", "/actions$") - before == 1
+    assert len(moves(server.performed_actions[-1][0]["actions"])) == 6
+    pool.close_all()
@@ -0,0 +1,33 @@
+import pytest
+from locator import AppiumBy, PageIndex, parse_selector, translate
+
+PAGE = """<hierarchy>
+<android.widget.TextView text='say "hi" \\ now' resource-id="app:id/title" bounds="[0,0][100,50]"/>
+</hierarchy>"""
+
+
+@pytest.mark.parametrize("xpath, expected", [
+    ('//*[@content-desc="搜索"]', (AppiumBy.ACCESSIBILITY_ID, "搜索")),
+    ('//*[@resource-id="app:id/title"]', (AppiumBy.ID, "app:id/title")),
+    ('//android.widget.EditText[@content-desc="搜索"]',
+     (AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().className("android.widget.EditText").description("搜索")')),
+    ('//*[contains(@text,"商品")]', (AppiumBy.ANDROID_UIAUTOMATOR, 'new UiSelector().textContains("商品")')),
+    ('//*[@clickable="true"]', (AppiumBy.XPATH, '//*[@clickable="true"]')),  # 没有对应的 UiSelector 方法
+    ('//android.widget.FrameLayout/android.widget.TextView', (AppiumBy.XPATH, '//android.widget.FrameLayout/android.widget.TextView')),
+])
+def test_translate(xpath, expected):
+    assert translate(AppiumBy.XPATH, xpath) == expected
+
+
+def test_translate_leaves_other_strategies_alone():
+    assert translate(AppiumBy.ID, "app:id/title") == (AppiumBy.ID, "app:id/title")
+
+
+def test_translate_escapes_uiselector_arguments():
+    xpath = """//android.widget.TextView[@text='say "hi" \\ now']"""
+    by, value = translate(AppiumBy.XPATH, xpath)
+    assert (by, value) == (AppiumBy.ANDROID_UIAUTOMATOR,
+                           'new UiSelector().className("android.widget.TextView").text("say \\"hi\\" \\\\ now")')
+    selector = parse_selector(by, value)
+    assert selector.value == 'say "hi" \\ now'
+    assert PageIndex(PAGE).find(by, value) is not None
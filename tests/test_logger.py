@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+import queue
+import time
+import pytest
+import logger
+from logger import Logger, _Backend, _RotatingFile
+
+
+def record(level, message="message"):
+    return logging.LogRecord("Test", level, "", 0, message, None, None)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    """独立的日志后端，不影响其他测试共用的后端"""
+    instance = _Backend()
+    instance.options.update(directory=str(tmp_path), console=False)
+    yield instance
+    instance.stop(timeout=0.1)
+
+
+def test_rotation_keeps_backup_count(tmp_path):
+    file = _RotatingFile(str(tmp_path), "app.log", "", ".log", max_bytes=50, backup_count=2)
+    for i in range(6):
+        file.write(b"%019d\n" % i)
+    file.close()
+    assert sorted(os.listdir(str(tmp_path))) == ["app.log", "app.log.1", "app.log.2"]
+    assert os.path.getsize(str(tmp_path / "app.log")) <= 50
+
+
+def test_full_queue_drops_and_reports(backend):
+    backend.queue = queue.Queue(maxsize=1)  # 没有写线程消费，模拟写盘跟不上
+    backend.options["block_timeout"] = 0.01
+    backend.enqueue(record(logging.DEBUG))
+    for _ in range(3):
+        backend.enqueue(record(logging.DEBUG))
+    backend.enqueue(record(logging.ERROR))
+    assert backend.stats()["dropped"] == {"DEBUG": 3, "ERROR": 1}
+    summary = backend._drop_summary()
+    assert summary.levelno == logging.WARNING and "Dropped 4 log records" in summary.getMessage()
+    assert backend._drop_summary() is None  # 只报告新的丢弃
+
+
+def test_stop_is_bounded_when_writer_is_stuck(backend):
+    backend.queue = queue.Queue(maxsize=1)
+    backend.queue.put(record(logging.INFO))
+    start = time.monotonic()
+    assert backend.stop(timeout=0.2) is False
+    assert time.monotonic() - start < 1
+
+
+def test_stop_flushes_queued_records(backend, tmp_path):
+    backend.options.update(filename="app.log")
+    for i in range(100):
+        backend.enqueue(record(logging.INFO, "line {}".format(i)))
+    assert backend.stop(timeout=5) is True
+    assert backend.stats()["written"] == 100
+    with open(str(tmp_path / "app.log"), encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 100
+
+
+def test_per_device_json_files(tmp_path):
+    previous = dict(logger._backend.options)
+    logger.configure(directory=str(tmp_path), per_device=True, json=True, console=False)
+    try:
+        Logger("Test").bind(udid="dev-A").warning("Moved %s", "dev-A")
+        Logger("Test").warning("Shared")
+        assert logger._backend.stop(timeout=5)
+    finally:
+        logger.configure(**previous)
+    names = sorted(os.listdir(str(tmp_path)))
+    [device_file] = [name for name in names if name.endswith(".dev-A.jsonl")]
+    with open(str(tmp_path / device_file), encoding="utf-8") as f:
+        entry = json.loads(f.readline())
+    assert entry["udid"] == "dev-A" and entry["message"] == "Moved dev-A" and entry["level"] == "WARNING"
+    assert any(name.endswith(".jsonl") and "dev-A" not in name for name in names)  # 不带 udid 的日志写入公共文件
@@ -0,0 +1,80 @@
+import json
+import urllib.request
+import pytest
+from metrics import BUCKETS, Histogram, MergedMetrics, Metrics, MetricsServer, SnapshotWriter, instrument_driver
+
+
+def test_histogram_buckets_are_upper_bounds():
+    histogram = Histogram()
+    for value in (0.001, 0.0011, 0.3, 100):
+        histogram.observe(value)
+    counts = histogram.to_dict()["buckets"]
+    assert counts[BUCKETS.index(0.001)] == 1  # 等于上界的值落在该桶
+    assert counts[BUCKETS.index(0.0025)] == 1
+    assert counts[BUCKETS.index(0.5)] == 1
+    assert counts[-1] == 1  # +Inf
+    assert histogram.quantile(0.5) == 0.0025 and histogram.quantile(1.0) == float("inf")
+
+
+def test_prometheus_text_is_cumulative_and_escaped():
+    metrics = Metrics()
+    metrics.observe("dev-A", "search", 0.02)
+    metrics.observe("dev-A", "search", 0.2)
+    metrics.error('dev"B', "swipe")
+    lines = metrics.to_prometheus().splitlines()
+    assert "# TYPE automator_step_seconds histogram" in lines
+    assert 'automator_step_seconds_bucket{device="dev-A",step="search",le="0.01"} 0' in lines
+    assert 'automator_step_seconds_bucket{device="dev-A",step="search",le="0.025"} 1' in lines
+    assert 'automator_step_seconds_bucket{device="dev-A",step="search",le="+Inf"} 2' in lines
+    assert 'automator_step_seconds_count{device="dev-A",step="search"} 2' in lines
+    assert 'automator_step_errors_total{device="dev\\"B",step="swipe"} 1' in lines
+
+
+def test_timer_records_errors():
+    metrics = Metrics()
+    with pytest.raises(ValueError):
+        with metrics.timer("dev-A", "prepare"):
+            raise ValueError("boom")
+    snapshot = metrics.snapshot()
+    assert snapshot["steps"][0]["count"] == 1
+    assert snapshot["errors"] == [{"device": "dev-A", "step": "prepare", "count": 1}]
+
+
+def test_instrumented_driver_counts_commands_and_failures():
+    class Driver:
+        def execute(self, command, params=None):
+            if command == "findElement":
+                raise RuntimeError("no such element")
+            return {"value": None}
+
+    metrics = Metrics()
+    driver = instrument_driver(Driver(), metrics, "dev-A")
+    assert instrument_driver(driver, metrics, "dev-A") is driver
+    driver.execute("getPageSource")
+    with pytest.raises(RuntimeError):
+        driver.execute("findElement")
+    snapshot = metrics.snapshot()
+    assert sorted(item["command"] for item in snapshot["commands"]) == ["findElement", "getPageSource"]
+    assert snapshot["command_errors"] == [{"device": "dev-A", "command": "findElement", "count": 1}]
+    assert "automator_command_errors_total" in metrics.to_prometheus()
+
+
+def test_merged_metrics_and_exporters(tmp_path):
+    first, second = Metrics(), Metrics()
+    first.observe("dev-A", "search", 0.1)
+    second.observe("dev-B", "search", 0.1)
+    merged = MergedMetrics()
+    merged.update(0, first.snapshot())
+    merged.update(1, second.snapshot())
+    assert sorted(item["device"] for item in merged.snapshot()["steps"]) == ["dev-A", "dev-B"]
+
+    server = MetricsServer(merged, port=0, host="127.0.0.1").start()
+    try:
+        with urllib.request.urlopen("http://127.0.0.1:{}/metrics".format(server.port), timeout=5) as response:
+            assert 'device="dev-B"' in response.read().decode("utf-8")
+    finally:
+        server.stop()
+    path = str(tmp_path / "metrics.json")
+    SnapshotWriter(merged, path=path).write()
+    with open(path, encoding="utf-8") as f:
+        assert len(json.load(f)["steps"]) == 2
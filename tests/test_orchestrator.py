@@ -0,0 +1,55 @@
+import asyncio
+import threading
+import time
+from orchestrator import Orchestrator, FlowJob
+
+
+def counting_flow(flow, device_config, steps=2, fail=False):
+    for _ in range(steps):
+        yield 0.01
+    if fail:
+        raise RuntimeError("boom")
+    return device_config["udid"]
+
+
+def test_results_are_reported_as_they_finish_and_bounded():
+    reported = []
+    orchestrator = Orchestrator(threads=2, pause_scale=0.0, max_results=3, on_result=reported.append)
+    for i in range(5):
+        orchestrator.submit({"udid": "dev-{}".format(i)}, FlowJob("count", counting_flow, fail=i == 4))
+    results = asyncio.run(orchestrator.run())
+    assert len(reported) == 5 and all(result.finished_at for result in reported)
+    assert len(results) == 3 and results == list(orchestrator.results)
+    assert orchestrator.stats == {"ok": 4, "failed": 1, "cancelled": 0}
+    assert [result.error for result in reported if not result.ok] == ["RuntimeError: boom"]
+
+
+def test_jobs_on_one_device_run_in_order():
+    orchestrator = Orchestrator(threads=4, pause_scale=0.0)
+    for steps in (3, 1, 2):
+        orchestrator.submit({"udid": "dev-A"}, FlowJob("count", counting_flow, steps=steps))
+    results = asyncio.run(orchestrator.run())
+    assert [result.flow for result in results] == ["count"] * 3
+    assert all(a.finished_at <= b.started_at for a, b in zip(results, results[1:]))
+
+
+def test_per_endpoint_limit_bounds_concurrent_steps():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def busy_flow(flow, device_config):
+        for _ in range(3):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.01)
+            with lock:
+                active.pop()
+            yield 0
+
+    orchestrator = Orchestrator(threads=8, per_endpoint_limit=2, pause_scale=0.0)
+    for i in range(6):
+        orchestrator.submit({"udid": "dev-{}".format(i)}, FlowJob("busy", busy_flow), endpoint="http://a:4723")
+    asyncio.run(orchestrator.run())
+    assert max(peak) == 2
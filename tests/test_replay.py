@@ -0,0 +1,65 @@
+import json
+import pytest
+from flow_engine import assign_flow
+from replay import Recorder, Replayer, ReplayDivergence, TraceReader, TraceWriter, DEDUP_MIN_SIZE, trace_path
+from screenshots import ScreenshotPipeline
+from steps import run_steps
+
+
+def run_flow(automator, monkeypatch, traces, config, device_config, root):
+    """以录制或回放模式执行一次流程；截图按时间限流，每次运行使用新的截图管线"""
+    screenshots = ScreenshotPipeline(root=root)
+    monkeypatch.setattr(automator, "traces", traces)
+    monkeypatch.setattr(automator, "screenshots", screenshots)
+    monkeypatch.setattr(automator.session_pool, "driver_factory", traces.create_driver)
+    try:
+        steps = automator.iter_flow("swip", device_config, config=config, max_iterations=3)
+        return run_steps(steps, sleep=lambda seconds: None)
+    finally:
+        automator.session_pool.close_all(timeout=5)  # 回放时不能复用录制时的会话
+        screenshots.close()
+
+
+def test_record_then_replay_without_mismatches(fake_server, make_config, automator_module, monkeypatch, tmp_path):
+    server = fake_server()
+    config = make_config({"wait_poll_interval": 0.01, "delay_scale": 0.0})
+    device_config, _ = assign_flow(config, "dev-A", "device1")
+    device_config["server_url"] = server.url
+    directory = str(tmp_path / "traces")
+
+    recorder = Recorder(directory, pool=automator_module.session_pool)
+    try:
+        assert run_flow(automator_module, monkeypatch, recorder, config, device_config, str(tmp_path / "recorded")) == 3
+    finally:
+        recorder.close()
+    recorded = server.count()
+    server.stop()  # 回放不连接服务
+
+    replayer = Replayer(directory)
+    assert replayer.devices() == ["dev-A"]
+    assert run_flow(automator_module, monkeypatch, replayer, config, device_config, str(tmp_path / "replayed")) == 3
+    stats = replayer.stats()["dev-A"]
+    assert stats["replayed"] == stats["commands"] > 0
+    assert stats["commands"] <= recorded
+    assert stats["remaining"] == 0 and stats["mismatches"] == 0 and stats["draws_remaining"] == 0
+
+
+def test_trace_dedups_large_responses_and_reports_divergence(tmp_path):
+    path = trace_path(str(tmp_path), "emulator-5554:1")
+    source = {"status": 200, "value": "x" * DEDUP_MIN_SIZE}
+    writer = TraceWriter(path, "emulator-5554:1")
+    writer.command("getPageSource", {"sessionId": "a"}, 0.01, source)
+    writer.command("getPageSource", {"sessionId": "a"}, 0.01, source)
+    writer.draw("r", 0.5)
+    writer.close()
+    with open(path, encoding="utf-8") as f:
+        entries = [json.loads(line) for line in f]
+    assert entries[2]["s"] == 0 and "r" not in entries[2]
+
+    reader = TraceReader(path)
+    for _ in range(2):
+        assert reader.next_command("getPageSource", {"sessionId": "b"})["r"] == source  # 忽略 sessionId
+    assert reader.next_draw("r") == 0.5
+    assert reader.stats()["mismatches"] == 0
+    with pytest.raises(ReplayDivergence):
+        reader.next_command("getPageSource", {})
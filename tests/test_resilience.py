@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+import pytest
+from orchestrator import Orchestrator, FlowJob
+from resilience import CircuitBreaker, DeviceParked, RetryPolicy, SESSION, TRANSIENT, iter_retry
+from servers import ServerRegistry, Endpoint
+from steps import run_steps
+
+
+def test_breaker_trips_on_session_error_or_threshold():
+    breaker = CircuitBreaker("dev-A", RetryPolicy(failure_threshold=3))
+    assert breaker.record_failure(SESSION)  # 会话失效立即熔断
+    breaker.record_success()
+    assert not breaker.record_failure(TRANSIENT)
+    assert not breaker.record_failure(TRANSIENT)
+    assert breaker.record_failure(TRANSIENT)
+
+
+def test_breaker_parks_then_closes_after_park_period():
+    breaker = CircuitBreaker("dev-A", RetryPolicy(max_recoveries=2, park_seconds=0.05))
+    breaker.record_recovery(False)
+    assert breaker.state == "open"
+    breaker.record_recovery(False)
+    with pytest.raises(DeviceParked) as parked:
+        breaker.ensure_can_recover()
+    assert parked.value.retry_after == 0.05
+    with pytest.raises(DeviceParked):
+        breaker.check()
+    assert breaker.state == "parked"
+    time.sleep(0.06)
+    breaker.check()
+    assert breaker.state == "closed"
+
+
+def test_iter_retry_recovers_session_and_closes_breaker():
+    breaker = CircuitBreaker("dev-A", RetryPolicy(failure_threshold=2, base_delay=0.0))
+    attempts = []
+    recoveries = []
+
+    def step():
+        attempts.append(len(recoveries))
+        if not recoveries:
+            raise ConnectionError("connection reset")
+        yield 0
+        return "done"
+
+    assert run_steps(iter_retry(step, breaker, lambda: recoveries.append(True)), sleep=lambda seconds: None) == "done"
+    assert attempts == [0, 0, 1]  # 连续失败两次后熔断，重建会话后成功
+    assert breaker.state == "closed" and breaker.stats["recoveries"] == 1
+
+
+def test_parked_device_resumes_after_park_period():
+    starts = []
+
+    def factory(flow, device_config, **options):
+        starts.append(time.monotonic())
+        if len(starts) == 1:
+            raise DeviceParked("parked", retry_after=0.1)
+        yield 0
+        return "done"
+
+    async def run_briefly(orchestrator):
+        task = asyncio.ensure_future(orchestrator.run())
+        while not (len(orchestrator.results) == 2 and orchestrator.results[1].finished_at) and not task.done():
+            await asyncio.sleep(0.02)
+        orchestrator.cancel()
+        return await task
+
+    orchestrator = Orchestrator(threads=1, keep_running=True, pause_scale=0.0)
+    orchestrator.submit({"udid": "dev-A"}, FlowJob("swip", factory))
+    results = asyncio.run(asyncio.wait_for(run_briefly(orchestrator), 5))
+    assert [(result.ok, result.value) for result in results] == [(False, None), (True, "done")]
+    assert starts[1] - starts[0] >= 0.1
+
+
+def test_failover_skips_endpoint_that_fails_health_check(fake_server):
+    alive, dead = fake_server(), fake_server()
+    dead.stop()
+    registry = ServerRegistry([Endpoint(dead.url), Endpoint(alive.url)], health_timeout=1)
+    registry._placement["dev-A"] = dead.url  # 模拟设备分配在随后宕机的服务上
+    registry.endpoints[dead.url].assigned.add("dev-A")
+    assert registry.failover("dev-A") == alive.url
+    assert not registry.endpoints[dead.url].healthy
+
+
+def test_failing_endpoint_stays_open_during_cooldown(fake_server):
+    server = fake_server()
+    registry = ServerRegistry([Endpoint(server.url)], failure_threshold=2, cooldown=60)
+    registry.record(server.url, 0.01, ok=False)
+    registry.record(server.url, 0.01, ok=False)
+    registry.check_health()  # /status 正常，但命令仍在失败
+    assert not registry.endpoints[server.url].healthy
+    registry.endpoints[server.url].open_until = 0.0  # 隔离期结束
+    registry.check_health()
+    assert registry.endpoints[server.url].healthy
+
+
+def test_recovery_moves_session_to_healthy_endpoint(fake_server, make_config, automator_module):
+    """设备所在的服务宕机后，重建会话时换到其他健康的服务，流程继续执行"""
+    first, second = fake_server(latency=0.002), fake_server(latency=0.002)
+    config = make_config({"wait_poll_interval": 0.01, "resilience": {"base_delay": 0.01, "max_delay": 0.05}})
+    registry = ServerRegistry([Endpoint(first.url), Endpoint(second.url)], health_timeout=1)
+    automator_module.placement = registry
+    automator_module.session_pool.command_listener = registry.record
+    source = registry.place("dev-B")
+    old, new = (first, second) if source == first.url else (second, first)
+
+    def factory(flow, device_config, **options):
+        return automator_module.iter_flow(flow, device_config, config=config, **options)
+
+    def crash():
+        deadline = time.monotonic() + 10
+        while old.count() < 40 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        old.stop()
+
+    orchestrator = Orchestrator(threads=2, placement=registry, rebalance_interval=3600, pause_scale=0.0)
+    orchestrator.submit({"udid": "dev-B", "device_name": "device1"}, FlowJob("swip", factory, max_iterations=200))
+    crasher = threading.Thread(target=crash)
+    crasher.start()
+    results = asyncio.run(orchestrator.run())
+    crasher.join()
+
+    assert [result.ok for result in results] == [True]
+    assert registry.place("dev-B") == new.url
+    assert new.count("POST", "^/session$") == 1 and new.count() > 100
@@ -0,0 +1,43 @@
+import json
+from screen_profile import DEFAULT_PROFILE, ScreenProfile, ScreenProfileCache
+from session_pool import SessionPool
+
+
+def test_point_scales_ratios_to_pixels():
+    profile = ScreenProfile("dev-A", 720, 1600)
+    assert profile.point(0.5, 0.25) == (360, 400)
+    assert DEFAULT_PROFILE.point(0.5, 0.5) == (540, 1200)
+
+
+def test_anchor_point_inside_probed_bounds():
+    profile = ScreenProfile("dev-A", 1080, 2400, anchors={"search_bar": [40, 120, 1040, 220]})
+    assert profile.anchor_point("search_bar", 0.5, 0.5) == (540, 170)
+    assert profile.anchor_point("missing", 0.5, 0.5) is None
+
+
+def test_cache_probes_once_and_persists(fake_server, make_config, tmp_path):
+    server = fake_server(screen_size=(720, 1600), density=320)
+    path = str(tmp_path / "profiles.json")
+    pool = SessionPool()
+    driver = pool.acquire(make_config({}), {"udid": "dev-A", "server_url": server.url})
+
+    profile = ScreenProfileCache(path).get(driver, "dev-A")
+    assert (profile.width, profile.height, profile.density) == (720, 1600, 320)
+    assert profile.anchors == {"search_bar": [40, 120, 1040, 220]}
+    commands = server.count()
+
+    reloaded = ScreenProfileCache(path).get(driver, "dev-A")  # 新的缓存对象从文件加载，不再探测
+    assert server.count() == commands
+    assert (reloaded.width, reloaded.height, reloaded.anchors) == (720, 1600, profile.anchors)
+    pool.close_all()
+
+
+def test_invalidate_and_corrupt_file(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps({"dev-A": {"width": 720, "height": 1600}}), encoding="utf-8")
+    cache = ScreenProfileCache(str(path))
+    cache.invalidate("dev-A")
+    assert json.loads(path.read_text(encoding="utf-8")) == {}
+
+    path.write_text("{broken", encoding="utf-8")
+    assert ScreenProfileCache(str(path)).get(None, "dev-B") is DEFAULT_PROFILE  # 损坏的缓存被忽略，探测失败时使用默认屏幕
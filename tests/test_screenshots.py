@@ -0,0 +1,60 @@
+import base64
+import os
+from screenshots import ScreenshotPipeline
+from session_pool import SessionPool
+
+
+class Driver:
+    """按顺序返回给定内容的截图"""
+
+    def __init__(self, *images):
+        self.images = list(images)
+
+    def get_screenshot_as_base64(self):
+        return base64.b64encode(self.images.pop(0)).decode("ascii")
+
+
+def saved(root, udid="dev-A"):
+    return sorted(name for _, _, names in os.walk(os.path.join(root, udid)) for name in names)
+
+
+def test_identical_screenshots_are_saved_once(tmp_path):
+    pipeline = ScreenshotPipeline(root=str(tmp_path), min_interval=0)
+    driver = Driver(b"same", b"same", b"other")
+    for identifier in ("a", "b", "c"):
+        assert pipeline.capture(driver, "dev-A", identifier)
+    pipeline.close()
+    assert pipeline.stats["written"] == 2 and pipeline.stats["duplicates"] == 1
+    assert len(saved(str(tmp_path))) == 2
+
+
+def test_retention_keeps_newest_files(tmp_path):
+    pipeline = ScreenshotPipeline(root=str(tmp_path), min_interval=0, retention=3)
+    driver = Driver(*[b"image-%d" % i for i in range(5)])
+    for i in range(5):
+        pipeline.capture(driver, "dev-A", "step{}".format(i))
+    pipeline.close()
+    assert [name.split("_")[1] for name in saved(str(tmp_path))] == ["step2", "step3", "step4"]
+
+
+def test_same_identifier_is_rate_limited(tmp_path):
+    pipeline = ScreenshotPipeline(root=str(tmp_path), min_interval=30)
+    driver = Driver(b"first", b"second")
+    assert pipeline.capture(driver, "dev-A", "error")
+    assert not pipeline.capture(driver, "dev-A", "error")
+    assert pipeline.capture(driver, "dev-B", "error")  # 按设备分别限流
+    pipeline.close()
+    assert pipeline.stats["rate_limited"] == 1 and pipeline.stats["written"] == 2
+
+
+def test_capture_from_fake_server(fake_server, make_config, tmp_path):
+    server = fake_server()
+    pool = SessionPool()
+    driver = pool.acquire(make_config({}), {"udid": "dev-A", "server_url": server.url})
+    pipeline = ScreenshotPipeline(root=str(tmp_path), min_interval=0)
+    assert pipeline.capture(driver, "dev-A", "WebDriverWait")
+    pipeline.close()
+    pool.close_all()
+    [name] = saved(str(tmp_path))
+    assert name.endswith(".png") and "_WebDriverWait_" in name
+    assert server.count("GET", "/screenshot$") == 1
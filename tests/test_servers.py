@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+from orchestrator import Orchestrator, FlowJob
+from servers import ServerRegistry, Endpoint
+
+
+def test_place_prefers_least_loaded_endpoint():
+    registry = ServerRegistry([Endpoint("http://a:4723"), Endpoint("http://b:4723", weight=2)])
+    placed = [registry.place("dev-{}".format(i)) for i in range(3)]
+    assert placed.count("http://b:4723") == 2
+    assert registry.place("dev-0") == placed[0]  # 已分配的设备保持不变
+
+
+def test_rebalance_moves_devices_off_unhealthy_endpoint():
+    registry = ServerRegistry([Endpoint("http://a:4723"), Endpoint("http://b:4723")], failure_threshold=2)
+    source = registry.place("dev-A")
+    registry.record(source, 0.01, ok=False)
+    registry.record(source, 0.01, ok=False)
+    moves = registry.rebalance()
+    assert [(udid, old) for udid, old, _ in moves] == [("dev-A", source)]
+    assert registry.place("dev-A") == moves[0][2] != source
+
+
+def test_running_flow_moves_to_new_endpoint(fake_server, make_config, automator_module):
+    """重新平衡后，正在执行的流程在步骤边界把会话迁到新的服务并继续执行"""
+    first, second = fake_server(latency=0.002), fake_server(latency=0.002)
+    config = make_config({"wait_poll_interval": 0.01})
+    registry = ServerRegistry([Endpoint(first.url), Endpoint(second.url)])
+    automator_module.placement = registry
+    automator_module.session_pool.command_listener = registry.record
+    source = registry.place("dev-A")
+    old, new = (first, second) if source == first.url else (second, first)
+
+    def factory(flow, device_config, **options):
+        return automator_module.iter_flow(flow, device_config, config=config, **options)
+
+    def move():
+        deadline = time.monotonic() + 10
+        while old.count() < 40 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        registry.endpoints[source].healthy = False
+        moves.extend(registry.rebalance())
+
+    moves = []
+    orchestrator = Orchestrator(threads=2, placement=registry, rebalance_interval=3600, pause_scale=0.0)
+    orchestrator.submit({"udid": "dev-A", "device_name": "device1"}, FlowJob("swip", factory, max_iterations=300))
+    mover = threading.Thread(target=move)
+    mover.start()
+    results = asyncio.run(orchestrator.run())
+    mover.join()
+
+    assert moves == [("dev-A", old.url, new.url)]
+    assert [result.ok for result in results] == [True]
+    assert new.count("POST", "^/session$") == 1 and new.count() > 100  # 流程的后半段在新服务上执行
+    assert not old.sessions  # 旧服务上的会话已关闭
@@ -0,0 +1,59 @@
+from session_pool import SessionPool
+
+DEVICE = {"udid": "dev-A", "device_name": "device1"}
+
+
+def device_on(server):
+    return dict(DEVICE, server_url=server.url)
+
+
+def test_released_session_is_reused(fake_server, make_config):
+    server = fake_server()
+    pool, config = SessionPool(), make_config({})
+    driver = pool.acquire(config, device_on(server))
+    pool.release(driver)
+    assert pool.acquire(config, device_on(server)) is driver
+    assert pool.stats == {"created": 1, "reused": 1, "recreated": 0}
+    assert server.count("POST", "^/session$") == 1
+    pool.close_all()
+
+
+def test_stale_session_is_recreated(fake_server, make_config):
+    server = fake_server()
+    pool, config = SessionPool(), make_config({})
+    driver = pool.acquire(config, device_on(server))
+    pool.release(driver)
+    server.kill_session(driver.session_id)  # 服务端回收了空闲会话
+    assert pool.acquire(config, device_on(server)) is not driver
+    assert pool.stats["recreated"] == 1
+    pool.close_all()
+
+
+def test_evict_closes_idle_session_and_defers_in_use_session(fake_server, make_config):
+    server = fake_server()
+    pool, config = SessionPool(), make_config({})
+    pool.release(pool.acquire(config, device_on(server)))
+    pool.evict("dev-A")
+    assert not server.sessions
+
+    driver = pool.acquire(config, device_on(server))
+    pool.evict("dev-A")
+    assert server.sessions  # 使用中的会话在归还时才关闭
+    pool.release(driver)
+    assert not server.sessions
+    assert pool.close_all() == {"closed": [], "abandoned": []}
+
+
+def test_replug_replaces_session_still_held_by_cancelled_flow(fake_server, make_config):
+    """设备断开后很快重新接入：新流程拿到新会话，旧流程归还的会话随即关闭"""
+    server = fake_server()
+    pool, config = SessionPool(), make_config({})
+    old = pool.acquire(config, device_on(server))
+    pool.evict("dev-A")
+    new = pool.acquire(config, device_on(server))
+    assert new is not old
+    pool.release(old)
+    assert list(server.sessions) == [new.session_id]
+    pool.release(new)
+    assert pool.acquire(config, device_on(server)) is new
+    pool.close_all()
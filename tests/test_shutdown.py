@@ -0,0 +1,84 @@
+import asyncio
+import threading
+import time
+import pytest
+from orchestrator import Orchestrator, FlowJob
+from steps import CancelToken, Cancelled, run_steps
+
+
+def test_cancel_interrupts_pause_and_runs_finally():
+    token = CancelToken()
+    events = []
+
+    def flow():
+        try:
+            events.append("step 1")
+            yield 10  # 取消时正在停顿
+            events.append("step 2")
+        finally:
+            events.append("released")
+
+    threading.Timer(0.05, token.cancel, args=("signal 15",)).start()
+    start = time.monotonic()
+    with pytest.raises(Cancelled, match="signal 15"):
+        run_steps(flow(), token=token)
+    assert time.monotonic() - start < 1
+    assert events == ["step 1", "released"]
+
+
+def test_orchestrator_stops_at_step_boundary_and_releases_sessions():
+    token = CancelToken()
+    released = []
+    steps_done = []
+
+    def flow(name, device_config):
+        try:
+            while True:
+                time.sleep(0.02)  # 正在执行的步骤不被打断
+                steps_done.append(device_config["udid"])
+                yield 0.01
+        finally:
+            released.append(device_config["udid"])
+
+    orchestrator = Orchestrator(threads=2, pause_scale=1.0, token=token, shutdown_timeout=2)
+    for udid in ("dev-A", "dev-B"):
+        orchestrator.submit({"udid": udid}, FlowJob("loop", flow))
+    threading.Timer(0.2, token.cancel).start()
+    start = time.monotonic()
+    results = asyncio.run(orchestrator.run())
+    assert time.monotonic() - start < 2
+    assert sorted(released) == ["dev-A", "dev-B"]
+    assert [result.error for result in results] == ["cancelled", "cancelled"]
+    assert orchestrator.stats["cancelled"] == 2
+
+
+def test_orchestrator_abandons_step_stuck_past_shutdown_timeout():
+    token = CancelToken()
+    blocker = threading.Event()
+
+    def stuck(name, device_config):
+        yield 0
+        blocker.wait(5)  # 卡在请求中的步骤
+        yield 0
+
+    orchestrator = Orchestrator(threads=1, token=token, shutdown_timeout=0.2)
+    orchestrator.submit({"udid": "dev-A"}, FlowJob("stuck", stuck))
+    threading.Timer(0.1, token.cancel).start()
+    start = time.monotonic()
+    asyncio.run(orchestrator.run())
+    assert time.monotonic() - start < 2
+    blocker.set()
+
+
+def test_close_sessions_reports_abandoned_sessions(fake_server, make_config, automator_module):
+    fast, slow = fake_server(), fake_server()
+    config = make_config({})
+    pool = automator_module.session_pool
+    for udid, server in (("dev-A", fast), ("dev-B", slow)):
+        pool.release(pool.acquire(config, {"udid": udid, "server_url": server.url}))
+    slow.latency = 3  # 结束会话的请求超过关闭期限
+    start = time.monotonic()
+    summary = automator_module.close_sessions(timeout=0.5)
+    assert time.monotonic() - start < 2
+    assert summary == {"closed": ["dev-A"], "abandoned": ["dev-B"]}
+    assert not fast.sessions
@@ -0,0 +1,52 @@
+import os
+import time
+import pytest
+import supervisor
+from supervisor import Supervisor
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="fake workers are passed to forked processes")
+
+
+def fake_worker(starts_path, crashes):
+    """代替 _worker_main 的工作进程：记录启动时间，前 crashes 次启动时崩溃，之后上报一个结果后正常退出"""
+
+    def main(conn, index, settings_path, devices, options):
+        with open(starts_path, "a") as f:
+            f.write("{}\n".format(time.monotonic()))
+        with open(starts_path) as f:
+            started = len(f.readlines())
+        conn.send(("ready", {"pid": os.getpid()}))
+        if started <= crashes:
+            os._exit(3)
+        for device_config, flow, _ in devices:
+            conn.send(("result", {"udid": device_config["udid"], "flow": flow, "ok": True, "value": started}))
+        conn.close()
+    return main
+
+
+def run_supervisor(monkeypatch, tmp_path, crashes, **options):
+    starts_path = str(tmp_path / "starts")
+    monkeypatch.setattr(supervisor, "_worker_main", fake_worker(starts_path, crashes))
+    instance = Supervisor(str(tmp_path / "settings.json"), start_method="fork", keep_running=False, **options)
+    instance.add({"udid": "dev-A"}, "swip")
+    results = instance.run()
+    with open(starts_path) as f:
+        starts = [float(line) for line in f]
+    return instance, results, starts
+
+
+def test_crashed_worker_restarts_with_backoff(monkeypatch, tmp_path):
+    instance, results, starts = run_supervisor(monkeypatch, tmp_path, crashes=2, restart_delay=0.2, max_restarts=5)
+    assert len(starts) == 3
+    assert starts[1] - starts[0] >= 0.2
+    assert starts[2] - starts[1] >= 0.4  # 连续第二次崩溃后退避时间翻倍
+    assert [result["value"] for result in results] == [3]
+    assert instance.result_stats == {"ok": 1, "failed": 0}
+    assert [worker["restarts"] for worker in instance.stats()] == [2]
+
+
+def test_worker_crashing_past_max_restarts_gives_up_devices(monkeypatch, tmp_path):
+    instance, results, starts = run_supervisor(monkeypatch, tmp_path, crashes=10, restart_delay=0.05, max_restarts=2)
+    assert len(starts) == 3  # 首次启动加两次重启
+    assert results == []
+    assert instance.workers == []
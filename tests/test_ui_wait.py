@@ -0,0 +1,87 @@
+import random
+import pytest
+from steps import CancelToken, Cancelled
+from ui_wait import UIWaiter
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Driver:
+    """依次返回给定的页面源，之后一直返回最后一个"""
+
+    def __init__(self, *sources):
+        self.sources = list(sources)
+
+    @property
+    def page_source(self):
+        return self.sources.pop(0) if len(self.sources) > 1 else self.sources[0]
+
+
+def drive(steps, clock):
+    """按 yield 的停顿推进假时钟，返回 (返回值, 停顿列表)"""
+    pauses = []
+    try:
+        while True:
+            pause = next(steps)
+            pauses.append(pause)
+            clock.now += pause
+    except StopIteration as e:
+        return e.value, pauses
+
+
+def waiter(driver, **options):
+    clock = Clock()
+    options.setdefault("rng", random.Random(1))
+    return UIWaiter(driver, poll_interval=0.25, clock=clock, **options), clock
+
+
+def test_fixed_wait_uses_budget_between_min_and_max():
+    ui, clock = waiter(Driver("<a/>"))
+    met, pauses = drive(ui.iter_wait("site", 3, 4), clock)
+    assert not met and len(pauses) == 1 and 3 <= pauses[0] <= 4
+
+
+def test_wait_returns_early_with_jitter_once_page_is_idle():
+    ui, clock = waiter(Driver("<a/>", "<b/>", "<c/>"), jitter=(0.1, 0.5), record_savings=True)
+    met, pauses = drive(ui.iter_wait("detail", 3, 4, until=ui.page_idle()), clock)
+    assert met
+    assert pauses[:4] == [0.25] * 4  # 页面变化两次后再稳定两次轮询
+    assert 0.1 <= pauses[-1] <= 0.5
+    assert clock.now < 3
+    assert ui.report()["detail"]["saved"] > 1.5
+
+
+def test_wait_never_exceeds_budget_when_page_keeps_changing():
+    sources = ["<p{}/>".format(i) for i in range(100)]
+    ui, clock = waiter(Driver(*sources))
+    waited = []
+    ui.listener = lambda site, seconds: waited.append(seconds)
+    met, pauses = drive(ui.iter_wait("feed", 1, 1, until=ui.page_idle()), clock)
+    assert not met and clock.now == pytest.approx(1.0)
+    assert waited == [pytest.approx(1.0)]
+
+
+def test_condition_errors_count_as_not_ready():
+    ui, clock = waiter(Driver("<a/>"))
+
+    def flaky(driver):
+        raise RuntimeError("stale")
+
+    met, _ = drive(ui.iter_until(flaky, 0.5), clock)
+    assert not met and clock.now == pytest.approx(0.5)
+
+
+def test_wait_stops_when_cancelled():
+    token = CancelToken()
+    ui, clock = waiter(Driver("<a/>"), token=token)
+    steps = ui.iter_until(lambda driver: False, 10)
+    next(steps)
+    token.cancel("test")
+    with pytest.raises(Cancelled):
+        next(steps)
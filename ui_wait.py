@@ -0,0 +1,103 @@
+import random
+import threading
+import time
+import zlib
+from logger import Logger
+from steps import run_steps
+
+logger = Logger("UIWait")
+
+
+class UIWaiter:
+    """事件驱动的界面等待：目标元素出现或页面稳定后立即返回，再叠加少量拟人抖动"""
+
+    def __init__(self, driver, poll_interval=0.25, jitter=(0.1, 0.5), record_savings=False, listener=None, token=None,
+                 rng=random, clock=time.monotonic):
+        self.driver = driver
+        self.poll_interval = poll_interval
+        self.jitter = jitter
+        self.record_savings = record_savings
+        self.listener = listener  # listener(site, waited)，每次等待结束后回调
+        self.token = token  # CancelToken，每次轮询前检查
+        self.rng = rng  # 等待时长和抖动的随机数发生器，录制和回放时按设备替换
+        self.clock = clock  # 计算超时的时钟，回放时返回录制的读数
+        self.savings = {}  # 调用点 -> {"calls", "budget", "waited"}
+        self._lock = threading.Lock()
+
+    def element_present(self, by, value):
+        """条件：页面上存在匹配的元素"""
+        def condition(driver):
+            return len(driver.find_elements(by, value)) > 0
+        return condition
+
+    def page_idle(self, stable_polls=2):
+        """条件：连续 stable_polls 次轮询页面源的指纹都没有变化"""
+        state = {"fingerprint": None, "stable": 0}
+
+        def condition(driver):
+            fingerprint = zlib.crc32(driver.page_source.encode("utf-8"))
+            if fingerprint == state["fingerprint"]:
+                state["stable"] += 1
+            else:
+                state["fingerprint"] = fingerprint
+                state["stable"] = 0
+            return state["stable"] >= stable_polls
+        return condition
+
+    def iter_until(self, until, timeout):
+        """轮询直到条件满足或超时，轮询间隔以停顿的形式 yield 出去；返回条件是否满足"""
+        deadline = self.clock() + timeout
+        while True:
+            if self.token is not None:
+                self.token.raise_if_cancelled()
+            try:
+                if until(self.driver):
+                    return True
+            except Exception:
+                pass
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return False
+            yield min(self.poll_interval, remaining)
+
+    def iter_wait(self, site, min_delay, max_delay, until=None):
+        """等待界面就绪，最长不超过原固定等待时长；返回条件是否满足"""
+        budget = self.rng.uniform(min_delay, max_delay)  # 原来固定等待的时长，作为等待上限
+        start = self.clock()
+        met = False
+        if until is None:
+            yield budget
+        else:
+            met = yield from self.iter_until(until, budget - self.poll_interval)
+            remaining = start + budget - self.clock()
+            if met:
+                # 条件满足后叠加少量随机抖动，避免节奏过于机械
+                yield max(0, min(self.rng.uniform(*self.jitter), remaining))
+            else:
+                yield max(0, remaining)
+        waited = self.clock() - start
+        if self.record_savings:
+            self._record(site, budget, waited)
+        if self.listener is not None:
+            self.listener(site, waited)
+        return met
+
+    def wait(self, site, min_delay, max_delay, until=None):
+        """同步版本的 iter_wait"""
+        return run_steps(self.iter_wait(site, min_delay, max_delay, until))
+
+    def _record(self, site, budget, waited):
+        with self._lock:
+            entry = self.savings.setdefault(site, {"calls": 0, "budget": 0.0, "waited": 0.0})
+            entry["calls"] += 1
+            entry["budget"] += budget
+            entry["waited"] += waited
+
+    def report(self):
+        """按调用点汇总节省的等待时间"""
+        with self._lock:
+            items = sorted(self.savings.items())
+        for site, entry in items:
+            logger.debug("Wait savings at %s: calls=%s waited=%.2fs saved=%.2fs",
+                         site, entry["calls"], entry["waited"], entry["budget"] - entry["waited"])
+        return {site: dict(entry, saved=entry["budget"] - entry["waited"]) for site, entry in items}